@@ -0,0 +1,510 @@
+import argparse
+import configparser
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'client'))
+
+from client import Cliente  # noqa: E402
+
+# client.py configura el logging en DEBUG; durante la prueba solo interesan los avisos
+logging.getLogger().setLevel(logging.WARNING)
+
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server', 'server.py')
+DEFAULT_CONFIG = os.path.join(ROOT, 'config', 'database.ini')
+
+# Cada escenario define la mezcla de operaciones (pesos relativos) y sus
+# valores por defecto; todo se puede cambiar desde la línea de comandos.
+SCENARIOS = {
+    'mixed': {
+        'mix': {'SELECT': 70, 'INSERT': 10, 'UPDATE': 15, 'DELETE': 5},
+        'clients': 32, 'seed_rows': 2000
+    },
+    # Muchas conexiones cortas: handshake + una consulta + cierre
+    'connection_storm': {
+        'mix': {'CONNECT': 100},
+        'clients': 200, 'seed_rows': 500
+    },
+    # Resultados grandes: tabla completa en streaming y páginas de 1000 filas
+    'large_results': {
+        'mix': {'SCAN': 50, 'PAGE': 50},
+        'clients': 8, 'seed_rows': 20000
+    },
+    # Escrituras concentradas en unas pocas filas
+    'write_contention': {
+        'mix': {'UPDATE': 80, 'INSERT': 20},
+        'clients': 32, 'seed_rows': 1000, 'hot_rows': 10
+    }
+}
+
+
+def parse_mix(text):
+    # "SELECT=70,INSERT=10" -> {'SELECT': 70, 'INSERT': 10}
+    mix = {}
+    for part in text.split(','):
+        operation, _, weight = part.partition('=')
+        mix[operation.strip().upper()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'count': count,
+        'errors': errors,
+        'throughput': round(count / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / count) if count else None,
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1]) if count else None
+        }
+    }
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    # Arranca server.py en un proceso aparte con una configuración temporal
+    # que selecciona el backend pedido.
+    def __init__(self, backend, mode, port, sqlite_path=None, base_config=DEFAULT_CONFIG,
+                 extra_args=(), log_path=None):
+        self.backend = backend
+        self.mode = mode
+        self.port = port
+        self.sqlite_path = sqlite_path
+        self.base_config = base_config
+        self.extra_args = list(extra_args)
+        self.log_path = log_path
+        self.process = None
+        self._log = None
+        self._workdir = None
+
+    def _write_config(self):
+        config = configparser.ConfigParser()
+        config.read(self.base_config)
+        if not config.has_section('database'):
+            config.add_section('database')
+        config['database']['backend'] = self.backend
+        if self.backend == 'sqlite':
+            if not config.has_section('sqlite'):
+                config.add_section('sqlite')
+            config['sqlite']['path'] = self.sqlite_path or os.path.join(self._workdir.name, 'rh.db')
+            config['sqlite']['reset'] = 'true'
+        path = os.path.join(self._workdir.name, 'database.ini')
+        with open(path, 'w') as file:
+            config.write(file)
+        return path
+
+    def start(self, timeout=30.0):
+        self._workdir = tempfile.TemporaryDirectory(prefix='rh-bench-')
+        config_path = self._write_config()
+        self.log_path = self.log_path or os.path.join(self._workdir.name, 'server.log')
+        self._log = open(self.log_path, 'w')
+        command = [sys.executable, SERVER_SCRIPT, '--host', 'localhost', '--port', str(self.port),
+                   '--mode', self.mode, '--config', config_path, '--log-level', 'WARNING',
+                   *self.extra_args]
+        self.process = subprocess.Popen(command, stdout=self._log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"El servidor terminó al arrancar, ver {self.log_path}")
+            try:
+                socket.create_connection(('localhost', self.port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"El servidor no aceptó conexiones en {timeout} segundos")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log:
+            self._log.close()
+            self._log = None
+        if self._workdir:
+            self._workdir.cleanup()
+            self._workdir = None
+
+
+class Workload:
+    # Genera las peticiones de cada operación. Los ids existentes se eligen al
+    # azar entre los empleados sembrados y los insertados durante la prueba.
+    def __init__(self, run_id, departamento_id=1, cargo_id=1, hot_rows=None, page_size=1000,
+                 chunk_size=500):
+        self.run_id = run_id
+        self.departamento_id = departamento_id
+        self.cargo_id = cargo_id
+        self.hot_rows = hot_rows
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.ids = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def new_employee(self):
+        with self._lock:
+            self._counter += 1
+            number = self._counter
+        return {
+            'primer_nombre': 'Bench',
+            'primer_apellido': f'Empleado{number}',
+            'email': f'bench-{self.run_id}-{number}@bench.local',
+            'celular': f'{self.run_id % 10000:04d}{number:09d}',
+            'fecha_contratacion': '2024-01-01',
+            'departamento_id': self.departamento_id,
+            'cargo_id': self.cargo_id,
+            'salario': {'salario_base': 1000000, 'bonificaciones': 0, 'deducciones': 0}
+        }
+
+    def add_ids(self, ids):
+        with self._lock:
+            self.ids.extend(ids)
+
+    def random_id(self, rng):
+        ids = self.ids
+        if self.hot_rows:
+            return ids[rng.randrange(min(self.hot_rows, len(ids)))]
+        return ids[rng.randrange(len(ids))]
+
+
+class BenchmarkRunner:
+    def __init__(self, host, port, mix, clients, duration, warmup=1.0, pipeline=1,
+                 encoding='json', workload=None, seed=None):
+        self.host = host
+        self.port = port
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.clients = clients
+        self.duration = duration
+        self.warmup = warmup
+        self.pipeline = max(1, pipeline)
+        self.encoding = encoding
+        self.workload = workload
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.latencies = {operation: [] for operation in self.operations}
+        self.errors = {operation: 0 for operation in self.operations}
+        self.rows_received = 0
+
+    def _client(self):
+        return Cliente(self.host, self.port, encoding=self.encoding)
+
+    def seed_rows(self, count, request_size=2000):
+        client = self._client()
+        try:
+            for start in range(0, count, request_size):
+                employees = [self.workload.new_employee()
+                             for _ in range(min(request_size, count - start))]
+                response = client.submit('BULK_INSERT', {'empleados': employees}).result()
+                if response.get('status') == 'error':
+                    raise RuntimeError(f"No se pudieron sembrar empleados: {response.get('message')}")
+                self.workload.add_ids([result['id'] for result in response['results']
+                                       if result['status'] == 'success'])
+        finally:
+            client.close()
+
+    def server_stats(self):
+        # Instantánea de las métricas internas del servidor (operación STATS)
+        client = self._client()
+        try:
+            response = client.submit('STATS', {}).result(timeout=10)
+            return response.get('data') if response.get('status') == 'success' else None
+        except Exception:
+            return None
+        finally:
+            client.close()
+
+    def _record(self, operation, started, ok, measuring_from):
+        elapsed = time.perf_counter() - started
+        if started < measuring_from:
+            return
+        with self._lock:
+            if ok:
+                self.latencies[operation].append(elapsed)
+            else:
+                self.errors[operation] += 1
+
+    def _request(self, operation, rng):
+        workload = self.workload
+        if operation == 'SELECT':
+            return 'SELECT', {'id': workload.random_id(rng)}
+        if operation == 'INSERT':
+            return 'INSERT', workload.new_employee()
+        if operation == 'UPDATE':
+            return 'UPDATE', {'id': workload.random_id(rng),
+                              'primer_nombre': f'Bench{rng.randrange(1000)}'}
+        if operation == 'DELETE':
+            return 'DELETE', {'id': workload.random_id(rng), 'motivo': 'benchmark'}
+        if operation == 'PAGE':
+            return 'SELECT', {'departamento_id': workload.departamento_id,
+                              'limit': workload.page_size}
+        raise ValueError(f"Operación desconocida: {operation}")
+
+    def _run_connect(self, rng, measuring_from):
+        started = time.perf_counter()
+        client = self._client()
+        try:
+            response = client.submit('SELECT', {'id': self.workload.random_id(rng)}).result()
+            ok = response.get('status') == 'success'
+        except Exception:
+            ok = False
+        finally:
+            client.close()
+        self._record('CONNECT', started, ok, measuring_from)
+
+    def _run_scan(self, client, measuring_from):
+        started = time.perf_counter()
+        try:
+            rows = sum(1 for _ in client.stream_select({}, self.workload.chunk_size))
+            ok = True
+        except Exception:
+            rows, ok = 0, False
+        self._record('SCAN', started, ok, measuring_from)
+        with self._lock:
+            self.rows_received += rows
+
+    def _worker(self, index, start_at, measuring_from, deadline):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        client = None
+        in_flight = threading.Semaphore(self.pipeline)
+
+        def done(operation, started, future):
+            try:
+                response = future.result()
+                ok = response.get('status') == 'success'
+                if ok and operation == 'INSERT':
+                    self.workload.add_ids([response['id']])
+                if ok and operation == 'PAGE':
+                    with self._lock:
+                        self.rows_received += len(response.get('data', []))
+            except Exception:
+                ok = False
+            in_flight.release()
+            self._record(operation, started, ok, measuring_from)
+
+        while time.perf_counter() < start_at:
+            time.sleep(0.001)
+        try:
+            while time.perf_counter() < deadline:
+                operation = rng.choices(self.operations, self.weights)[0]
+                if operation == 'CONNECT':
+                    self._run_connect(rng, measuring_from)
+                    continue
+
+                if client is None:
+                    started = time.perf_counter()
+                    try:
+                        client = self._client()
+                        client.connect()
+                    except OSError:
+                        client = None
+                        self._record(operation, started, False, measuring_from)
+                        time.sleep(0.01)
+                        continue
+                if operation == 'SCAN':
+                    self._run_scan(client, measuring_from)
+                    continue
+
+                in_flight.acquire()
+                started = time.perf_counter()
+                try:
+                    future = client.submit(*self._request(operation, rng))
+                except Exception:
+                    in_flight.release()
+                    self._record(operation, started, False, measuring_from)
+                    client.close()
+                    client = None
+                    continue
+                future.add_done_callback(
+                    lambda future, operation=operation, started=started: done(operation, started, future))
+
+            # Espera las respuestas pendientes antes de cerrar
+            for _ in range(self.pipeline):
+                in_flight.acquire()
+        finally:
+            if client is not None:
+                client.close()
+
+    def run(self):
+        start_at = time.perf_counter() + 0.2
+        measuring_from = start_at + self.warmup
+        deadline = measuring_from + self.duration
+        threads = [threading.Thread(target=self._worker, args=(index, start_at, measuring_from, deadline),
+                                    name=f'bench-client-{index}', daemon=True)
+                   for index in range(self.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = max(time.perf_counter(), deadline) - measuring_from
+
+        operations = {operation: summarize(self.latencies[operation], self.errors[operation],
+                                           self.duration)
+                      for operation in self.operations}
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        total = summarize(all_latencies, sum(self.errors.values()), self.duration)
+        total['rows_received'] = self.rows_received
+        total['wall_time'] = round(elapsed, 3)
+        return {'operations': operations, 'total': total}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(previous, current):
+    # Diferencias relativas de rendimiento y p99 respecto a una ejecución anterior
+    lines = []
+    for operation, stats in current['operations'].items():
+        before = previous.get('operations', {}).get(operation)
+        if not before or not before['throughput']:
+            continue
+        throughput = (stats['throughput'] - before['throughput']) / before['throughput'] * 100
+        line = f"{operation:>10}: throughput {throughput:+.1f}%"
+        if before['latency_ms']['p99'] and stats['latency_ms']['p99']:
+            p99 = (stats['latency_ms']['p99'] - before['latency_ms']['p99']) / before['latency_ms']['p99'] * 100
+            line += f", p99 {p99:+.1f}%"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def print_report(result):
+    print(f"\nEscenario {result['scenario']} ({result['config']['clients']} clientes, "
+          f"{result['config']['duration']} s, backend {result['config']['backend']})")
+    print(f"{'operación':>10} {'ops':>8} {'errores':>8} {'ops/s':>10} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(result['operations'].items()) + [('TOTAL', result['total'])]
+    for operation, stats in rows:
+        latency = stats['latency_ms']
+        print(f"{operation:>10} {stats['count']:>8} {stats['errors']:>8} {stats['throughput']:>10} "
+              f"{latency['p50'] or '-':>9} {latency['p95'] or '-':>9} {latency['p99'] or '-':>9}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generador de carga para el servidor de RRHH')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed')
+    parser.add_argument('--mix', default=None,
+                        help='Mezcla de operaciones, p. ej. SELECT=70,INSERT=10,UPDATE=15,DELETE=5 '
+                             '(también CONNECT, SCAN y PAGE)')
+    parser.add_argument('--clients', type=int, default=None, help='Conexiones simultáneas')
+    parser.add_argument('--duration', type=float, default=10.0, help='Segundos medidos')
+    parser.add_argument('--warmup', type=float, default=1.0, help='Segundos iniciales sin medir')
+    parser.add_argument('--pipeline', type=int, default=1,
+                        help='Peticiones en curso por conexión')
+    parser.add_argument('--encoding', choices=['json', 'binary'], default='json')
+    parser.add_argument('--seed-rows', type=int, default=None,
+                        help='Empleados que se insertan antes de medir')
+    parser.add_argument('--hot-rows', type=int, default=None,
+                        help='Limita UPDATE/SELECT/DELETE a los primeros N empleados')
+    parser.add_argument('--seed', type=int, default=None, help='Semilla aleatoria')
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--sqlite-path', default=None,
+                        help='Archivo SQLite (por defecto uno temporal; :memory: para memoria)')
+    parser.add_argument('--server-mode', choices=['threaded', 'async'], default='threaded')
+    parser.add_argument('--server-arg', action='append', default=[],
+                        help='Argumento adicional para server.py (repetible)')
+    parser.add_argument('--config', default=DEFAULT_CONFIG,
+                        help='Configuración base de la que se toman [mysql], [pool], etc.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--no-server', action='store_true',
+                        help='Usa un servidor ya iniciado en --host/--port')
+    parser.add_argument('--output', default=None, help='Archivo JSON con los resultados')
+    parser.add_argument('--compare', default=None, help='Resultado JSON anterior para comparar')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenario = SCENARIOS[args.scenario]
+    mix = parse_mix(args.mix) if args.mix else scenario['mix']
+    clients = args.clients or scenario['clients']
+    seed_rows = scenario['seed_rows'] if args.seed_rows is None else args.seed_rows
+    hot_rows = args.hot_rows or scenario.get('hot_rows')
+    port = args.port or (33056 if args.no_server else free_port())
+
+    server = None
+    if not args.no_server:
+        server = ServerProcess(args.backend, args.server_mode, port, sqlite_path=args.sqlite_path,
+                               base_config=args.config, extra_args=args.server_arg)
+        server.start()
+
+    try:
+        workload = Workload(run_id=random.randrange(1, 10 ** 6), hot_rows=hot_rows)
+        runner = BenchmarkRunner(args.host, port, mix, clients, args.duration, args.warmup,
+                                 args.pipeline, args.encoding, workload, args.seed)
+        runner.seed_rows(max(seed_rows, 1))
+        measurements = runner.run()
+        measurements['server_stats'] = runner.server_stats()
+    finally:
+        if server:
+            server.stop()
+
+    result = {
+        'scenario': args.scenario,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'backend': args.backend if not args.no_server else None,
+            'server_mode': args.server_mode if not args.no_server else None,
+            'mix': mix, 'clients': clients, 'duration': args.duration, 'warmup': args.warmup,
+            'pipeline': args.pipeline, 'encoding': args.encoding, 'seed_rows': seed_rows,
+            'hot_rows': hot_rows
+        },
+        **measurements
+    }
+
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            print("\nComparación con " + args.compare)
+            print(compare(json.load(file), result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, time as dt_time
+from itertools import islice
+from client import Cliente, iter_employee_records, SALARY_COLUMNS
+
+EXPORT_FIELDS = ('id', 'primer_nombre', 'segundo_nombre', 'primer_apellido', 'segundo_apellido',
+                 'email', 'celular', 'fecha_contratacion', 'estado', 'departamento_id',
+                 'cargo_id') + SALARY_COLUMNS
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PIPELINE = 4
+DEFAULT_CHUNK_SIZE = 1000
+PROGRESS_INTERVAL = 2.0
+ERRORS_SHOWN = 10
+
+
+class Progress:
+    # Informa por stderr cada pocos segundos de los registros procesados
+    def __init__(self, label, interval=PROGRESS_INTERVAL, stream=sys.stderr):
+        self.label = label
+        self.interval = interval
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.last = self.started
+
+    def update(self, count, extra=''):
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self._print(count, now, extra)
+
+    def finish(self, count, extra=''):
+        return self._print(count, time.perf_counter(), extra)
+
+    def _print(self, count, now, extra):
+        elapsed = now - self.started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"{self.label}: {count} registros en {elapsed:.1f} s ({rate:.0f}/s){extra}",
+              file=self.stream)
+        return elapsed
+
+
+class Checkpoint:
+    # Guarda cuántos registros del archivo están confirmados por el servidor
+    # para reanudar la importación después de un fallo. Solo vale para el
+    # mismo archivo (ruta, tamaño y fecha de modificación). Con path=None
+    # solo lleva la cuenta, sin guardarla.
+    def __init__(self, path, source):
+        self.path = path
+        stat = os.stat(source)
+        self.source = {'source': os.path.abspath(source), 'size': stat.st_size,
+                       'mtime': stat.st_mtime}
+        self.done = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+        if any(state.get(key) != value for key, value in self.source.items()):
+            raise ValueError(f"El checkpoint {self.path} corresponde a otro archivo o el archivo "
+                             f"cambió; use --restart para empezar de cero")
+        self.done = state['done']
+        self.succeeded = state['succeeded']
+        self.failed = state['failed']
+        return True
+
+    def save(self):
+        # Se escribe en un temporal y se renombra: un corte a mitad de la
+        # escritura nunca deja un checkpoint corrupto.
+        if self.path is None:
+            return
+        state = dict(self.source, done=self.done, succeeded=self.succeeded, failed=self.failed)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    # Lee el archivo por lotes y los envía como BULK_INSERT o BULK_UPDATE,
+    # con hasta `pipeline` lotes en curso por la misma conexión. Los lotes se
+    # confirman en orden, así que el checkpoint siempre marca un prefijo del
+    # archivo ya escrito. En memoria solo están los lotes en curso.
+    def __init__(self, client, path, operation='BULK_INSERT', batch_size=DEFAULT_BATCH_SIZE,
+                 pipeline=DEFAULT_PIPELINE, checkpoint=None, errors_path=None):
+        self.client = client
+        self.path = path
+        self.operation = operation
+        self.batch_size = batch_size
+        self.pipeline = pipeline
+        self.checkpoint = checkpoint or Checkpoint(None, path)
+        self.errors_path = errors_path
+        self.errors_file = None
+        self.errors_shown = 0
+        self.in_flight = deque()
+
+    def run(self):
+        checkpoint = self.checkpoint
+        records = iter_employee_records(self.path)
+        # Al reanudar se vuelven a leer (sin enviar) los registros ya confirmados
+        for _ in islice(records, checkpoint.done):
+            pass
+        if checkpoint.done:
+            print(f"Reanudando desde el registro {checkpoint.done + 1}", file=sys.stderr)
+
+        progress = Progress(f"Importación ({self.operation})")
+        if self.errors_path:
+            self.errors_file = open(self.errors_path, 'a' if checkpoint.done else 'w',
+                                    encoding='utf-8')
+        try:
+            position = checkpoint.done
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                self._send(position, batch)
+                position += len(batch)
+                while len(self.in_flight) >= self.pipeline:
+                    self._settle()
+                progress.update(checkpoint.done, f", {checkpoint.failed} con errores")
+            while self.in_flight:
+                self._settle()
+        finally:
+            if self.errors_file:
+                self.errors_file.close()
+        progress.finish(checkpoint.done, f", {checkpoint.failed} con errores")
+        return checkpoint
+
+    def _send(self, start, batch):
+        # Los registros ilegibles no se envían: se anotan como error local
+        valid = []
+        local_errors = []
+        for offset, record in enumerate(batch):
+            if isinstance(record, Exception):
+                local_errors.append((start + offset, str(record), None))
+            elif not isinstance(record, dict):
+                local_errors.append((start + offset, 'El registro no es un objeto', record))
+            else:
+                valid.append((start + offset, record))
+        future = None
+        if valid:
+            data = {'empleados': [record for _, record in valid], 'batch_size': self.batch_size}
+            future = self.client.submit(self.operation, data)
+        self.in_flight.append((start, len(batch), valid, local_errors, future))
+
+    def _settle(self):
+        start, count, valid, local_errors, future = self.in_flight.popleft()
+        succeeded = 0
+        errors = list(local_errors)
+        if future is not None:
+            response = future.result()
+            if 'results' not in response:
+                # El lote entero falló (conexión, servidor...): se detiene y el
+                # checkpoint queda en el último lote confirmado.
+                raise RuntimeError(f"Error importando los registros {start + 1}-{start + count}: "
+                                   f"{response.get('message', response)}")
+            for result in response['results']:
+                if result['status'] == 'success':
+                    succeeded += 1
+                else:
+                    index, record = valid[result['index']]
+                    errors.append((index, result.get('message'), record))
+
+        for index, message, record in sorted(errors, key=lambda error: error[0]):
+            self._report_error(index, message, record)
+        checkpoint = self.checkpoint
+        checkpoint.done = start + count
+        checkpoint.succeeded += succeeded
+        checkpoint.failed += len(errors)
+        checkpoint.save()
+
+    def _report_error(self, index, message, record):
+        if self.errors_shown < ERRORS_SHOWN:
+            print(f"  Registro {index + 1}: {message}", file=sys.stderr)
+            self.errors_shown += 1
+        if self.errors_file:
+            self.errors_file.write(json.dumps({'registro': index + 1, 'message': message,
+                                               'data': record}, default=_json_default) + '\n')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _export_record(employee):
+    # Mismo formato que acepta la importación: el salario como objeto anidado
+    record = {key: value for key, value in employee.items()
+              if key not in SALARY_COLUMNS and value is not None}
+    salario = {key: employee[key] for key in SALARY_COLUMNS if employee.get(key) is not None}
+    if salario:
+        record['salario'] = salario
+    return record
+
+
+def export_records(client, path, export_format=None, filters=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # El servidor lee con fetchmany y envía el resultado por bloques; aquí se
+    # escribe cada fila según llega. El archivo se escribe con otro nombre y
+    # se renombra al terminar, para no dejar exportaciones a medias.
+    export_format = export_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    data = dict(filters or {}, fields=list(EXPORT_FIELDS))
+    progress = Progress('Exportación')
+    temporary = path + '.part'
+    count = 0
+    try:
+        with open(temporary, 'w', encoding='utf-8', newline='') as file:
+            if export_format == 'csv':
+                writer = csv.DictWriter(file, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                def write(employee):
+                    file.write(json.dumps(_export_record(employee), default=_json_default,
+                                          ensure_ascii=False) + '\n')
+            for employee in client.stream_select(data, chunk_size):
+                write(employee)
+                count += 1
+                if count % chunk_size == 0:
+                    progress.update(count)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    progress.finish(count)
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Importa y exporta empleados y salarios en CSV o JSON Lines')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=33056)
+    parser.add_argument('--encoding', choices=['json', 'binary'], default='binary')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help='Carga empleados desde un archivo')
+    importer.add_argument('file', help='Archivo .csv, .jsonl o .json')
+    importer.add_argument('--update', action='store_true',
+                          help='Actualiza empleados existentes (por id) en lugar de insertarlos')
+    importer.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                          help='Registros por petición')
+    importer.add_argument('--pipeline', type=int, default=DEFAULT_PIPELINE,
+                          help='Lotes enviados sin esperar respuesta')
+    importer.add_argument('--checkpoint', default=None,
+                          help='Archivo de checkpoint (por defecto ARCHIVO.checkpoint)')
+    importer.add_argument('--restart', action='store_true',
+                          help='Ignora el checkpoint existente y empieza desde el principio')
+    importer.add_argument('--errors', default=None,
+                          help='Guarda los registros con error en este archivo JSON Lines')
+
+    exporter = commands.add_parser('export', help='Descarga los empleados a un archivo')
+    exporter.add_argument('file', help='Archivo de salida .csv o .jsonl')
+    exporter.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                          help='Por defecto según la extensión del archivo')
+    exporter.add_argument('--departamento-id', type=int, default=None)
+    exporter.add_argument('--estado', type=int, choices=[0, 1], default=None)
+    exporter.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                          help='Filas por bloque del streaming')
+    return parser.parse_args()
+
+
+def main():
+    # client.py configura el logging en DEBUG y registra cada respuesta completa
+    logging.getLogger().setLevel(logging.WARNING)
+    args = parse_args()
+    client = Cliente(args.host, args.port, encoding=args.encoding)
+    try:
+        if args.command == 'import':
+            checkpoint = Checkpoint(args.checkpoint or args.file + '.checkpoint', args.file)
+            if args.restart:
+                checkpoint.remove()
+            else:
+                checkpoint.load()
+            importer = Importer(client, args.file, 'BULK_UPDATE' if args.update else 'BULK_INSERT',
+                                args.batch_size, args.pipeline, checkpoint, args.errors)
+            importer.run()
+            print(f"{checkpoint.succeeded} registros correctos, {checkpoint.failed} con errores")
+            checkpoint.remove()
+            return 0 if not checkpoint.failed else 2
+        filters = {'departamento_id': args.departamento_id, 'estado': args.estado}
+        count = export_records(client, args.file, args.format,
+                               {key: value for key, value in filters.items() if value is not None},
+                               args.chunk_size)
+        print(f"{count} empleados exportados a {args.file}")
+        return 0
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
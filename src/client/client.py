@@ -1,10 +1,23 @@
+import csv
+import os
+import sys
+import queue
 import socket
 import json
 import logging
+import threading
+from concurrent.futures import Future
 from datetime import datetime, date
+# El protocolo se comparte con el servidor: vive en src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (SocketReader, ProtocolError, encode_message, MAGIC, CODECS,
+                      JSON_CODEC, PROTOCOL_VERSION, DEFAULT_CHUNK_SIZE,
+                      FRAME_HELLO, FRAME_MESSAGE, FRAME_CHUNK, FRAME_END)
 
 logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
+# Solo se usa en el modo antiguo (JSON sin framing), en el que las respuestas no
+# traen descriptor de tipos y hay que adivinar qué cadenas son fechas.
 class CustomJSONDecoder(json.JSONDecoder):
     def __init__(self, *args, **kwargs):
         json.JSONDecoder.__init__(self, object_hook=self.object_hook, *args, **kwargs)
@@ -21,24 +34,207 @@ class CustomJSONDecoder(json.JSONDecoder):
                         pass
         return obj
 
+SALARY_COLUMNS = ('salario_base', 'bonificaciones', 'deducciones')
+INTEGER_COLUMNS = ('id', 'departamento_id', 'cargo_id', 'estado') + SALARY_COLUMNS
+BULK_REQUEST_SIZE = 2000
+
+
+def _employee_from_csv(row):
+    employee = {}
+    salario = {}
+    for key, value in row.items():
+        if value is None or value == '':
+            continue
+        if key in INTEGER_COLUMNS:
+            value = int(value)
+        if key in SALARY_COLUMNS:
+            salario[key] = value
+        else:
+            employee[key] = value
+    if salario:
+        employee['salario'] = salario
+    return employee
+
+
+def load_employee_records(path):
+    # Acepta JSON (lista u objeto con "empleados"), JSON Lines o CSV. En CSV
+    # las columnas salario_base, bonificaciones y deducciones forman "salario".
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if extension == '.csv':
+            return [_employee_from_csv(row) for row in csv.DictReader(file)]
+        if extension in ('.jsonl', '.ndjson'):
+            return [json.loads(line) for line in file if line.strip()]
+        records = json.load(file)
+        if isinstance(records, dict):
+            records = records.get('empleados', [])
+        return records
+
+
+def iter_employee_records(path):
+    # Como load_employee_records pero leyendo los registros de uno en uno, con
+    # memoria constante en CSV y JSON Lines. Un registro que no se puede
+    # interpretar se entrega como ValueError para que el llamador lo informe y
+    # siga con el resto.
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if extension == '.csv':
+            for row in csv.DictReader(file):
+                try:
+                    yield _employee_from_csv(row)
+                except ValueError as e:
+                    yield e
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+        else:
+            records = json.load(file)
+            if isinstance(records, dict):
+                records = records.get('empleados', [])
+            yield from records
+
+
 class Cliente:
-    def __init__(self, host='localhost', port=33056):
+    def __init__(self, host='localhost', port=33056, framed=True, encoding='json',
+                 read_your_writes=True):
         self.host = host
         self.port = port
+        self.framed = framed
+        # 'json' o 'binary'; la codificación final la confirma el servidor
+        self.encoding = encoding
+        # Con réplicas de lectura, tras una escritura las lecturas de esta
+        # conexión van al primario durante unos segundos
+        self.read_your_writes = read_your_writes
+        self.codec = JSON_CODEC
         self.socket = None
+        self.reader = None
+        self.next_stream_id = 0
+        # Peticiones en curso por id: un Future o, para los streams, una cola
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.reader_thread = None
 
     def connect(self):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
+            self.reader = SocketReader(self.socket, cls=CustomJSONDecoder)
+            if self.framed:
+                self._handshake()
+                self.reader_thread = threading.Thread(target=self._read_loop,
+                                                      args=(self.socket, self.reader),
+                                                      name='cliente-reader', daemon=True)
+                self.reader_thread.start()
             logging.info("Conectado al servidor exitosamente")
         except Exception as e:
             logging.error(f"Error de conexión: {e}")
+            self.close()
             raise
 
+    def _ensure_connected(self):
+        with self.connect_lock:
+            if not self.socket:
+                self.connect()
+
+    def _handshake(self):
+        hello = {'version': PROTOCOL_VERSION, 'pipelining': True, 'encoding': self.encoding,
+                 'read_your_writes': self.read_your_writes}
+        self.socket.sendall(MAGIC + encode_message(hello, FRAME_HELLO))
+        frame = self.reader.read_frame()
+        if frame is None or frame[0] != FRAME_HELLO:
+            raise ProtocolError("El servidor no respondió al handshake")
+        response = json.loads(frame[2].decode('utf-8'))
+        if response.get('status') != 'success':
+            raise ProtocolError(response.get('message', 'Handshake rechazado'))
+        self.codec = CODECS.get(response.get('encoding'), JSON_CODEC)
+
+    def _new_stream_id(self):
+        self.next_stream_id = (self.next_stream_id + 1) % 0xFFFFFFFF or 1
+        return self.next_stream_id
+
+    def _read_loop(self, sock, reader):
+        # Hilo que lee todas las respuestas y las entrega a quien las espera
+        # según el id de petición, en el orden en que lleguen.
+        error = None
+        try:
+            while True:
+                frame = reader.read_frame()
+                if frame is None:
+                    raise ConnectionError("El servidor cerró la conexión")
+                frame_type, stream_id, payload = frame
+                try:
+                    response = self.codec.decode(payload)
+                except (ValueError, ProtocolError) as e:
+                    logging.error(f"Error decodificando la respuesta: {e}")
+                    response = {'status': 'error', 'message': 'Respuesta inválida del servidor'}
+
+                with self.lock:
+                    target = self.pending.get(stream_id)
+                    if frame_type != FRAME_CHUNK:
+                        self.pending.pop(stream_id, None)
+
+                # Sin esperar a nadie: un consumidor de stream lento solo
+                # acumula bloques en su propia cola y no frena al resto de
+                # peticiones de la conexión
+                if isinstance(target, Future):
+                    if not target.done():
+                        target.set_result(response)
+                elif isinstance(target, queue.Queue):
+                    target.put_nowait((frame_type, response))
+                # target None: stream abandonado por el consumidor, se descarta
+        except Exception as e:
+            error = e
+        finally:
+            with self.lock:
+                pending = list(self.pending.values())
+                self.pending.clear()
+                if self.socket is sock:
+                    self.socket = None
+                    self.reader = None
+            sock.close()
+            if error and pending:
+                logging.error(f"Error en la comunicación: {error}")
+            for target in pending:
+                if isinstance(target, Future):
+                    if not target.done():
+                        target.set_exception(error or ConnectionError("Conexión cerrada"))
+                elif isinstance(target, queue.Queue):
+                    target.put_nowait((None, error or ConnectionError("Conexión cerrada")))
+
+    def _send(self, request, target):
+        with self.lock:
+            if not self.socket:
+                raise ConnectionError("No hay conexión con el servidor")
+            stream_id = self._new_stream_id()
+            self.pending[stream_id] = target
+            try:
+                self.socket.sendall(encode_message(request, FRAME_MESSAGE, stream_id, self.codec))
+            except Exception:
+                self.pending.pop(stream_id, None)
+                raise
+        return stream_id
+
+    def submit(self, operation, data):
+        # Envía la petición sin esperar la respuesta y devuelve un Future. Se
+        # pueden encadenar muchas peticiones por la misma conexión.
+        if not self.framed:
+            raise ProtocolError("El pipelining requiere el protocolo con framing")
+        if operation == 'SUBSCRIBE':
+            raise ProtocolError("Use subscribe() para recibir los eventos de SUBSCRIBE")
+        self._ensure_connected()
+
+        future = Future()
+        self._send({'operation': operation, 'data': data}, future)
+        return future
+
     def send_request(self, operation, data):
-        if not self.socket:
-            self.connect()
+        self._ensure_connected()
 
         try:
             request = {
@@ -46,24 +242,118 @@ class Cliente:
                 'data': data
             }
 
-            request_json = json.dumps(request)
-            self.socket.send(request_json.encode('utf-8'))
-
-            response_data = self.socket.recv(4096).decode('utf-8')
-
-            logging.debug(f"Respuesta recibida: {response_data}")
-
             try:
-                response = json.loads(response_data, cls=CustomJSONDecoder)
+                if self.framed:
+                    response = self.submit(operation, data).result()
+                else:
+                    self.socket.sendall(json.dumps(request).encode('utf-8'))
+                    response = self.reader.read_json()
+                    if response is None:
+                        raise ConnectionError("El servidor cerró la conexión")
+
+                logging.debug(f"Respuesta recibida: {response}")
                 return response
-            except json.JSONDecodeError:
-                logging.error(f"Error decodificando JSON: {response_data}")
+            except json.JSONDecodeError as e:
+                logging.error(f"Error decodificando JSON: {e}")
                 return {'status': 'error', 'message': 'Respuesta inválida del servidor'}
 
         except Exception as e:
             logging.error(f"Error en la comunicación: {e}")
             return {'status': 'error', 'message': str(e)}
 
+    def stream_select(self, data, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Recorre un SELECT grande fila a fila sin recibir todo el resultado
+        # de una vez. Solo disponible con el protocolo con framing.
+        if not self.framed:
+            raise ProtocolError("El streaming requiere el protocolo con framing")
+        self._ensure_connected()
+
+        # Cola sin límite: el hilo lector atiende todas las peticiones de la
+        # conexión y no puede esperar a este consumidor. Lo pendiente está
+        # acotado por el propio resultado.
+        chunks = queue.Queue()
+        request = {'operation': 'SELECT', 'data': data, 'stream': True, 'chunk_size': chunk_size}
+        stream_id = self._send(request, chunks)
+
+        finished = False
+        try:
+            while True:
+                frame_type, payload = chunks.get()
+                if frame_type is None:
+                    finished = True
+                    raise payload
+                if frame_type == FRAME_CHUNK:
+                    yield from payload['rows']
+                    continue
+
+                finished = True
+                if frame_type == FRAME_END:
+                    if payload.get('status') != 'success':
+                        raise RuntimeError(payload.get('message', 'Error en el streaming'))
+                else:
+                    # El servidor respondió con un mensaje normal (p. ej. un error)
+                    if payload.get('status') != 'success':
+                        raise RuntimeError(payload.get('message', 'Error desconocido'))
+                    yield from payload.get('data', [])
+                return
+        finally:
+            if not finished:
+                # Se descartan los frames que aún lleguen de este stream
+                with self.lock:
+                    if stream_id in self.pending:
+                        self.pending[stream_id] = None
+                while not chunks.empty():
+                    chunks.get_nowait()
+
+    def subscribe(self, filters=None, resume=True):
+        # Recorre los eventos de cambios de empleados (SUBSCRIBE) según se
+        # confirman. filters admite departamento_id y empleado_id. Si el
+        # servidor corta la suscripción por ir lento o se pierde la conexión,
+        # con resume se vuelve a suscribir desde el último seq recibido.
+        if not self.framed:
+            raise ProtocolError("Las suscripciones requieren el protocolo con framing")
+        data = dict(filters or {})
+        while True:
+            self._ensure_connected()
+            chunks = queue.Queue()
+            stream_id = self._send({'operation': 'SUBSCRIBE', 'data': data}, chunks)
+            finished = False
+            try:
+                while True:
+                    frame_type, payload = chunks.get()
+                    if frame_type is None:
+                        finished = True
+                        if not resume or 'since' not in data:
+                            raise payload
+                        logging.warning(f"Suscripción interrumpida, se reanuda: {payload}")
+                        break
+                    if frame_type == FRAME_CHUNK:
+                        data['since'] = payload['seq']
+                        data['epoch'] = payload.get('epoch', data.get('epoch'))
+                        yield from payload['events']
+                        continue
+
+                    finished = True
+                    if payload.get('seq') is not None and 'epoch' in data:
+                        data['since'] = payload['seq']
+                    if frame_type == FRAME_END and payload.get('reason') == 'slow_consumer' and resume:
+                        logging.warning("El servidor cortó la suscripción por lenta, se reanuda")
+                        break
+                    if payload.get('status') != 'success':
+                        raise RuntimeError(payload.get('message', 'Error en la suscripción'))
+                    return
+            finally:
+                if not finished:
+                    with self.lock:
+                        active = self.pending.get(stream_id) is chunks
+                        if active:
+                            self.pending[stream_id] = None
+                    # Se liberan los eventos que el consumidor ya no leerá
+                    while not chunks.empty():
+                        chunks.get_nowait()
+                    if active:
+                        self.submit('UNSUBSCRIBE', {'stream_id': stream_id})
+
     def insert_employee(self):
         print("\n=== Insertar Nuevo Empleado ===")
         data = {
@@ -143,10 +433,90 @@ class Cliente:
         response = self.send_request('DELETE', data)
         print("\nRespuesta:", response)
 
+    def bulk_from_file(self, operation, path, batch_size=None, request_size=BULK_REQUEST_SIZE):
+        # Envía los registros en varias peticiones BULK_INSERT/BULK_UPDATE de
+        # como mucho request_size filas y une los resultados por fila.
+        records = load_employee_records(path)
+        summary = {'status': 'success', 'succeeded': 0, 'failed': 0, 'results': []}
+        for start in range(0, len(records), request_size):
+            data = {'empleados': records[start:start + request_size]}
+            if batch_size:
+                data['batch_size'] = batch_size
+            response = self.send_request(operation, data)
+            if 'results' not in response:
+                return response
+
+            summary['succeeded'] += response['succeeded']
+            summary['failed'] += response['failed']
+            for result in response['results']:
+                result['index'] += start
+                summary['results'].append(result)
+
+        if summary['failed']:
+            summary['status'] = 'partial' if summary['succeeded'] else 'error'
+        summary['message'] = f"{summary['succeeded']} correctos, {summary['failed']} con errores"
+        return summary
+
+    def bulk_insert_from_file(self, path, batch_size=None):
+        return self.bulk_from_file('BULK_INSERT', path, batch_size)
+
+    def bulk_update_from_file(self, path, batch_size=None):
+        return self.bulk_from_file('BULK_UPDATE', path, batch_size)
+
+    def bulk_load(self):
+        print("\n=== Carga Masiva desde Archivo ===")
+        path = input("Ruta del archivo (.json, .jsonl o .csv): ")
+        mode = input("Operación (1: Insertar, 2: Actualizar): ")
+
+        if mode == '2':
+            response = self.bulk_update_from_file(path)
+        else:
+            response = self.bulk_insert_from_file(path)
+
+        print("\nRespuesta:", response.get('message', response))
+        for result in response.get('results', []):
+            if result['status'] != 'success':
+                print(f"  Fila {result['index']}: {result['message']}")
+
+    def iter_pages(self, data, limit=100):
+        # Recorre un SELECT filtrado página a página siguiendo next_cursor
+        data = dict(data, limit=limit)
+        while True:
+            response = self.send_request('SELECT', data)
+            if response.get('status') != 'success':
+                raise RuntimeError(response.get('message', 'Error desconocido'))
+            yield response['data']
+            if not response.get('next_cursor'):
+                return
+            data['cursor'] = response['next_cursor']
+
+    def list_employees(self):
+        print("\n=== Listado de Empleados ===")
+        data = {}
+        departamento_id = input("ID del departamento (opcional): ")
+        if departamento_id:
+            data['departamento_id'] = int(departamento_id)
+        if input("¿Solo empleados activos? (s/n): ").lower() == 's':
+            data['estado'] = 1
+
+        total = 0
+        for employee in self.stream_select(data):
+            total += 1
+            print(f"{employee['id']}: {employee['primer_nombre']} {employee['primer_apellido']}"
+                  f" - {employee['email']}")
+        print(f"\nTotal de empleados: {total}")
+
     def close(self):
-        if self.socket:
-            self.socket.close()
+        with self.lock:
+            sock = self.socket
             self.socket = None
+            self.reader = None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
 
     def main_menu(self):
         while True:
@@ -155,7 +525,9 @@ class Cliente:
             print("2. Actualizar empleado")
             print("3. Consultar empleado")
             print("4. Dar de baja empleado")
-            print("5. Salir")
+            print("5. Listar empleados")
+            print("6. Carga masiva desde archivo")
+            print("7. Salir")
 
             option = input("\nSeleccione una opción: ")
 
@@ -169,6 +541,10 @@ class Cliente:
                 elif option == '4':
                     self.delete_employee()
                 elif option == '5':
+                    self.list_employees()
+                elif option == '6':
+                    self.bulk_load()
+                elif option == '7':
                     print("Gracias por usar el sistema")
                     self.close()
                     break
@@ -0,0 +1,491 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from itertools import count
+# El protocolo se comparte con el servidor: vive en src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (ProtocolError, encode_message, HEADER, MAGIC, MAX_FRAME_SIZE, CODECS,
+                      JSON_CODEC, PROTOCOL_VERSION, DEFAULT_CHUNK_SIZE, FRAME_HELLO,
+                      FRAME_MESSAGE, FRAME_CHUNK, FRAME_END)
+
+# Cliente para servicios: varias conexiones persistentes con pipelining
+# compartidas por todas las llamadas, reintentos y timeouts por llamada. La API
+# principal es asyncio (AsyncPoolClient); PoolClient la expone bloqueante.
+
+# Operaciones que se pueden repetir sin efectos adicionales si se pierde la
+# conexión antes de recibir la respuesta
+IDEMPOTENT_OPERATIONS = frozenset((
+    'SELECT', 'SEARCH', 'LEAVE_CHECK', 'WHO_IS_OUT', 'PAYROLL_REPORT', 'WORKFORCE_TIMESERIES',
+    'LIST_DEPARTAMENTOS', 'LIST_CARGOS', 'LIST_TIPOS_PERMISOS', 'CACHE_STATS', 'STATS', 'PING'
+))
+# Respuestas con las que el servidor pide volver a intentarlo más tarde
+RETRY_STATUSES = ('busy',)
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.1
+MAX_BACKOFF = 5.0
+DEFAULT_HEALTH_CHECK_INTERVAL = 15.0
+
+
+class ServerError(Exception):
+    # Respuesta con status distinto de 'success'; response es la respuesta entera
+    def __init__(self, response):
+        super().__init__(response.get('message') or f"Estado {response.get('status')}")
+        self.response = response
+
+    @property
+    def status(self):
+        return self.response.get('status')
+
+
+class RequestTimeout(TimeoutError):
+    pass
+
+
+class AsyncConnection:
+    # Una conexión con el protocolo con framing. Varias llamadas pueden estar
+    # en curso a la vez; una tarea lee los frames y entrega cada respuesta a
+    # quien la espera según el id de stream.
+    def __init__(self, host, port, encoding='json', read_your_writes=True):
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self.read_your_writes = read_your_writes
+        self.codec = JSON_CODEC
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._pending = {}
+        self._stream_ids = count()
+
+    async def connect(self, timeout):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout)
+        try:
+            hello = {'version': PROTOCOL_VERSION, 'pipelining': True, 'encoding': self.encoding,
+                     'read_your_writes': self.read_your_writes}
+            self._writer.write(MAGIC + encode_message(hello, FRAME_HELLO))
+            frame = await asyncio.wait_for(self._read_frame(), timeout)
+            if frame is None or frame[0] != FRAME_HELLO:
+                raise ProtocolError("El servidor no respondió al handshake")
+            response = json.loads(frame[2].decode('utf-8'))
+            if response.get('status') != 'success':
+                raise ProtocolError(response.get('message', 'Handshake rechazado'))
+            self.codec = CODECS.get(response.get('encoding'), JSON_CODEC)
+        except BaseException:
+            self._writer.close()
+            self.closed = True
+            raise
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def _read_frame(self):
+        try:
+            header = await self._reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise ProtocolError("Conexión cerrada a mitad de un frame")
+            return None
+        frame_type, stream_id, length = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame demasiado grande: {length} bytes")
+        try:
+            payload = await self._reader.readexactly(length) if length else b''
+        except asyncio.IncompleteReadError:
+            raise ProtocolError("Conexión cerrada a mitad de un frame")
+        return frame_type, stream_id, payload
+
+    async def _read_loop(self):
+        error = ConnectionError("El servidor cerró la conexión")
+        try:
+            while True:
+                frame = await self._read_frame()
+                if frame is None:
+                    break
+                frame_type, stream_id, payload = frame
+                try:
+                    response = self.codec.decode(payload)
+                except (ValueError, ProtocolError) as e:
+                    logging.error(f"Error decodificando la respuesta: {e}")
+                    response = {'status': 'error', 'message': 'Respuesta inválida del servidor'}
+                target = self._pending.get(stream_id)
+                if frame_type != FRAME_CHUNK:
+                    self._pending.pop(stream_id, None)
+                if isinstance(target, asyncio.Future):
+                    if not target.done():
+                        target.set_result(response)
+                elif isinstance(target, asyncio.Queue):
+                    # Sin esperar: un consumidor lento solo acumula bloques en
+                    # su propia cola y no frena al resto de streams
+                    target.put_nowait((frame_type, response))
+        except (OSError, ProtocolError) as e:
+            error = ConnectionError(str(e))
+        finally:
+            self._fail(error)
+
+    def _fail(self, error):
+        self.closed = True
+        pending, self._pending = self._pending, {}
+        for target in pending.values():
+            if isinstance(target, asyncio.Future):
+                if not target.done():
+                    target.set_exception(error)
+            elif isinstance(target, asyncio.Queue):
+                target.put_nowait((None, error))
+        if self._writer is not None:
+            self._writer.close()
+
+    def _send(self, request, target):
+        if self.closed:
+            raise ConnectionError("La conexión está cerrada")
+        stream_id = next(self._stream_ids) % 0xFFFFFFFF + 1
+        self._pending[stream_id] = target
+        self._writer.write(encode_message(request, FRAME_MESSAGE, stream_id, self.codec))
+        self.last_used = time.monotonic()
+        return stream_id
+
+    async def request(self, request, timeout):
+        future = asyncio.get_running_loop().create_future()
+        stream_id = self._send(request, future)
+        self.in_flight += 1
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # La respuesta que llegue tarde se descarta
+            self._pending.pop(stream_id, None)
+            raise RequestTimeout(f"{request.get('operation')} sin respuesta tras {timeout} s")
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+
+    async def stream(self, request, timeout):
+        # Frames de bloque de un SELECT en streaming; timeout es por bloque.
+        # La cola no tiene límite para que la tarea lectora nunca se bloquee
+        # en este stream: lo pendiente está acotado por el propio resultado
+        chunks = asyncio.Queue()
+        stream_id = self._send(request, chunks)
+        self.in_flight += 1
+        finished = False
+        try:
+            await self._writer.drain()
+            while True:
+                try:
+                    frame_type, payload = await asyncio.wait_for(chunks.get(), timeout)
+                except asyncio.TimeoutError:
+                    raise RequestTimeout(f"Streaming sin datos tras {timeout} s")
+                if frame_type is None:
+                    finished = True
+                    raise payload
+                if frame_type == FRAME_CHUNK:
+                    yield payload['rows']
+                    continue
+                finished = True
+                if payload.get('status') != 'success':
+                    raise ServerError(payload)
+                if frame_type != FRAME_END:
+                    yield payload.get('data', [])
+                return
+        finally:
+            self.in_flight -= 1
+            if not finished and self._pending.get(stream_id) is chunks:
+                # Se descartan los bloques que aún lleguen de este stream
+                self._pending[stream_id] = None
+
+    async def close(self):
+        if self._writer is not None and not self.closed:
+            self._writer.close()
+        self.closed = True
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+
+
+class AsyncPoolClient:
+    # Reparte las llamadas entre hasta size conexiones (la que tenga menos
+    # llamadas en curso) y abre o reabre conexiones según hace falta. Las
+    # operaciones idempotentes se reintentan con espera exponencial si falla
+    # la conexión o el servidor responde 'busy'; las demás solo si la
+    # conexión no se llegó a establecer.
+    def __init__(self, host='localhost', port=33056, size=DEFAULT_POOL_SIZE, encoding='json',
+                 timeout=DEFAULT_TIMEOUT, connect_timeout=5.0, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, max_backoff=MAX_BACKOFF,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL, read_your_writes=True):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.encoding = encoding
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.health_check_interval = health_check_interval
+        self.read_your_writes = read_your_writes
+        self.connections = []
+        self.opened = 0
+        self.retried = 0
+        self._lock = None
+        self._health_task = None
+        self._closed = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        # Abre la primera conexión: falla enseguida si el servidor no responde
+        await self._acquire()
+        if self.health_check_interval and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def _least_busy(self):
+        # La conexión con menos llamadas en curso, si no hace falta abrir otra
+        self.connections = [connection for connection in self.connections if not connection.closed]
+        if not self.connections:
+            return None
+        connection = min(self.connections, key=lambda connection: connection.in_flight)
+        if connection.in_flight == 0 or len(self.connections) >= self.size:
+            return connection
+        return None
+
+    async def _acquire(self):
+        if self._closed:
+            raise ConnectionError("El cliente está cerrado")
+        connection = self._least_busy()
+        if connection is not None:
+            return connection
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Se abre otra conexión (la primera, una que se cerró o porque todas
+        # están ocupadas), de una en una
+        async with self._lock:
+            connection = self._least_busy()
+            if connection is not None:
+                return connection
+            connection = AsyncConnection(self.host, self.port, self.encoding, self.read_your_writes)
+            await connection.connect(self.connect_timeout)
+            self.opened += 1
+            self.connections.append(connection)
+            return connection
+
+    async def _health_loop(self):
+        # Comprueba con PING las conexiones sin uso reciente y cierra las que
+        # no responden; la siguiente llamada abre otra
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            now = time.monotonic()
+            for connection in list(self.connections):
+                if connection.closed or connection.in_flight or \
+                        now - connection.last_used < self.health_check_interval:
+                    continue
+                try:
+                    await connection.request({'operation': 'PING', 'data': {}}, self.connect_timeout)
+                except (ConnectionError, OSError, RequestTimeout) as e:
+                    logging.warning(f"Conexión con {self.host}:{self.port} descartada: {e}")
+                    await connection.close()
+
+    def _delay(self, attempt):
+        # Espera exponencial con jitter para no reintentar todos a la vez
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def request(self, operation, data=None, timeout=None, idempotent=None,
+                      raise_errors=True, **options):
+        # Devuelve la respuesta si su status es 'success' y si no lanza
+        # ServerError (con raise_errors=False la devuelve igualmente).
+        # options se añaden a la petición (p. ej. chunk_size).
+        if idempotent is None:
+            idempotent = operation in IDEMPOTENT_OPERATIONS
+        timeout = self.timeout if timeout is None else timeout
+        request = dict(options, operation=operation, data=data if data is not None else {})
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            sent = False
+            retry_after = 0
+            try:
+                connection = await self._acquire()
+                sent = True
+                response = await connection.request(request, max(deadline - time.monotonic(), 0))
+                if response.get('status') in RETRY_STATUSES and attempt < self.retries:
+                    raise ServerError(response)
+                if response.get('status') != 'success' and raise_errors:
+                    raise ServerError(response)
+                return response
+            except ServerError as e:
+                if e.status not in RETRY_STATUSES or attempt >= self.retries:
+                    raise
+                # El servidor indica cuándo tiene sentido volver a intentarlo
+                retry_after = e.response.get('retry_after') or 0
+            except RequestTimeout:
+                raise RequestTimeout(f"{operation} sin respuesta tras {timeout} s")
+            except (ConnectionError, OSError, ProtocolError) as e:
+                if attempt >= self.retries or (sent and not idempotent):
+                    raise
+                logging.warning(f"{operation} falló ({e}), reintento {attempt + 1}/{self.retries}")
+            delay = max(self._delay(attempt), retry_after)
+            if time.monotonic() + delay >= deadline:
+                raise RequestTimeout(f"{operation} sin respuesta tras {timeout} s")
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    async def stream_select(self, data=None, chunk_size=DEFAULT_CHUNK_SIZE, timeout=None):
+        # Filas de un SELECT en streaming, fila a fila
+        connection = await self._acquire()
+        request = {'operation': 'SELECT', 'data': data or {}, 'stream': True, 'chunk_size': chunk_size}
+        async for rows in connection.stream(request, self.timeout if timeout is None else timeout):
+            for row in rows:
+                yield row
+
+    async def gather(self, calls, concurrency=None, return_exceptions=False, timeout=None,
+                     raise_errors=True):
+        # Ejecuta a la vez una lista de (operación, datos) y devuelve las
+        # respuestas en el mismo orden. concurrency limita las que están en
+        # curso a la vez.
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def call(operation, data):
+            if semaphore is None:
+                return await self.request(operation, data, timeout, raise_errors=raise_errors)
+            async with semaphore:
+                return await self.request(operation, data, timeout, raise_errors=raise_errors)
+
+        return await asyncio.gather(*(call(operation, data) for operation, data in calls),
+                                    return_exceptions=return_exceptions)
+
+    async def batch(self, operation, records, batch_size=1000, concurrency=None, timeout=None):
+        # Envía records en peticiones BULK_INSERT / BULK_UPDATE de batch_size
+        # registros y devuelve una respuesta por lote, también las 'partial' o
+        # 'error' con los resultados por fila
+        records = list(records)
+        calls = [(operation, {'empleados': records[start:start + batch_size]})
+                 for start in range(0, len(records), batch_size)]
+        return await self.gather(calls, concurrency, timeout=timeout, raise_errors=False)
+
+    async def ping(self, timeout=None):
+        started = time.perf_counter()
+        await self.request('PING', timeout=timeout)
+        return time.perf_counter() - started
+
+    async def select(self, data=None, **kwargs):
+        return (await self.request('SELECT', data, **kwargs))['data']
+
+    async def search(self, query, **kwargs):
+        data = dict(kwargs.pop('filters', None) or {}, query=query)
+        return (await self.request('SEARCH', data, **kwargs))['data']
+
+    async def insert(self, employee, **kwargs):
+        return (await self.request('INSERT', employee, **kwargs))['id']
+
+    async def update(self, changes, **kwargs):
+        return await self.request('UPDATE', changes, **kwargs)
+
+    async def delete(self, employee_id, motivo='', **kwargs):
+        return await self.request('DELETE', {'id': employee_id, 'motivo': motivo}, **kwargs)
+
+    async def stats(self, **kwargs):
+        return (await self.request('STATS', **kwargs))['data']
+
+    async def close(self):
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        connections, self.connections = self.connections, []
+        await asyncio.gather(*(connection.close() for connection in connections),
+                             return_exceptions=True)
+
+
+class PoolClient:
+    # API bloqueante sobre AsyncPoolClient: un hilo propio ejecuta el bucle
+    # asyncio y las llamadas esperan su resultado. Se puede usar desde varios
+    # hilos a la vez; submit() devuelve un Future sin esperar.
+    def __init__(self, *args, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='pool-client',
+                                        daemon=True)
+        self._thread.start()
+        self.client = AsyncPoolClient(*args, **kwargs)
+        try:
+            self._run(self.client.connect())
+        except BaseException:
+            self._stop()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def submit(self, operation, data=None, **kwargs):
+        return asyncio.run_coroutine_threadsafe(
+            self.client.request(operation, data, **kwargs), self._loop)
+
+    def request(self, operation, data=None, **kwargs):
+        return self._run(self.client.request(operation, data, **kwargs))
+
+    def gather(self, calls, concurrency=None, return_exceptions=False, timeout=None,
+               raise_errors=True):
+        return self._run(self.client.gather(calls, concurrency, return_exceptions, timeout,
+                                            raise_errors))
+
+    def batch(self, operation, records, batch_size=1000, concurrency=None, timeout=None):
+        return self._run(self.client.batch(operation, records, batch_size, concurrency, timeout))
+
+    def stream_select(self, data=None, chunk_size=DEFAULT_CHUNK_SIZE, timeout=None):
+        rows = self.client.stream_select(data, chunk_size, timeout)
+        try:
+            while True:
+                try:
+                    yield self._run(rows.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(rows.aclose())
+
+    def ping(self, timeout=None):
+        return self._run(self.client.ping(timeout))
+
+    def select(self, data=None, **kwargs):
+        return self._run(self.client.select(data, **kwargs))
+
+    def search(self, query, **kwargs):
+        return self._run(self.client.search(query, **kwargs))
+
+    def insert(self, employee, **kwargs):
+        return self._run(self.client.insert(employee, **kwargs))
+
+    def update(self, changes, **kwargs):
+        return self._run(self.client.update(changes, **kwargs))
+
+    def delete(self, employee_id, motivo='', **kwargs):
+        return self._run(self.client.delete(employee_id, motivo, **kwargs))
+
+    def stats(self, **kwargs):
+        return self._run(self.client.stats(**kwargs))
+
+    def close(self):
+        if self._loop.is_running():
+            self._run(self.client.close())
+            self._stop()
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
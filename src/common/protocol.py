@@ -0,0 +1,529 @@
+import json
+import struct
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Protocolo compartido por el servidor (src/server) y los clientes (src/client).
+
+# Preámbulo que envía un cliente con framing antes del handshake. Los clientes
+# antiguos envían JSON directamente, por lo que nunca empiezan con estos bytes.
+MAGIC = b'RHSP'
+PROTOCOL_VERSION = 1
+
+# Cabecera de cada frame: tipo (1 byte), id de stream (4 bytes), longitud (4 bytes)
+HEADER = struct.Struct('!BII')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+FRAME_HELLO = 0
+FRAME_MESSAGE = 1
+FRAME_CHUNK = 2
+FRAME_END = 3
+
+MODE_FRAMED = 'framed'
+MODE_LEGACY = 'legacy'
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (date, datetime, time)):
+            return obj.isoformat()
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def encode_json(obj):
+    if orjson:
+        try:
+            return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # p. ej. enteros de más de 64 bits: se usa el codificador estándar
+            pass
+    return json.dumps(obj, cls=CustomJSONEncoder).encode('utf-8')
+
+
+def decode_json(payload):
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload.decode('utf-8'))
+
+
+def column_types(rows):
+    # Descriptor de tipos de un conjunto de filas: solo las columnas cuyo
+    # valor no es un tipo nativo de JSON. Se mira cada columna hasta encontrar
+    # un valor no nulo.
+    types = {}
+    pending = set(rows[0])
+    for row in rows:
+        for column in list(pending):
+            value = row.get(column)
+            if value is None:
+                continue
+            pending.discard(column)
+            value_type = JSON_TYPE_NAMES.get(type(value))
+            if value_type:
+                types[column] = value_type
+        if not pending:
+            break
+    return types
+
+
+JSON_TYPE_NAMES = {datetime: 'datetime', date: 'date', time: 'time', Decimal: 'decimal'}
+
+TYPE_DECODERS = {
+    'datetime': datetime.fromisoformat,
+    'date': date.fromisoformat,
+    'time': time.fromisoformat,
+    'decimal': Decimal
+}
+
+
+def apply_column_types(rows, types):
+    # Convierte solo las columnas que el servidor marcó como fechas o decimales
+    converters = [(column, TYPE_DECODERS[type_name]) for column, type_name in types.items()
+                  if type_name in TYPE_DECODERS]
+    for row in rows or ():
+        for column, convert in converters:
+            value = row.get(column)
+            if value is not None:
+                row[column] = convert(value)
+
+
+class JSONCodec:
+    name = 'json'
+
+    def encode(self, obj):
+        # Las respuestas con filas llevan el descriptor de tipos para que el
+        # cliente convierta solo las columnas que lo necesitan.
+        if isinstance(obj, dict):
+            rows = obj.get('data') if 'data' in obj else obj.get('rows')
+            if isinstance(rows, list) and rows and isinstance(rows[0], dict):
+                types = column_types(rows)
+                if types:
+                    obj = dict(obj, types=types)
+        return encode_json(obj)
+
+    def decode(self, payload):
+        obj = decode_json(payload)
+        if isinstance(obj, dict) and obj.get('types'):
+            types = obj.pop('types')
+            apply_column_types(obj.get('data') if 'data' in obj else obj.get('rows'), types)
+        return obj
+
+
+class BinaryCodec:
+    # Codificación binaria compacta con tipos nativos: cada valor lleva una
+    # etiqueta de un byte. Las listas de filas con las mismas columnas se
+    # envían como tabla, con los nombres de columna una sola vez.
+    name = 'binary'
+
+    def encode(self, obj):
+        out = bytearray()
+        self._encode(obj, out)
+        return bytes(out)
+
+    def _encode(self, obj, out):
+        if obj is None:
+            out += b'N'
+        elif obj is True:
+            out += b'T'
+        elif obj is False:
+            out += b'F'
+        elif isinstance(obj, int):
+            if -(1 << 63) <= obj < (1 << 63):
+                out += b'i'
+                out += _INT64.pack(obj)
+            else:
+                self._encode_text(b'I', str(obj), out)
+        elif isinstance(obj, float):
+            out += b'f'
+            out += _FLOAT64.pack(obj)
+        elif isinstance(obj, str):
+            self._encode_text(b's', obj, out)
+        elif isinstance(obj, datetime):
+            out += b'z'
+            out += _INT64.pack(_datetime_to_micros(obj))
+        elif isinstance(obj, date):
+            out += b'd'
+            out += _UINT32.pack(obj.toordinal())
+        elif isinstance(obj, time):
+            out += b'h'
+            out += _INT64.pack(_time_to_micros(obj))
+        elif isinstance(obj, Decimal):
+            self._encode_text(b'D', str(obj), out)
+        elif isinstance(obj, (bytes, bytearray)):
+            out += b'b'
+            out += _UINT32.pack(len(obj))
+            out += obj
+        elif isinstance(obj, dict):
+            out += b'm'
+            out += _UINT32.pack(len(obj))
+            for key, value in obj.items():
+                self._encode(key, out)
+                self._encode(value, out)
+        elif isinstance(obj, (list, tuple)):
+            columns = _table_columns(obj)
+            if columns:
+                out += b'R'
+                out += _UINT32.pack(len(columns))
+                for column in columns:
+                    self._encode(column, out)
+                out += _UINT32.pack(len(obj))
+                for row in obj:
+                    for column in columns:
+                        self._encode(row[column], out)
+            else:
+                out += b'l'
+                out += _UINT32.pack(len(obj))
+                for item in obj:
+                    self._encode(item, out)
+        else:
+            raise TypeError(f"Tipo no soportado en la codificación binaria: {type(obj).__name__}")
+
+    def _encode_text(self, tag, text, out):
+        data = text.encode('utf-8')
+        out += tag
+        out += _UINT32.pack(len(data))
+        out += data
+
+    def decode(self, payload):
+        try:
+            value, offset = self._decode(bytes(payload), 0)
+        except (struct.error, IndexError, KeyError, UnicodeDecodeError, ValueError, TypeError,
+                OverflowError, InvalidOperation, RecursionError) as e:
+            # Cualquier payload malformado se informa igual, sin tumbar el hilo lector
+            raise ProtocolError(f"Mensaje binario inválido: {e}")
+        if offset != len(payload):
+            raise ProtocolError("Mensaje binario inválido: bytes sobrantes")
+        return value
+
+    def _decode(self, data, offset):
+        tag = data[offset]
+        offset += 1
+        if tag == 0x4E:  # N
+            return None, offset
+        if tag == 0x54:  # T
+            return True, offset
+        if tag == 0x46:  # F
+            return False, offset
+        if tag == 0x69:  # i
+            return _INT64.unpack_from(data, offset)[0], offset + 8
+        if tag == 0x66:  # f
+            return _FLOAT64.unpack_from(data, offset)[0], offset + 8
+        if tag in _TEXT_TAGS:
+            length = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            text = str(data[offset:offset + length], 'utf-8')
+            return _TEXT_TAGS[tag](text), offset + length
+        if tag == 0x7A:  # z
+            return _micros_to_datetime(_INT64.unpack_from(data, offset)[0]), offset + 8
+        if tag == 0x64:  # d
+            return date.fromordinal(_UINT32.unpack_from(data, offset)[0]), offset + 4
+        if tag == 0x68:  # h
+            return _micros_to_time(_INT64.unpack_from(data, offset)[0]), offset + 8
+        if tag == 0x62:  # b
+            length = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            return bytes(data[offset:offset + length]), offset + length
+        if tag == 0x6D:  # m
+            count = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            result = {}
+            for _ in range(count):
+                key, offset = self._decode(data, offset)
+                result[key], offset = self._decode(data, offset)
+            return result, offset
+        if tag == 0x6C:  # l
+            count = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            result = []
+            for _ in range(count):
+                item, offset = self._decode(data, offset)
+                result.append(item)
+            return result, offset
+        if tag == 0x52:  # R
+            column_count = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            columns = []
+            for _ in range(column_count):
+                column, offset = self._decode(data, offset)
+                columns.append(column)
+            row_count = _UINT32.unpack_from(data, offset)[0]
+            offset += 4
+            return self._decode_table(data, offset, columns, row_count)
+        raise ProtocolError(f"Etiqueta binaria desconocida: {tag}")
+
+    def _decode_table(self, data, offset, columns, row_count):
+        # Bucle caliente de los resultados grandes: los tipos más frecuentes
+        # se decodifican aquí mismo sin llamada recursiva.
+        decode = self._decode
+        unpack_int64 = _INT64.unpack_from
+        unpack_uint32 = _UINT32.unpack_from
+        fromordinal = date.fromordinal
+        rows = []
+        for _ in range(row_count):
+            row = {}
+            for column in columns:
+                tag = data[offset]
+                if tag == 0x73:  # s
+                    start = offset + 5
+                    offset = start + unpack_uint32(data, offset + 1)[0]
+                    row[column] = data[start:offset].decode('utf-8')
+                elif tag == 0x69:  # i
+                    row[column] = unpack_int64(data, offset + 1)[0]
+                    offset += 9
+                elif tag == 0x4E:  # N
+                    row[column] = None
+                    offset += 1
+                elif tag == 0x64:  # d
+                    row[column] = fromordinal(unpack_uint32(data, offset + 1)[0])
+                    offset += 5
+                else:
+                    row[column], offset = decode(data, offset)
+            rows.append(row)
+        return rows, offset
+
+
+_INT64 = struct.Struct('!q')
+_UINT32 = struct.Struct('!I')
+_FLOAT64 = struct.Struct('!d')
+_TEXT_TAGS = {0x73: str, 0x49: int, 0x44: Decimal}  # s, I, D
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _datetime_to_micros(value):
+    delta = value.replace(tzinfo=None) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _micros_to_datetime(micros):
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _time_to_micros(value):
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def _micros_to_time(micros):
+    seconds, microsecond = divmod(micros, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return time(hour, minute, second, microsecond)
+
+
+def _table_columns(items):
+    if not items or not isinstance(items[0], dict):
+        return None
+    columns = tuple(items[0])
+    if not all(isinstance(key, str) for key in columns):
+        return None
+    for item in items:
+        if not isinstance(item, dict) or len(item) != len(columns) or tuple(item) != columns:
+            return None
+    return columns
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec(), BinaryCodec())}
+JSON_CODEC = CODECS['json']
+
+
+def encode_frame(frame_type, payload, stream_id=0):
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame demasiado grande: {len(payload)} bytes")
+    return HEADER.pack(frame_type, stream_id, len(payload)) + payload
+
+
+def encode_message(obj, frame_type=FRAME_MESSAGE, stream_id=0, codec=JSON_CODEC):
+    return encode_frame(frame_type, codec.encode(obj), stream_id)
+
+
+class SocketReader:
+    def __init__(self, sock, bufsize=65536, on_read=None, cls=None):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.buffer = bytearray()
+        # Decodificador JSON del modo antiguo (el cliente convierte fechas)
+        self.cls = cls
+        # Recibe el número de bytes de cada lectura del socket (métricas)
+        self.on_read = on_read
+        self._reset_scan()
+
+    def _fill(self):
+        data = self.sock.recv(self.bufsize)
+        if not data:
+            return False
+        if self.on_read:
+            self.on_read(len(data))
+        self.buffer.extend(data)
+        return True
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            if not self._fill():
+                if self.buffer:
+                    raise ProtocolError("Conexión cerrada a mitad de un frame")
+                return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def detect_mode(self):
+        # Decide si el cliente habla el protocolo con framing o JSON plano
+        while not self.buffer:
+            if not self._fill():
+                return None
+        while len(self.buffer) < len(MAGIC) and MAGIC.startswith(bytes(self.buffer)):
+            if not self._fill():
+                return None
+        if self.buffer.startswith(MAGIC):
+            del self.buffer[:len(MAGIC)]
+            return MODE_FRAMED
+        return MODE_LEGACY
+
+    def read_frame(self):
+        header = self.read_exact(HEADER.size)
+        if header is None:
+            return None
+        frame_type, stream_id, length = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame demasiado grande: {length} bytes")
+        payload = self.read_exact(length) if length else b''
+        if payload is None:
+            raise ProtocolError("Conexión cerrada a mitad de un frame")
+        return frame_type, stream_id, payload
+
+    def _scan_document(self):
+        # Recorre los bytes nuevos buscando el cierre del documento JSON de
+        # nivel superior; los caracteres estructurales son ASCII en UTF-8.
+        buffer = self.buffer
+        pos = self._scan_pos
+        while pos < len(buffer):
+            byte = buffer[pos]
+            pos += 1
+            if self._scan_in_string:
+                if self._scan_escape:
+                    self._scan_escape = False
+                elif byte == 0x5C:
+                    self._scan_escape = True
+                elif byte == 0x22:
+                    self._scan_in_string = False
+            elif self._scan_depth == 0 and byte in b' \t\r\n':
+                continue
+            elif byte == 0x22:
+                self._scan_in_string = True
+            elif byte in b'{[':
+                self._scan_depth += 1
+            elif byte in b'}]':
+                self._scan_depth -= 1
+                if self._scan_depth <= 0:
+                    return pos
+            elif self._scan_depth == 0:
+                # No es un objeto ni una lista: se entrega todo para que falle
+                return len(buffer)
+        self._scan_pos = pos
+        return None
+
+    def read_json(self):
+        # Modo antiguo: acumula bytes hasta tener un documento JSON completo,
+        # de modo que mensajes partidos o unidos por TCP se separan bien.
+        while True:
+            end = self._scan_document()
+            if end is not None:
+                raw = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                self._reset_scan()
+                return json.loads(raw.decode('utf-8', errors='replace'), cls=self.cls)
+            if len(self.buffer) > MAX_FRAME_SIZE:
+                raise ProtocolError("Mensaje JSON demasiado grande")
+            if not self._fill():
+                if self.buffer.strip():
+                    raise ProtocolError("Conexión cerrada a mitad de un mensaje")
+                return None
+
+    def _reset_scan(self):
+        self._scan_pos = 0
+        self._scan_depth = 0
+        self._scan_in_string = False
+        self._scan_escape = False
+
+
+class AsyncStreamReader(SocketReader):
+    # Misma lógica que SocketReader sobre un asyncio.StreamReader
+    def __init__(self, stream, bufsize=65536, on_read=None):
+        super().__init__(None, bufsize, on_read)
+        self.stream = stream
+
+    async def _fill(self):
+        data = await self.stream.read(self.bufsize)
+        if not data:
+            return False
+        if self.on_read:
+            self.on_read(len(data))
+        self.buffer.extend(data)
+        return True
+
+    async def read_exact(self, size):
+        while len(self.buffer) < size:
+            if not await self._fill():
+                if self.buffer:
+                    raise ProtocolError("Conexión cerrada a mitad de un frame")
+                return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def detect_mode(self):
+        while not self.buffer:
+            if not await self._fill():
+                return None
+        while len(self.buffer) < len(MAGIC) and MAGIC.startswith(bytes(self.buffer)):
+            if not await self._fill():
+                return None
+        if self.buffer.startswith(MAGIC):
+            del self.buffer[:len(MAGIC)]
+            return MODE_FRAMED
+        return MODE_LEGACY
+
+    async def read_frame(self):
+        header = await self.read_exact(HEADER.size)
+        if header is None:
+            return None
+        frame_type, stream_id, length = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame demasiado grande: {length} bytes")
+        payload = await self.read_exact(length) if length else b''
+        if payload is None:
+            raise ProtocolError("Conexión cerrada a mitad de un frame")
+        return frame_type, stream_id, payload
+
+    async def read_json(self):
+        while True:
+            end = self._scan_document()
+            if end is not None:
+                raw = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                self._reset_scan()
+                return json.loads(raw.decode('utf-8', errors='replace'))
+            if len(self.buffer) > MAX_FRAME_SIZE:
+                raise ProtocolError("Mensaje JSON demasiado grande")
+            if not await self._fill():
+                if self.buffer.strip():
+                    raise ProtocolError("Conexión cerrada a mitad de un mensaje")
+                return None
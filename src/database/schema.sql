@@ -38,7 +38,10 @@ CREATE TABLE empleados (
     departamento_id INT,
     cargo_id INT,
     FOREIGN KEY (departamento_id) REFERENCES departamentos(id),
-    FOREIGN KEY (cargo_id) REFERENCES cargo(id)
+    FOREIGN KEY (cargo_id) REFERENCES cargo(id),
+    -- Índices para los filtros del SELECT paginado (InnoDB añade el id al final)
+    INDEX idx_empleados_estado (estado),
+    INDEX idx_empleados_fecha_contratacion (fecha_contratacion)
 );
 
 -- Actualizar la referencia del jefe en departamentos
@@ -0,0 +1,126 @@
+import threading
+import time
+
+# Motivos por los que se rechaza una petición con status 'busy'
+REJECT_REASONS = ('overloaded', 'rate_limited', 'queue_timeout', 'stopping')
+# Con más clientes que esto se descartan los buckets llenos (clientes sin
+# peticiones recientes) para que el diccionario no crezca sin límite
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        # Devuelve 0 si hay ficha o los segundos que faltan para la siguiente
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionControl:
+    # Decide si una petición se atiende antes de que llegue a DatabaseHandler.
+    # Se rechaza con status 'busy' (el cliente puede reintentar) si ya hay
+    # max_in_flight peticiones en curso en el servidor, si el cliente (por IP)
+    # supera rate peticiones por segundo con ráfagas de hasta burst, si la
+    # petición esperó en cola más de queue_timeout segundos o si el servidor
+    # se está deteniendo. Los límites a None quedan desactivados.
+    def __init__(self, max_in_flight=None, rate=None, burst=None, queue_timeout=None):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+        self.idle_closed = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def admit(self, address, stopping=False):
+        # Devuelve None si la petición se admite (y cuenta como en curso hasta
+        # release()) o la respuesta 'busy' que hay que enviar
+        now = time.monotonic()
+        with self._lock:
+            if stopping:
+                return self._reject('stopping', 'El servidor se está deteniendo', 1.0)
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                return self._reject('overloaded', 'Servidor saturado, inténtelo más tarde', 0.1)
+            if self.rate:
+                wait = self._bucket(client_key(address), now).take(now)
+                if wait:
+                    return self._reject('rate_limited',
+                                        'Demasiadas peticiones de este cliente', wait)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def expired(self, received_at):
+        # Se llama justo antes de ejecutar la petición: si ha esperado
+        # demasiado en cola el cliente probablemente ya no la espera
+        if self.queue_timeout is None or time.perf_counter() - received_at <= self.queue_timeout:
+            return None
+        with self._lock:
+            return self._reject('queue_timeout',
+                                'La petición esperó demasiado en cola', self.queue_timeout)
+
+    def count_idle_closed(self):
+        with self._lock:
+            self.idle_closed += 1
+
+    def _reject(self, reason, message, retry_after):
+        self.rejected[reason] += 1
+        return {'status': 'busy', 'reason': reason, 'message': message,
+                'retry_after': round(retry_after, 3)}
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _prune(self, now):
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'rate': self.rate,
+                'burst': self.burst if self.rate else None,
+                'queue_timeout': self.queue_timeout,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'idle_closed': self.idle_closed,
+                'tracked_clients': len(self._buckets)
+            }
+
+
+def client_key(address):
+    # Los límites por cliente se aplican por IP, no por conexión
+    if isinstance(address, tuple) and address:
+        return address[0]
+    return address
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from coalesce import SharedResponse, coalesce_key
+# El protocolo se comparte con los clientes: vive en src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (AsyncStreamReader, ProtocolError, encode_frame, encode_message, CODECS,
+                      MODE_FRAMED, DEFAULT_CHUNK_SIZE, FRAME_HELLO, FRAME_MESSAGE, FRAME_CHUNK,
+                      FRAME_END)
+from server import (Server, ClientConnection, request_operation, encode_legacy,
+                    SUBSCRIPTION_OPERATIONS, SUBSCRIPTION_CLOSE_TIMEOUT, IDLE_CHECK_INTERVAL)
+
+
+class AsyncServer(Server):
+    # Atiende todas las conexiones en un único bucle asyncio. Las llamadas a la
+    # base de datos (bloqueantes) se ejecutan en un executor con tamaño fijo.
+    def __init__(self, host='localhost', port=33056, backlog=128, max_connections=1000,
+                 db_workers=None, **options):
+        super().__init__(host, port, backlog, workers=db_workers, **options)
+        self.max_connections = max_connections
+        self.loop = None
+        self._stop_event = None
+
+    def start(self):
+        try:
+            if self.exporter:
+                self.exporter.start()
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logging.info("Servidor detenido")
+        except Exception as e:
+            logging.error(f"Error en el servidor: {e}")
+            logging.error(traceback.format_exc())
+        finally:
+            self.executor.shutdown(wait=True)
+            self.server_socket.close()
+            self.db_handler.close()
+
+    def stop(self):
+        # Puede llamarse desde un manejador de señales o desde otro hilo
+        if self.stopping:
+            return
+        self.stopping = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def serve(self):
+        if not self.listening:
+            self.server_socket.bind((self.host, self.port))
+            self.listening = True
+        self.server_socket.setblocking(False)
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self.stopping:
+            return
+        server = await asyncio.start_server(self.handle_connection, sock=self.server_socket,
+                                            backlog=self.backlog)
+        logging.info(f"Servidor asyncio iniciado en {self.host}:{self.port} "
+                     f"(backlog={self.backlog}, max_connections={self.max_connections}, "
+                     f"db_workers={self.workers})")
+        idle_task = None
+        if self.idle_timeout:
+            idle_task = asyncio.create_task(self._close_idle_loop_async())
+        await self._stop_event.wait()
+        if idle_task is not None:
+            idle_task.cancel()
+
+        logging.info("Deteniendo el servidor...")
+        server.close()
+        deadline = time.monotonic() + self.drain_timeout
+        while self.metrics.active_connections > 0 and time.monotonic() < deadline:
+            self.close_idle_connections()
+            await asyncio.sleep(0.05)
+        if self.metrics.active_connections > 0:
+            logging.warning(f"Se cierran {self.metrics.active_connections} conexiones sin terminar")
+
+    async def _close_idle_loop_async(self):
+        while not self.stopping:
+            await asyncio.sleep(min(IDLE_CHECK_INTERVAL, self.idle_timeout))
+            self.close_expired_connections()
+
+    async def run_db(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def handle_connection(self, stream_reader, writer):
+        address = writer.get_extra_info('peername')
+        if self.metrics.active_connections >= self.max_connections:
+            logging.warning(f"Conexión rechazada de {address}: límite de conexiones alcanzado")
+            writer.close()
+            return
+
+        self.metrics.connection_opened()
+        logging.info(f"Cliente conectado desde {address}")
+        reader = AsyncStreamReader(stream_reader, on_read=self.metrics.add_bytes_in)
+        connection = ClientConnection(writer.get_extra_info('socket'), reader)
+        connection.read_your_writes = self.db_handler.read_your_writes
+        self.connections.add(connection)
+        try:
+            mode = await reader.detect_mode()
+            if mode is None:
+                logging.info(f"Cliente {address} desconectado")
+            elif mode == MODE_FRAMED:
+                await self._handle_framed_async(connection, writer, address)
+            else:
+                await self._handle_legacy_async(connection, writer, address)
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logging.info(f"Cliente {address} desconectado")
+        except Exception as e:
+            logging.error(f"Error manejando cliente {address}: {e}")
+        finally:
+            self.connections.discard(connection)
+            self.metrics.connection_closed()
+            writer.close()
+
+    async def _write(self, writer, data):
+        writer.write(data)
+        self.metrics.add_bytes_out(len(data))
+        await writer.drain()
+
+    async def _handle_legacy_async(self, connection, writer, address):
+        reader = connection.reader
+        while True:
+            try:
+                request = await reader.read_json()
+            except json.JSONDecodeError:
+                logging.error(f"Error decodificando JSON de {address}")
+                response = {'status': 'error', 'message': 'JSON inválido'}
+                await self._write(writer, json.dumps(response).encode('utf-8'))
+                continue
+
+            if request is None:
+                logging.info(f"Cliente {address} desconectado")
+                break
+
+            received_at = time.perf_counter()
+            operation = request_operation(request)
+            logging.debug(f"Solicitud {operation} recibida de {address}")
+            rejection = self._admit(connection, address, operation)
+            if rejection is not None:
+                await self._write(writer, encode_legacy(rejection))
+                continue
+            connection.begin()
+            try:
+                response = await self._execute_shared_async(request, address, connection,
+                                                            received_at)
+                await self._send_response_async(
+                    lambda data: self._write(writer, data), operation, received_at,
+                    lambda: response.encoded('legacy', encode_legacy))
+            finally:
+                connection.end()
+                self.admission.release()
+
+    async def _handle_framed_async(self, connection, writer, address):
+        reader = connection.reader
+        frame = await reader.read_frame()
+        if frame is None:
+            logging.info(f"Cliente {address} desconectado")
+            return
+
+        frame_type, stream_id, payload = frame
+        hello, response = self._handshake(frame_type, payload)
+        await self._write(writer, encode_message(response, FRAME_HELLO, stream_id))
+        if hello is None:
+            return
+        if not hello.get('read_your_writes', True):
+            connection.read_your_writes = 0.0
+
+        write_lock = asyncio.Lock()
+
+        async def send(frame_bytes):
+            async with write_lock:
+                await self._write(writer, frame_bytes)
+
+        pipelining = response['pipelining']
+        codec = CODECS[response['encoding']]
+        in_flight = asyncio.Semaphore(self.max_pipeline)
+        pending = set()
+        # Suscripciones abiertas en la conexión: id de stream -> (suscripción, tarea)
+        subscriptions = connection.subscriptions = {}
+
+        async def serve(request, stream_id, received_at):
+            try:
+                await self._serve_request_async(send, request, stream_id, address, codec, received_at,
+                                                connection)
+            finally:
+                in_flight.release()
+                connection.end()
+                self.admission.release()
+
+        try:
+            while True:
+                frame = await reader.read_frame()
+                if frame is None:
+                    logging.info(f"Cliente {address} desconectado")
+                    break
+
+                frame_type, stream_id, payload = frame
+                if frame_type != FRAME_MESSAGE:
+                    raise ProtocolError(f"Tipo de frame inesperado: {frame_type}")
+
+                received_at = time.perf_counter()
+                try:
+                    request = codec.decode(payload)
+                except (ValueError, ProtocolError):
+                    logging.error(f"Error decodificando la solicitud de {address}")
+                    response = {'status': 'error', 'message': 'Mensaje inválido'}
+                    await send(encode_message(response, FRAME_MESSAGE, stream_id, codec))
+                    continue
+                operation = request_operation(request)
+                self.metrics.observe(operation, 'decode', time.perf_counter() - received_at)
+                logging.debug(f"Solicitud {operation} recibida de {address}")
+
+                if operation in SUBSCRIPTION_OPERATIONS:
+                    connection.touch()
+                    await self._handle_subscription_async(send, request, stream_id, codec,
+                                                          subscriptions, received_at)
+                    continue
+
+                rejection = self._admit(connection, address, operation)
+                if rejection is not None:
+                    await send(encode_message(rejection, FRAME_MESSAGE, stream_id, codec))
+                    continue
+
+                connection.begin()
+                if not pipelining:
+                    try:
+                        await self._serve_request_async(send, request, stream_id, address, codec,
+                                                        received_at, connection)
+                    finally:
+                        connection.end()
+                        self.admission.release()
+                    continue
+
+                await in_flight.acquire()
+                task = asyncio.create_task(serve(request, stream_id, received_at))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            reason = 'shutdown' if self.stopping else 'disconnected'
+            for subscription, task in subscriptions.values():
+                self.db_handler.subscriptions.unsubscribe(subscription, reason)
+            if subscriptions:
+                await asyncio.wait([task for subscription, task in subscriptions.values()],
+                                   timeout=SUBSCRIPTION_CLOSE_TIMEOUT)
+
+    async def _handle_subscription_async(self, send, request, stream_id, codec, subscriptions,
+                                         received_at):
+        operation = request_operation(request)
+        hub = self.db_handler.subscriptions
+        data = request.get('data') or {}
+        if operation == 'UNSUBSCRIBE':
+            entry = subscriptions.pop(data.get('stream_id'), None)
+            if entry is None:
+                response = {'status': 'error', 'message': 'No hay ninguna suscripción con ese stream_id'}
+            else:
+                hub.unsubscribe(entry[0])
+                response = {'status': 'success', 'message': 'Suscripción cancelada'}
+            self.metrics.count_request(operation, response)
+            await self._send_response_async(
+                send, operation, received_at,
+                lambda: encode_message(response, FRAME_MESSAGE, stream_id, codec))
+            return
+
+        # Los commits avisan desde los hilos del executor
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        try:
+            if hub is None:
+                raise ValueError('Las suscripciones están desactivadas')
+            if stream_id in subscriptions:
+                raise ValueError('Ya hay una suscripción abierta con ese stream_id')
+            # La primera suscripción consulta la base de datos
+            subscription = await self.run_db(hub.subscribe, data,
+                                             lambda: loop.call_soon_threadsafe(ready.set))
+        except Exception as e:
+            end = {'status': 'error', 'message': str(e)}
+            if hub is not None:
+                end.update(hub.position())
+            self.metrics.count_request(operation, end)
+            await send(encode_message(end, FRAME_END, stream_id, codec))
+            return
+        task = asyncio.create_task(self._push_events_async(send, subscription, ready, stream_id,
+                                                           codec))
+        subscriptions[stream_id] = (subscription, task)
+
+    async def _serve_request_async(self, send, request, stream_id, address, codec, received_at,
+                                   connection=None):
+        operation = request_operation(request)
+        try:
+            if operation == 'SELECT' and request.get('stream'):
+                # El tiempo en cola se mide en el executor, como en el resto
+                end = None
+                if self.admission.queue_timeout is not None:
+                    end = await self.run_db(self.admission.expired, received_at)
+                if end is not None:
+                    await send(encode_message(end, FRAME_END, stream_id, codec))
+                else:
+                    end = await self._send_stream_async(send, request, stream_id, codec,
+                                                        self._reads_from_primary(connection))
+                self.metrics.count_request(operation, end)
+                self.metrics.observe(operation, 'total', time.perf_counter() - received_at)
+            else:
+                response = await self._execute_shared_async(request, address, connection,
+                                                            received_at)
+                await self._send_response_async(
+                    send, operation, received_at,
+                    lambda: encode_frame(FRAME_MESSAGE, response.encoded(codec.name, codec.encode),
+                                         stream_id))
+        except (ConnectionError, OSError) as e:
+            logging.info(f"No se pudo enviar la respuesta a {address}: {e}")
+
+    async def _execute_shared_async(self, request, address, connection=None, received_at=None):
+        key = None
+        if self.single_flight and not self._reads_from_primary(connection):
+            key = coalesce_key(request)
+        if key is None:
+            return SharedResponse(await self.run_db(self._execute, request, address, connection,
+                                                    received_at))
+
+        async def execute():
+            return SharedResponse(await self.run_db(self._execute, request, address, connection,
+                                                    received_at))
+
+        shared, leader = await self.single_flight.do_async(key, execute)
+        if not leader:
+            self.metrics.count_coalesced(request_operation(request), shared.response)
+        return shared
+
+    async def _send_response_async(self, send, operation, received_at, encode):
+        started = time.perf_counter()
+        data = encode()
+        encoded_at = time.perf_counter()
+        await send(data)
+        sent_at = time.perf_counter()
+        self.metrics.observe(operation, 'encode', encoded_at - started)
+        self.metrics.observe(operation, 'send', sent_at - encoded_at)
+        self.metrics.observe(operation, 'total', sent_at - received_at)
+
+    async def _send_stream_async(self, send, request, stream_id, codec, primary=False):
+        data = request.get('data', {})
+        chunk_size = int(request.get('chunk_size') or DEFAULT_CHUNK_SIZE)
+        row_count = 0
+        rows_iter = self.db_handler.iter_employees(data, chunk_size, primary)
+        try:
+            while True:
+                rows = await self.run_db(next, rows_iter, None)
+                if rows is None:
+                    break
+                await send(encode_message({'rows': rows}, FRAME_CHUNK, stream_id, codec))
+                row_count += len(rows)
+        except (ConnectionError, OSError):
+            raise
+        except Exception as e:
+            logging.error(f"Error en SELECT en streaming: {e}")
+            end = {'status': 'error', 'message': str(e), 'row_count': row_count}
+        else:
+            end = {'status': 'success', 'row_count': row_count}
+        finally:
+            await self.run_db(rows_iter.close)
+        await send(encode_message(end, FRAME_END, stream_id, codec))
+        return end
+
+    async def _push_events_async(self, send, subscription, ready, stream_id, codec):
+        hub = self.db_handler.subscriptions
+        first = True
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                events, seq, reason = hub.take(subscription)
+                if seq is not None and (events or first):
+                    payload = {'events': events, 'seq': seq}
+                    if first:
+                        payload = dict(status='success', epoch=hub.epoch, **payload)
+                        first = False
+                    await send(encode_message(payload, FRAME_CHUNK, stream_id, codec))
+                    subscription.delivered_seq = seq
+                if reason:
+                    break
+            end = hub.end_message(subscription)
+            self.metrics.count_request('SUBSCRIBE', end)
+            await send(encode_message(end, FRAME_END, stream_id, codec))
+        except (ConnectionError, OSError) as e:
+            hub.unsubscribe(subscription, 'disconnected')
+            logging.info(f"No se pudieron enviar eventos de la suscripción {stream_id}: {e}")
@@ -0,0 +1,417 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:
+    # Sin bloqueo de archivos (Windows) solo se admite un proceso por journal
+    fcntl = None
+
+EVENT_TYPES = {'in': 'in', 'out': 'out', 'CLOCK_IN': 'in', 'CLOCK_OUT': 'out'}
+JOURNAL_PREFIX = 'asistencias-'
+JOURNAL_SUFFIX = '.journal'
+# Con la cola vacía, el journal se vacía cuando supera este tamaño
+JOURNAL_COMPACT_BYTES = 1 << 20
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+# Un CLOCK_OUT cierra la última entrada abierta del empleado en ese día o el
+# anterior (turnos de noche).
+OPEN_SHIFT_DAYS = 1
+
+
+def parse_event(event, event_type=None):
+    # Valida un evento y lo normaliza a {'tipo', 'empleado_id', 'timestamp'}
+    if not isinstance(event, dict):
+        raise ValueError('El evento no es un objeto')
+    event_type = EVENT_TYPES.get(event_type or event.get('tipo'))
+    if event_type is None:
+        raise ValueError("Tipo de evento inválido (debe ser 'in' o 'out')")
+    try:
+        empleado_id = int(event['empleado_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Falta el empleado_id o no es un número')
+
+    timestamp = event.get('timestamp')
+    if timestamp is None:
+        moment = datetime.now()
+    else:
+        try:
+            moment = datetime.fromisoformat(str(timestamp))
+        except ValueError:
+            raise ValueError(f"Fecha y hora inválidas: {timestamp}")
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+    return {'tipo': event_type, 'empleado_id': empleado_id,
+            'timestamp': moment.replace(microsecond=0).isoformat(' ')}
+
+
+def _as_time(value):
+    # mysql.connector devuelve las columnas TIME como timedelta
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time()
+    return value
+
+
+class Journal:
+    # Archivo en disco con los eventos aceptados que aún no están en la base.
+    # Cada línea es un evento con su número de secuencia o una marca
+    # {"flushed": n} con el último evento ya escrito. Cada proceso usa su
+    # propio archivo, bloqueado mientras vive; al arrancar se recuperan los
+    # eventos pendientes de los archivos que ya no tienen dueño.
+    def __init__(self, directory, fsync=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.path = os.path.join(directory, f"{JOURNAL_PREFIX}{os.getpid()}{JOURNAL_SUFFIX}")
+        self.file = open(self.path, 'a+', encoding='utf-8')
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._orphans = []
+        # Secuencia del último evento escrito y del último llevado a disco
+        self.written = 0
+        self.synced = 0
+        self.syncs = 0
+        self._sync_lock = threading.Lock()
+
+    @staticmethod
+    def _read_pending(file):
+        file.seek(0)
+        events = {}
+        flushed = 0
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Última línea a medio escribir cuando se cayó el proceso
+                continue
+            if 'flushed' in record:
+                flushed = max(flushed, record['flushed'])
+            else:
+                events[record['seq']] = record
+        return [event for seq, event in sorted(events.items()) if seq > flushed]
+
+    def recover(self):
+        # Eventos pendientes de este archivo (si el pid se reutilizó) y de los
+        # journals de procesos que ya no existen, en orden de hora.
+        pending = self._read_pending(self.file)
+        self.file.truncate(0)
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if (path == self.path or not name.startswith(JOURNAL_PREFIX)
+                    or not name.endswith(JOURNAL_SUFFIX)):
+                continue
+            try:
+                file = open(path, 'r+', encoding='utf-8')
+            except OSError:
+                continue
+            if fcntl:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Lo tiene bloqueado otro worker vivo
+                    file.close()
+                    continue
+            pending.extend(self._read_pending(file))
+            # Se mantiene bloqueado hasta que sus eventos estén en este journal
+            self._orphans.append(file)
+        pending.sort(key=lambda event: event['timestamp'])
+        for event in pending:
+            event.pop('seq', None)
+        return pending
+
+    def discard_orphans(self):
+        for file in self._orphans:
+            os.remove(file.name)
+            file.close()
+        self._orphans = []
+
+    def append(self, events):
+        # Con el lock de la cola tomado: solo escribe, el fsync va en sync()
+        self.file.write(''.join(json.dumps(event) + '\n' for event in events))
+        self.file.flush()
+        if events:
+            self.written = max(self.written, events[-1]['seq'])
+
+    def sync(self, sequence):
+        # Fuera del lock de la cola. Un fsync cubre todo lo escrito hasta ese
+        # momento, así que quienes esperan a que termine el de otro suelen
+        # quedar ya cubiertos y los fichajes concurrentes comparten fsync.
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self.synced >= sequence or self.file.closed:
+                return
+            written = self.written
+            os.fsync(self.file.fileno())
+            self.synced = written
+            self.syncs += 1
+
+    def mark_flushed(self, sequence):
+        # Sin fsync: si se pierde la marca, los eventos se vuelven a aplicar
+        # al arrancar y se descartan los que ya estaban escritos.
+        self.file.write(json.dumps({'flushed': sequence}) + '\n')
+        self.file.flush()
+
+    def compact(self):
+        if self.file.tell() > JOURNAL_COMPACT_BYTES:
+            self.file.truncate(0)
+
+    def close(self, empty):
+        with self._sync_lock:
+            self.file.close()
+        if empty:
+            os.remove(self.path)
+
+
+class AttendanceWriter:
+    # Cola acotada de fichajes (entradas y salidas) que se confirman al
+    # cliente en cuanto están en la cola y en el journal. Un hilo los escribe
+    # en `asistencias` por lotes: INSERT multi-fila para las entradas y
+    # UPDATE de hora_salida para las salidas. Si la cola está llena, las
+    # peticiones esperan hasta enqueue_timeout y después se rechazan con
+    # status 'busy'.
+    def __init__(self, handler, max_queue=10000, max_batch=500, flush_interval=0.5,
+                 enqueue_timeout=2.0, journal_dir=None, fsync=True):
+        self.handler = handler
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stopped = threading.Event()
+        self.sequence = 0
+        self.accepted = 0
+        self.written = 0
+        self.rejected = 0
+        self.unmatched = 0
+        self.busy = 0
+        self.batches = 0
+        self.replayed = 0
+
+        self.journal = Journal(journal_dir, fsync) if journal_dir else None
+        if self.journal:
+            recovered = self.journal.recover()
+            if recovered:
+                for event in recovered:
+                    event['replayed'] = True
+                with self._condition:
+                    sequence = self._enqueue(recovered)
+                self.journal.sync(sequence)
+                self.replayed = len(recovered)
+                logging.warning(f"Recuperados {len(recovered)} fichajes pendientes del journal")
+            self.journal.discard_orphans()
+
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, events):
+        # Devuelve la secuencia del último evento, o None si la cola sigue
+        # llena después de enqueue_timeout.
+        if len(events) > self.max_queue:
+            raise ValueError(f"Demasiados eventos en una petición (máximo {self.max_queue})")
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._condition:
+            while len(self._queue) + len(events) > self.max_queue and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.busy += 1
+                    return None
+                self._condition.wait(remaining)
+            if self._closed:
+                raise RuntimeError("El registro de asistencias está cerrado")
+            sequence = self._enqueue(events)
+        if self.journal:
+            # Se confirma al cliente cuando sus eventos están en disco
+            self.journal.sync(sequence)
+        return sequence
+
+    def _enqueue(self, events):
+        # Se llama con self._condition tomado
+        for event in events:
+            self.sequence += 1
+            event['seq'] = self.sequence
+        if self.journal:
+            self.journal.append(events)
+        self._queue.extend(events)
+        self.accepted += len(events)
+        self._condition.notify_all()
+        return self.sequence
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return list(islice(self._queue, self.max_batch))
+
+    def _run(self):
+        delay = RETRY_DELAY
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Los eventos siguen en la cola (y en el journal) hasta que se
+                # puedan escribir; mientras, la cola se llena y frena a los clientes.
+                if self._closed:
+                    logging.error(f"No se pudieron escribir {len(self._queue)} fichajes al cerrar; "
+                                  f"quedan en el journal: {e}")
+                    return
+                logging.error(f"Error escribiendo asistencias, se reintenta en {delay:.0f} s: {e}")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = RETRY_DELAY
+            with self._condition:
+                for _ in batch:
+                    self._queue.popleft()
+                if self.journal:
+                    self.journal.mark_flushed(batch[-1]['seq'])
+                    if not self._queue:
+                        self.journal.compact()
+                self._condition.notify_all()
+
+    def _write(self, batch):
+        handler = self.handler
+        with handler._transaction() as cursor:
+            cursor.execute("SAVEPOINT attendance_batch")
+            try:
+                counts = self._apply(cursor, batch)
+                cursor.execute("RELEASE SAVEPOINT attendance_batch")
+            except handler.backend.Error as err:
+                # Algún evento no se puede aplicar (p. ej. un empleado que no
+                # existe): se repite evento a evento para descartar solo esos.
+                logging.warning(f"Lote de asistencias fallido, se aplica evento a evento: {err}")
+                cursor.execute("ROLLBACK TO SAVEPOINT attendance_batch")
+                counts = self._apply_each(cursor, batch)
+        written, unmatched, rejected = counts
+        self.written += written
+        self.unmatched += unmatched
+        self.rejected += rejected
+        self.batches += 1
+
+    def _apply_each(self, cursor, batch):
+        written = unmatched = rejected = 0
+        for event in batch:
+            cursor.execute("SAVEPOINT attendance_event")
+            try:
+                event_written, event_unmatched, _ = self._apply(cursor, [event])
+                cursor.execute("RELEASE SAVEPOINT attendance_event")
+                written += event_written
+                unmatched += event_unmatched
+            except self.handler.backend.Error as err:
+                cursor.execute("ROLLBACK TO SAVEPOINT attendance_event")
+                logging.warning(f"Fichaje descartado (empleado {event['empleado_id']}): {err}")
+                rejected += 1
+        return written, unmatched, rejected
+
+    def _apply(self, cursor, batch):
+        events = [(event, datetime.fromisoformat(event['timestamp'])) for event in batch]
+        earliest = min(moment for _, moment in events).date() - timedelta(days=OPEN_SHIFT_DAYS)
+        open_shifts = self._open_shifts(
+            cursor, {event['empleado_id'] for event, _ in events if event['tipo'] == 'out'}, earliest)
+        existing = self._existing_entries(
+            cursor, {event['empleado_id'] for event, _ in events
+                     if event['tipo'] == 'in' and event.get('replayed')}, earliest)
+
+        inserts = []
+        updates = []
+        pending_entries = {}
+        unmatched = 0
+        for event, moment in events:
+            empleado_id = event['empleado_id']
+            if event['tipo'] == 'in':
+                # Un evento recuperado del journal que ya se escribió antes de
+                # la caída no se duplica.
+                if event.get('replayed') and (empleado_id, moment.date(), moment.time()) in existing:
+                    continue
+                row = [moment.date(), moment.time(), None, 'presente', empleado_id]
+                inserts.append(row)
+                pending_entries[empleado_id] = row
+                continue
+
+            row = pending_entries.pop(empleado_id, None)
+            if row is not None:
+                row[2] = moment.time()
+                continue
+            asistencia_id = open_shifts.pop(empleado_id, None)
+            if asistencia_id is None:
+                if not event.get('replayed'):
+                    logging.warning(f"Salida sin entrada abierta del empleado {empleado_id}")
+                unmatched += 1
+            else:
+                updates.append((moment.time(), asistencia_id))
+
+        if inserts:
+            cursor.executemany("""
+                INSERT INTO asistencias (fecha, hora_entrada, hora_salida, estado, empleado_id)
+                VALUES (%s, %s, %s, %s, %s)
+            """, inserts)
+        if updates:
+            cursor.executemany("UPDATE asistencias SET hora_salida = %s WHERE id = %s", updates)
+        return len(batch) - unmatched, unmatched, 0
+
+    def _open_shifts(self, cursor, employee_ids, since):
+        # Última entrada sin salida de cada empleado
+        if not employee_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(employee_ids))
+        cursor.execute(f"""
+            SELECT id, empleado_id FROM asistencias
+            WHERE hora_salida IS NULL AND fecha >= %s AND empleado_id IN ({placeholders})
+            ORDER BY fecha, hora_entrada, id
+        """, [since, *employee_ids])
+        return {empleado_id: asistencia_id for asistencia_id, empleado_id in cursor.fetchall()}
+
+    def _existing_entries(self, cursor, employee_ids, since):
+        if not employee_ids:
+            return set()
+        placeholders = ', '.join(['%s'] * len(employee_ids))
+        cursor.execute(f"""
+            SELECT empleado_id, fecha, hora_entrada FROM asistencias
+            WHERE fecha >= %s AND empleado_id IN ({placeholders})
+        """, [since, *employee_ids])
+        return {(empleado_id, fecha, _as_time(hora_entrada))
+                for empleado_id, fecha, hora_entrada in cursor.fetchall()}
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'accepted': self.accepted,
+                'written': self.written,
+                'unmatched': self.unmatched,
+                'rejected': self.rejected,
+                'busy': self.busy,
+                'batches': self.batches,
+                'replayed': self.replayed,
+                'journal': self.journal.path if self.journal else None,
+                'journal_syncs': self.journal.syncs if self.journal else 0
+            }
+
+    def close(self):
+        # Escribe lo que queda en la cola antes de terminar; el journal solo
+        # se borra si no quedó nada pendiente.
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._stopped.set()
+        self._thread.join()
+        if self.journal:
+            self.journal.close(empty=not self._queue)
@@ -0,0 +1,334 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, time
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'schema.sql')
+
+# Los mismos datos iniciales que inserta create_database.py en MySQL
+INITIAL_DATA = (
+    "INSERT INTO departamentos (nombre) VALUES ('Recursos Humanos')",
+    "INSERT INTO cargo (titulo, descripcion, departamento_id) "
+    "VALUES ('Director RRHH', 'Director del departamento de RRHH', 1)",
+    "INSERT INTO tipos_permisos (nombre, descripcion) "
+    "VALUES ('Vacaciones', 'Permiso por vacaciones anuales')"
+)
+
+
+class MySQLBackend:
+    # Backend de producción: conexiones mysql.connector en modo autocommit
+    name = 'mysql'
+
+    def __init__(self, config, initialize=True):
+        # Import diferido: el backend SQLite no necesita el conector de MySQL
+        import mysql.connector
+        self._connector = mysql.connector
+        self.Error = mysql.connector.Error
+        self.config = config
+        self.pool_limit = None
+
+    def connect(self):
+        try:
+            # autocommit evita que las lecturas dejen transacciones abiertas en
+            # conexiones del pool; las escrituras abren la suya explícitamente.
+            return self._connector.connect(
+                host=self.config['host'],
+                port=int(self.config.get('port', 3306)),
+                database=self.config['database'],
+                user=self.config['user'],
+                password=self.config['password'],
+                autocommit=True
+            )
+        except self.Error as err:
+            logging.error(f"Error conectando a la base de datos: {err}")
+            raise
+
+    def is_alive(self, connection):
+        return connection.is_connected()
+
+    def reset(self, connection):
+        if connection.unread_result:
+            connection.consume_results()
+        if connection.in_transaction:
+            connection.rollback()
+
+    def begin(self, connection):
+        connection.start_transaction()
+
+    def close(self):
+        pass
+
+
+def _adapt_datetime(value):
+    return value.isoformat(' ')
+
+
+def _convert_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _convert_time(value):
+    return time.fromisoformat(value.decode())
+
+
+# Los adaptadores por defecto de sqlite3 están obsoletos desde Python 3.12;
+# se registran explícitamente para devolver los mismos tipos que MySQL.
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(time, time.isoformat)
+sqlite3.register_converter('DATE', _convert_date)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('TIME', _convert_time)
+
+_NAMED_PARAM = re.compile(r'%\((\w+)\)s')
+
+
+def translate_query(query):
+    # Marcadores de mysql.connector (%s, %(nombre)s) a los de sqlite3 (?, :nombre)
+    # SQLite no tiene bloqueos de fila: BEGIN IMMEDIATE ya serializa las
+    # transacciones de escritura, así que FOR UPDATE se quita.
+    query = _NAMED_PARAM.sub(r':\1', query).replace(' FOR UPDATE', '')
+    return query.replace('%s', '?').replace('%%', '%')
+
+
+class SQLiteCursor:
+    # Imita la parte de la API de cursores de mysql.connector que usa el servidor
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self.dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate_query(query), params or ())
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(translate_query(query), seq_params)
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, connection):
+        self._connection = connection
+        self.unread_result = False
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._connection.in_transaction
+
+    def start_transaction(self):
+        # IMMEDIATE toma el bloqueo de escritura al empezar y evita fallos
+        # al promocionar una transacción de lectura a escritura.
+        self._connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        self._connection.close()
+
+
+def translate_schema(schema):
+    # Traduce schema.sql (MySQL) a sentencias que acepta SQLite
+    statements = []
+    indexes = []
+    tables_with_updated_at = []
+    for command in schema.split(';'):
+        command = '\n'.join(line for line in command.splitlines()
+                            if not line.strip().startswith('--')).strip()
+        if not command:
+            continue
+        upper = command.upper()
+        # Sin bases de datos con nombre ni ALTER TABLE ... ADD FOREIGN KEY
+        if upper.startswith(('CREATE DATABASE', 'USE ', 'ALTER TABLE')):
+            continue
+
+        table = re.match(r'CREATE TABLE (\w+)', command, re.IGNORECASE)
+        for name, columns in re.findall(r'^\s*INDEX (\w+) \(([^)]*)\),?\s*$', command, re.MULTILINE):
+            indexes.append(f"CREATE INDEX {name} ON {table.group(1)} ({columns})")
+        command = re.sub(r',?\s*^\s*INDEX \w+ \([^)]*\),?\s*$', '', command, flags=re.MULTILINE)
+        # Si se quitó el último elemento, puede quedar una coma colgando
+        command = re.sub(r',(\s*)\)$', r'\1)', command)
+
+        # InnoDB crea un índice para cada clave foránea; SQLite no, y sin él
+        # cada JOIN por esa columna recorre la tabla entera.
+        if table:
+            for column in re.findall(r'FOREIGN KEY \((\w+)\)', command, re.IGNORECASE):
+                indexes.append(f"CREATE INDEX idx_{table.group(1)}_{column} "
+                               f"ON {table.group(1)} ({column})")
+
+        command = re.sub(r'INT PRIMARY KEY AUTO_INCREMENT', 'INTEGER PRIMARY KEY AUTOINCREMENT',
+                         command, flags=re.IGNORECASE)
+        command = re.sub(r'ENUM\([^)]*\)', 'TEXT', command, flags=re.IGNORECASE)
+        if re.search(r'ON UPDATE CURRENT_TIMESTAMP', command, re.IGNORECASE):
+            command = re.sub(r'\s*ON UPDATE CURRENT_TIMESTAMP', '', command, flags=re.IGNORECASE)
+            if table:
+                tables_with_updated_at.append(table.group(1))
+        statements.append(command)
+
+    statements.extend(indexes)
+    # ON UPDATE CURRENT_TIMESTAMP se emula con un trigger por tabla
+    for table in tables_with_updated_at:
+        statements.append(f"""
+            CREATE TRIGGER trg_{table}_updated_at AFTER UPDATE ON {table}
+            FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+            BEGIN
+                UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END""")
+    return statements
+
+
+class SQLiteBackend:
+    # Backend local para pruebas de rendimiento y CI: no necesita un servidor
+    # MySQL y crea el esquema a partir de schema.sql al arrancar.
+    name = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, config, initialize=True):
+        # initialize=False (workers del modo multiproceso) usa el archivo tal
+        # como lo dejó el supervisor, sin borrarlo ni crear el esquema.
+        self.path = config.get('path', ':memory:')
+        self.schema_path = config.get('schema', SCHEMA_PATH)
+        self.busy_timeout = float(config.get('busy_timeout', 30))
+        self.initial_data = config.get('initial_data', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.memory = self.path == ':memory:'
+        self._keeper = None
+        self._lock = threading.Lock()
+        # SQLite en memoria compartida bloquea por tabla sin esperar a que se
+        # libere, así que se usa una única conexión para todo el pool.
+        self.pool_limit = 1 if self.memory else None
+
+        if self.memory:
+            self._uri = f"file:rh_socket_system_{id(self)}?mode=memory&cache=shared"
+            # La base en memoria vive mientras haya una conexión abierta
+            self._keeper = self._open()
+        elif not initialize:
+            return
+        elif config.get('reset', 'false').lower() in ('1', 'true', 'yes', 'on'):
+            for path in (self.path, self.path + '-wal', self.path + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._create_schema()
+
+    def _open(self):
+        if self.memory:
+            connection = sqlite3.connect(self._uri, uri=True, isolation_level=None,
+                                         check_same_thread=False,
+                                         detect_types=sqlite3.PARSE_DECLTYPES)
+        else:
+            connection = sqlite3.connect(self.path, isolation_level=None,
+                                         check_same_thread=False, timeout=self.busy_timeout,
+                                         detect_types=sqlite3.PARSE_DECLTYPES)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+    def _create_schema(self):
+        connection = self._keeper or self._open()
+        try:
+            with self._lock:
+                exists = connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'empleados'"
+                ).fetchone()
+                if exists:
+                    return
+                with open(self.schema_path, 'r') as file:
+                    statements = translate_schema(file.read())
+                connection.execute('BEGIN IMMEDIATE')
+                for statement in statements:
+                    connection.execute(statement)
+                if self.initial_data:
+                    for statement in INITIAL_DATA:
+                        connection.execute(statement)
+                connection.execute('COMMIT')
+                logging.info(f"Esquema SQLite creado en {self.path}")
+        finally:
+            if connection is not self._keeper:
+                connection.close()
+
+    def connect(self):
+        try:
+            return SQLiteConnection(self._open())
+        except self.Error as err:
+            logging.error(f"Error conectando a la base de datos: {err}")
+            raise
+
+    def is_alive(self, connection):
+        try:
+            connection.cursor().execute('SELECT 1')
+            return True
+        except self.Error:
+            return False
+
+    def reset(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+
+    def begin(self, connection):
+        connection.start_transaction()
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend
+}
+
+
+def create_backend(config, initialize=True, overrides=None):
+    # [database] backend = mysql | sqlite; cada backend lee su propia sección.
+    # overrides cambia algunas claves de esa sección (p. ej. el host de una
+    # réplica, que comparte usuario y base de datos con el primario).
+    name = config.get('database', 'backend', fallback='mysql').lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de base de datos desconocido: {name}")
+    section = dict(config[name]) if config.has_section(name) else {}
+    if overrides:
+        section.update(overrides)
+    return BACKENDS[name](section, initialize)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class EmployeeCache:
+    # Caché LRU con TTL para las consultas de un empleado por id o por email.
+    # Cada entrada se guarda bajo todas sus claves (id y email) para poder
+    # invalidarla por cualquiera de ellas.
+    def __init__(self, max_size=10000, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key_for(data):
+        # Solo se cachean las búsquedas simples por id o por email
+        if len(data) != 1:
+            return None
+        if 'id' in data:
+            try:
+                return ('id', int(data['id']))
+            except (TypeError, ValueError):
+                return None
+        if 'email' in data:
+            return ('email', data['email'])
+        return None
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, rows, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(entry)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rows
+
+    def put(self, key, rows, generation):
+        # Si hubo una invalidación mientras se consultaba la base de datos,
+        # el resultado puede estar desactualizado y no se guarda.
+        keys = {key}
+        for row in rows:
+            if row.get('id') is not None:
+                keys.add(('id', row['id']))
+            if row.get('email') is not None:
+                keys.add(('email', row['email']))
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            for existing in keys:
+                if existing in self._entries:
+                    self._remove(self._entries[existing])
+            entry = (time.monotonic() + self.ttl, rows, tuple(keys))
+            for entry_key in keys:
+                self._entries[entry_key] = entry
+            while len(self._entries) > self.max_size:
+                _, oldest = self._entries.popitem(last=False)
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, ids=(), emails=()):
+        keys = [('id', int(employee_id)) for employee_id in ids if employee_id is not None]
+        keys += [('email', email) for email in emails if email is not None]
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._remove(entry)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            size = len(self._entries)
+            self._entries.clear()
+            return size
+
+    def _remove(self, entry):
+        for key in entry[2]:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def on_commit(self, changes):
+        ids = []
+        emails = []
+        for change in changes:
+            ids.append(change.get('id'))
+            data = change.get('data') or {}
+            emails.append(data.get('email'))
+        self.invalidate(ids, emails)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
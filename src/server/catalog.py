@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from connection_pool import PoolTimeoutError
+
+# Tablas de referencia que se mantienen en memoria y sus columnas
+CATALOG_TABLES = {
+    'departamentos': ('id', 'nombre', 'jefe_id', 'created_at', 'updated_at'),
+    'cargo': ('id', 'titulo', 'descripcion', 'departamento_id', 'created_at', 'updated_at'),
+    'tipos_permisos': ('id', 'nombre', 'descripcion', 'estado', 'created_at', 'updated_at')
+}
+
+# Columnas del SELECT de empleados que se resuelven con el catálogo en lugar
+# de con un JOIN: campo -> (columna de empleados, tabla, columna del nombre)
+CATALOG_FIELDS = {
+    'departamento': ('departamento_id', 'departamentos', 'nombre'),
+    'cargo': ('cargo_id', 'cargo', 'titulo')
+}
+# Un id que no está en el catálogo provoca un refresco inmediato, como mucho
+# uno por este intervalo (segundos) para no consultar la base en cada SELECT.
+MISS_REFRESH_INTERVAL = 1.0
+# Ese refresco puede pedirse con otra conexión del pool ya prestada (SELECT en
+# streaming): si no hay una libre enseguida no se espera y el nombre queda nulo
+MISS_ACQUIRE_TIMEOUT = 0.1
+
+
+class CatalogSnapshot:
+    # Copia inmutable de las tablas de referencia. Cada refresco con cambios
+    # crea una nueva con otra versión; los lectores nunca ven una a medias.
+    def __init__(self, version, tables):
+        self.version = version
+        self.tables = tables
+        self.lists = {name: [rows[key] for key in sorted(rows)] for name, rows in tables.items()}
+
+    def get(self, table, row_id):
+        return self.tables[table].get(row_id)
+
+
+class ReferenceCatalog:
+    # Departamentos, cargos y tipos de permiso en memoria. Se cargan al
+    # arrancar y un hilo los refresca cada refresh_interval segundos pidiendo
+    # solo las filas con updated_at posterior al último visto; si el número de
+    # filas no cuadra (se borró alguna) la tabla se vuelve a cargar entera.
+    def __init__(self, handler, refresh_interval=30.0, on_change=None):
+        self.handler = handler
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+        self.snapshot = CatalogSnapshot(0, {name: {} for name in CATALOG_TABLES})
+        self.ready = False
+        self.refreshes = 0
+        self.full_reloads = 0
+        self._refreshed_at = 0.0
+        self._watermarks = {}
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.refresh()
+        if self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='catalog-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def refresh(self, timeout=None):
+        # Devuelve True si hubo cambios. Los errores se registran y se sigue
+        # sirviendo la última copia. timeout: espera máxima por una conexión
+        with self._refresh_lock:
+            try:
+                with self.handler._cursor(timeout=timeout) as cursor:
+                    tables, changed, watermarks = self._load(cursor)
+            except PoolTimeoutError:
+                logging.warning("Catálogo de referencia no refrescado: no hay conexiones libres")
+                self._refreshed_at = time.monotonic()
+                return False
+            except self.handler.backend.Error as err:
+                logging.error(f"Error refrescando el catálogo de referencia: {err}")
+                return False
+            self._watermarks = watermarks
+            self.refreshes += 1
+            self._refreshed_at = time.monotonic()
+            self.ready = True
+            if not changed:
+                return False
+            self.snapshot = CatalogSnapshot(self.snapshot.version + 1, tables)
+        logging.info(f"Catálogo de referencia actualizado (versión {self.snapshot.version})")
+        if self.on_change:
+            self.on_change(self.snapshot)
+        return True
+
+    def _load(self, cursor):
+        tables = {}
+        watermarks = {}
+        changed = False
+        for name, columns in CATALOG_TABLES.items():
+            current = self.snapshot.tables[name]
+            watermark = self._watermarks.get(name)
+            query = f"SELECT {', '.join(columns)} FROM {name}"
+            if watermark is None:
+                rows = self._load_all(cursor, query)
+            else:
+                # >= para no perder cambios hechos en el mismo segundo que el
+                # último refresco; volver a aplicar una fila no cambia nada.
+                cursor.execute(query + " WHERE updated_at >= %s", (watermark,))
+                rows = dict(current)
+                rows.update((row['id'], row) for row in cursor.fetchall())
+                cursor.execute(f"SELECT COUNT(*) AS total FROM {name}")
+                if cursor.fetchone()['total'] != len(rows):
+                    self.full_reloads += 1
+                    rows = self._load_all(cursor, query)
+
+            if rows == current:
+                rows = current
+            else:
+                changed = True
+            tables[name] = rows
+            stamps = [row['updated_at'] for row in rows.values() if row.get('updated_at')]
+            watermarks[name] = max(stamps) if stamps else watermark
+        return tables, changed, watermarks
+
+    def _load_all(self, cursor, query):
+        cursor.execute(query)
+        return {row['id']: row for row in cursor.fetchall()}
+
+    def resolve(self, rows, fields, hidden=()):
+        # Añade a cada fila los nombres pedidos (departamento, cargo) a partir
+        # de su id. Si falta algún id se refresca una vez antes de darlo por nulo.
+        lookups = [(field,) + CATALOG_FIELDS[field] for field in fields]
+        if (not self._fill(rows, lookups)
+                and time.monotonic() - self._refreshed_at >= MISS_REFRESH_INTERVAL
+                and self.refresh(MISS_ACQUIRE_TIMEOUT)):
+            self._fill(rows, lookups)
+        if hidden:
+            for row in rows:
+                for column in hidden:
+                    del row[column]
+        return rows
+
+    def _fill(self, rows, lookups):
+        # Devuelve False si algún id no está en el catálogo
+        snapshot = self.snapshot
+        complete = True
+        for row in rows:
+            for field, id_column, table, column in lookups:
+                row_id = row.get(id_column)
+                entry = snapshot.get(table, row_id)
+                if entry is None:
+                    row[field] = None
+                    complete = complete and row_id is None
+                else:
+                    row[field] = entry[column]
+        return complete
+
+    def list(self, table, **filters):
+        snapshot = self.snapshot
+        rows = snapshot.lists[table]
+        for column, value in filters.items():
+            if value is not None:
+                rows = [row for row in rows if row.get(column) == value]
+        return snapshot.version, rows
+
+    def stats(self):
+        return {
+            'version': self.snapshot.version,
+            'ready': self.ready,
+            'refreshes': self.refreshes,
+            'full_reloads': self.full_reloads,
+            'rows': {name: len(rows) for name, rows in self.snapshot.tables.items()}
+        }
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+
+# Operaciones de solo lectura cuyas peticiones idénticas en curso se agrupan
+COALESCED_OPERATIONS = ('SELECT', 'PAYROLL_REPORT')
+
+
+def coalesce_key(request):
+    # Clave de la petición normalizada, o None si no se puede agrupar (las
+    # consultas en streaming envían frames propios a cada cliente).
+    if (not isinstance(request, dict) or request.get('operation') not in COALESCED_OPERATIONS
+            or request.get('stream')):
+        return None
+    try:
+        return request['operation'] + json.dumps(request.get('data', {}), sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+class SharedResponse:
+    # Respuesta compartida por todas las peticiones agrupadas: se codifica una
+    # sola vez por formato (json, binary o el JSON del protocolo antiguo).
+    def __init__(self, response):
+        self.response = response
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, name, encode):
+        with self._lock:
+            payload = self._encoded.get(name)
+            if payload is None:
+                payload = self._encoded[name] = encode(self.response)
+        return payload
+
+
+class InFlightCall:
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.task = None
+
+
+class SingleFlight:
+    # Si llega una petición idéntica a otra que aún se está ejecutando, espera
+    # su resultado en lugar de repetir la consulta. Cada commit cambia de
+    # generación: una petición que llega después de un cambio no se une a una
+    # ejecución que empezó antes, y así siempre ve sus propias escrituras.
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def invalidate(self, changes=None):
+        # Listener de commits de DatabaseHandler
+        with self._lock:
+            self.generation += 1
+
+    def _join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.generation == self.generation:
+                return call, False
+            call = self._calls[key] = InFlightCall(self.generation)
+            return call, True
+
+    def _leave(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key, func):
+        # Devuelve (resultado, True si esta petición ejecutó la consulta)
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._leave(key, call)
+            call.done.set()
+        return call.result, True
+
+    async def do_async(self, key, func):
+        # Variante para el bucle de eventos: func es una corutina y las
+        # peticiones agrupadas esperan la misma tarea sin bloquear el bucle.
+        call, leader = self._join(key)
+        if leader:
+            call.task = asyncio.ensure_future(func())
+            call.task.add_done_callback(lambda task: self._leave(key, call))
+        return await asyncio.shield(call.task), leader
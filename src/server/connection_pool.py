@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    # Pool genérico: no sabe nada de MySQL, recibe funciones para crear,
+    # validar, limpiar y cerrar conexiones.
+    def __init__(self, factory, validate=None, reset=None, close=None,
+                 min_size=1, max_size=10, timeout=30.0, health_check=True,
+                 health_check_idle=5.0, max_idle=300.0, max_lifetime=3600.0,
+                 reap_interval=30.0, on_wait=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Tamaños de pool inválidos: min={min_size}, max={max_size}")
+        self.factory = factory
+        self.validate = validate
+        self.reset = reset
+        self._close = close or (lambda connection: connection.close())
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.health_check_idle = health_check_idle
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        # Recibe los segundos que cada acquire esperó una conexión libre
+        self.on_wait = on_wait
+
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append(PooledConnection(self.factory()))
+            self._size += 1
+
+        self._reaper = None
+        if reap_interval:
+            self._reaper = threading.Thread(target=self._reap_loop, args=(reap_interval,),
+                                            name='pool-reaper', daemon=True)
+            self._reaper.start()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled.connection
+        finally:
+            self.release(pooled)
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("El pool de conexiones está cerrado")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No hay conexiones libres tras esperar {timeout} segundos")
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if self.on_wait:
+            self.on_wait(time.monotonic() - started)
+        try:
+            if pooled is None:
+                return PooledConnection(self.factory())
+            if self._is_usable(pooled):
+                return pooled
+            self._discard(pooled.connection)
+            return PooledConnection(self.factory())
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, pooled):
+        try:
+            if self.reset:
+                self.reset(pooled.connection)
+        except Exception as e:
+            logging.warning(f"Descartando conexión que no se pudo limpiar: {e}")
+            self._discard(pooled.connection)
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                self._discard(pooled.connection)
+            else:
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    def _is_usable(self, pooled):
+        now = time.monotonic()
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return False
+        if self.max_idle and now - pooled.last_used > self.max_idle:
+            return False
+        if (self.health_check and self.validate
+                and now - pooled.last_used >= self.health_check_idle):
+            try:
+                return self.validate(pooled.connection)
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            self._close(connection)
+        except Exception:
+            pass
+
+    def _reap_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            if self._closed:
+                return
+            try:
+                self.reap()
+            except Exception as e:
+                logging.error(f"Error en el mantenimiento del pool: {e}")
+
+    def reap(self):
+        # Cierra las conexiones inactivas o viejas y repone el mínimo
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            keep = deque()
+            for pooled in self._idle:
+                stale = ((self.max_idle and now - pooled.last_used > self.max_idle)
+                         or (self.max_lifetime and now - pooled.created_at > self.max_lifetime))
+                if stale:
+                    expired.append(pooled)
+                    self._size -= 1
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+
+        for pooled in expired:
+            self._discard(pooled.connection)
+
+        for _ in range(missing):
+            try:
+                pooled = PooledConnection(self.factory())
+            except Exception as e:
+                logging.error(f"No se pudo reponer una conexión del pool: {e}")
+                with self._condition:
+                    self._size -= 1
+                continue
+            with self._condition:
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'max_size': self.max_size
+            }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._discard(pooled.connection)
@@ -1,244 +1,1104 @@
+import base64
 import json
-import mysql.connector
 import configparser
 import os
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime, date
+from backends import create_backend
+from connection_pool import ConnectionPool, PoolTimeoutError
+from attendance import AttendanceWriter, parse_event
+from cache import EmployeeCache
+from catalog import ReferenceCatalog, CATALOG_FIELDS, CATALOG_TABLES
+from group_commit import GroupCommitWriter
+from leave import LeaveIndex, parse_moment, parse_range
+from payroll import PayrollEngine, np
+from workforce import WorkforceIndex
+from replicas import Replica, ReplicaSet
+from search import SearchIndex, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT
+from subscriptions import SubscriptionHub
 
-class DatabaseHandler:
-    def __init__(self):
-        self.config = self._read_config()
-        self.connection = None
-        self._connect()
+EMPLOYEE_REQUIRED_FIELDS = ('primer_nombre', 'primer_apellido', 'email', 'celular',
+                            'fecha_contratacion', 'departamento_id', 'cargo_id')
+EMPLOYEE_UPDATABLE_FIELDS = ('primer_nombre', 'segundo_nombre', 'primer_apellido',
+                             'segundo_apellido', 'email', 'celular', 'fecha_contratacion',
+                             'estado', 'departamento_id', 'cargo_id')
+SALARY_FIELDS = ('salario_base', 'bonificaciones', 'deducciones')
+
+# Columnas que se pueden pedir en un SELECT y su expresión SQL
+SELECT_COLUMNS = {
+    'id': 'e.id',
+    'primer_nombre': 'e.primer_nombre',
+    'segundo_nombre': 'e.segundo_nombre',
+    'primer_apellido': 'e.primer_apellido',
+    'segundo_apellido': 'e.segundo_apellido',
+    'email': 'e.email',
+    'celular': 'e.celular',
+    'fecha_contratacion': 'e.fecha_contratacion',
+    'estado': 'e.estado',
+    'created_at': 'e.created_at',
+    'updated_at': 'e.updated_at',
+    'departamento_id': 'e.departamento_id',
+    'cargo_id': 'e.cargo_id',
+    'salario_base': 's.salario_base',
+    'bonificaciones': 's.bonificaciones',
+    'deducciones': 's.deducciones',
+    'salario_total': 's.salario_total',
+    'departamento': 'd.nombre',
+    'cargo': 'c.titulo'
+}
+FETCH_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+
+
+def encode_page_cursor(last_id):
+    payload = json.dumps({'after_id': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_page_cursor(cursor):
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['after_id'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor de paginación inválido")
 
-    def _read_config(self):
-        config = configparser.ConfigParser()
+
+def read_config(config_path=None):
+    config = configparser.ConfigParser()
+    if config_path is None:
         config_path = os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'database.ini')
-        config.read(config_path)
-        return config['mysql']
+    config.read(config_path)
+    return config
 
-    def _connect(self):
-        try:
-            self.connection = mysql.connector.connect(
-                host=self.config['host'],
-                database=self.config['database'],
-                user=self.config['user'],
-                password=self.config['password']
+
+class DatabaseHandler:
+    # cache=False desactiva la caché de empleados aunque esté activada en la
+    # configuración: en modo multiproceso cada worker tendría la suya y no se
+    # enteraría de las escrituras hechas a través de los demás.
+    def __init__(self, config_path=None, initialize=True, cache=True):
+        config = read_config(config_path)
+        self.backend = create_backend(config, initialize)
+        self.pool = self._create_pool(config['pool'] if config.has_section('pool') else {})
+        self.bulk_batch_size = config.getint('bulk', 'batch_size', fallback=500)
+        self._commit_listeners = []
+        self._last_commit = 0.0
+
+        # Réplicas de lectura: una sección [replica:nombre] por réplica con
+        # las claves que cambian respecto a la del primario (host, port, path)
+        self.replicas = None
+        self.read_your_writes = 0.0
+        replica_sections = [name for name in config.sections() if name.startswith('replica:')]
+        if replica_sections:
+            self.replicas = ReplicaSet(
+                [self._create_replica(config, name) for name in replica_sections],
+                selection=config.get('replicas', 'selection', fallback='round_robin'),
+                health_check_interval=config.getfloat('replicas', 'health_check_interval',
+                                                      fallback=5),
+                acquire_timeout=config.getfloat('replicas', 'acquire_timeout', fallback=1)
             )
-        except mysql.connector.Error as err:
-            logging.error(f"Error conectando a la base de datos: {err}")
-            raise
+            self.replicas.start()
+            # Segundos tras una escritura en los que una sesión lee del
+            # primario y las lecturas de réplicas no se guardan en la caché
+            self.read_your_writes = config.getfloat('replicas', 'read_your_writes', fallback=2)
 
-    def _ensure_connection(self):
-        if not self.connection or not self.connection.is_connected():
-            self._connect()
+        self.cache = None
+        if cache and config.getboolean('cache', 'enabled', fallback=True):
+            self.cache = EmployeeCache(
+                max_size=config.getint('cache', 'max_size', fallback=10000),
+                ttl=config.getfloat('cache', 'ttl', fallback=60)
+            )
+            self.add_commit_listener(self.cache.on_commit)
 
-    def insert_employee(self, data):
-        try:
-            self._ensure_connection()
-            cursor = self.connection.cursor(dictionary=True)
+        # Departamentos, cargos y tipos de permiso en memoria: los SELECT
+        # resuelven los nombres sin JOIN y los LIST_* no consultan la base.
+        self.catalog = None
+        if config.getboolean('catalog', 'enabled', fallback=True):
+            self.catalog = ReferenceCatalog(
+                self,
+                refresh_interval=config.getfloat('catalog', 'refresh_interval', fallback=30),
+                on_change=self._on_catalog_change
+            )
+            self.catalog.start()
 
-            insert_query = """
-            INSERT INTO empleados (
-                primer_nombre, segundo_nombre, primer_apellido, segundo_apellido,
-                email, celular, fecha_contratacion, departamento_id, cargo_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            insert_values = (
-                data['primer_nombre'],
-                data['segundo_nombre'],
-                data['primer_apellido'],
-                data['segundo_apellido'],
-                data['email'],
-                data['celular'],
-                data['fecha_contratacion'],
-                data['departamento_id'],
-                data['cargo_id']
+        # Fichajes: se confirman al cliente desde una cola acotada y un hilo
+        # los escribe en asistencias por lotes.
+        self.attendance = None
+        if config.getboolean('attendance', 'enabled', fallback=True):
+            self.attendance = AttendanceWriter(
+                self,
+                max_queue=config.getint('attendance', 'max_queue', fallback=10000),
+                max_batch=config.getint('attendance', 'max_batch', fallback=500),
+                flush_interval=config.getfloat('attendance', 'flush_interval', fallback=0.5),
+                enqueue_timeout=config.getfloat('attendance', 'enqueue_timeout', fallback=2),
+                journal_dir=config.get('attendance', 'journal_dir', fallback='') or None,
+                fsync=config.getboolean('attendance', 'fsync', fallback=True)
             )
-            cursor.execute(insert_query, insert_values)
-            employee_id = cursor.lastrowid
-
-            if 'salario' in data:
-                salary_query = """
-                    INSERT INTO salarios (
-                        empleado_id, salario_base, bonificaciones,
-                        deducciones, salario_total
-                    ) VALUES (
-                        %s, %s, %s, %s, %s
-                    )
-                """
-                salario_total = (data['salario'].get('salario_base', 0) +
-                                 data['salario'].get('bonificaciones', 0) -
-                                 data['salario'].get('deducciones', 0))
-                cursor.execute(salary_query, (
-                    employee_id,
-                    data['salario'].get('salario_base'),
-                    data['salario'].get('bonificaciones'),
-                    data['salario'].get('deducciones'),
-                    salario_total
-                ))
-
-            self.connection.commit()
-            return {'status': 'success', 'message': 'Empleado insertado correctamente', 'id': employee_id}
-
-        except mysql.connector.Error as err:
-            self.connection.rollback()
-            return {'status': 'error', 'message': str(err)}
+
+        # Búsqueda por nombre, email o celular para el autocompletado
+        self.search = None
+        if config.getboolean('search', 'enabled', fallback=True):
+            self.search = SearchIndex(
+                self, refresh_interval=config.getfloat('search', 'refresh_interval', fallback=30))
+            self.search.start()
+            self.add_commit_listener(self.search.on_commit)
+
+        # Permisos vigentes en árboles de intervalos por empleado y departamento
+        self.leaves = None
+        if config.getboolean('leave', 'enabled', fallback=True):
+            self.leaves = LeaveIndex(
+                self,
+                history_days=config.getint('leave', 'history_days', fallback=365),
+                refresh_interval=config.getfloat('leave', 'refresh_interval', fallback=60)
+            )
+            self.leaves.start()
+            self.add_commit_listener(self.leaves.on_commit)
+
+        # Informes de nómina sobre una copia por columnas de salarios (NumPy)
+        self.payroll = None
+        if config.getboolean('payroll', 'enabled', fallback=True):
+            if np is None:
+                logging.warning("NumPy no está instalado: PAYROLL_REPORT no estará disponible")
+            else:
+                self.payroll = PayrollEngine(
+                    self, max_age=config.getfloat('payroll', 'max_age', fallback=30))
+                self.add_commit_listener(self.payroll.on_commit)
+
+        # Altas y bajas por día en árboles de Fenwick para WORKFORCE_TIMESERIES
+        self.workforce = None
+        if config.getboolean('workforce', 'enabled', fallback=True):
+            self.workforce = WorkforceIndex(
+                self, refresh_interval=config.getfloat('workforce', 'refresh_interval', fallback=300))
+            self.workforce.start()
+            self.add_commit_listener(self.workforce.on_commit)
+
+        # Eventos de cambios de empleados para los clientes suscritos (SUBSCRIBE)
+        self.subscriptions = None
+        if config.getboolean('subscriptions', 'enabled', fallback=True):
+            self.subscriptions = SubscriptionHub(
+                self,
+                history=config.getint('subscriptions', 'history', fallback=10000),
+                buffer_size=config.getint('subscriptions', 'buffer_size', fallback=1000),
+                slow_consumer=config.get('subscriptions', 'slow_consumer', fallback='coalesce'),
+                max_subscribers=config.getint('subscriptions', 'max_subscribers', fallback=1000)
+            )
+            self.add_commit_listener(self.subscriptions.on_commit)
+
+        self.group_commit = None
+        if config.getboolean('group_commit', 'enabled', fallback=False):
+            self.group_commit = GroupCommitWriter(
+                self,
+                window=config.getfloat('group_commit', 'window_ms', fallback=2) / 1000,
+                max_batch=config.getint('group_commit', 'max_batch', fallback=64)
+            )
+
+    def _create_pool(self, pool_config, backend=None):
+        backend = backend or self.backend
+        pool_config = dict(pool_config)
+        min_size = int(pool_config.get('min_size', 2))
+        max_size = int(pool_config.get('max_size', 10))
+        if backend.pool_limit:
+            max_size = min(max_size, backend.pool_limit)
+            min_size = min(min_size, max_size)
+        return ConnectionPool(
+            factory=backend.connect,
+            validate=backend.is_alive,
+            reset=backend.reset,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=float(pool_config.get('timeout', 30)),
+            health_check=pool_config.get('health_check', 'true').lower() in ('1', 'true', 'yes', 'on'),
+            health_check_idle=float(pool_config.get('health_check_idle', 5)),
+            max_idle=float(pool_config.get('max_idle', 300)),
+            max_lifetime=float(pool_config.get('max_lifetime', 3600))
+        )
+
+    def _create_replica(self, config, section):
+        name = section.split(':', 1)[1]
+        pool_config = dict(config['pool']) if config.has_section('pool') else {}
+        backend = create_backend(config, initialize=False, overrides=dict(config[section]))
+        try:
+            pool = self._create_pool(pool_config, backend)
+            healthy = True
+        except Exception as e:
+            # Una réplica caída al arrancar no impide arrancar: empieza fuera
+            # de servicio y la comprobación periódica la recupera
+            logging.warning(f"No se pudo conectar con la réplica {name}: {e}")
+            pool = self._create_pool(dict(pool_config, min_size=0), backend)
+            healthy = False
+        replica = Replica(name, backend, pool)
+        replica.healthy = healthy
+        return replica
+
+    def _on_catalog_change(self, snapshot):
+        # Las filas en caché llevan los nombres antiguos
+        if self.cache and snapshot.version > 1:
+            self.cache.clear()
+
+    def add_commit_listener(self, listener):
+        # Los listeners reciben la lista de cambios confirmados:
+        # {'type': 'insert' | 'update' | 'delete', 'id': ..., 'data': {...}}
+        self._commit_listeners.append(listener)
+
+    def _notify_commit(self, changes):
+        if not changes:
+            return
+        self._last_commit = time.monotonic()
+        for listener in self._commit_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logging.error(f"Error notificando cambios confirmados: {e}")
+
+    @contextmanager
+    def _transaction(self, dictionary=False):
+        # Presta una conexión del pool durante toda la transacción
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                self.backend.begin(connection)
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _cursor(self, dictionary=True, pool=None, timeout=None):
+        with (pool or self.pool).connection(timeout) as connection:
+            with self._connection_cursor(connection, dictionary) as cursor:
+                yield cursor
+
+    @contextmanager
+    def _connection_cursor(self, connection, dictionary=True):
+        cursor = connection.cursor(dictionary=dictionary)
+        try:
+            yield cursor
         finally:
+            if connection.unread_result:
+                connection.consume_results()
             cursor.close()
 
+    @contextmanager
+    def _read_cursor(self, dictionary=True, primary=False):
+        # Cursor para las lecturas de los clientes: en una réplica si hay
+        # alguna sana y no se pide el primario (read-your-writes). Si la
+        # réplica no da una conexión en acquire_timeout se lee del primario;
+        # solo un fallo al conectar la saca de servicio, no los errores de la
+        # consulta del cliente.
+        replica = self.replicas.choose() if self.replicas and not primary else None
+        if replica is not None:
+            try:
+                pooled = replica.pool.acquire(self.replicas.acquire_timeout)
+            except PoolTimeoutError:
+                self.replicas.count_saturated(replica)
+            except (replica.backend.Error, OSError) as e:
+                self.replicas.mark_failed(replica, e)
+            else:
+                try:
+                    with self._connection_cursor(pooled.connection, dictionary) as cursor:
+                        yield cursor
+                finally:
+                    replica.pool.release(pooled)
+                return
+        if self.replicas:
+            self.replicas.count_primary_read()
+        with self._cursor(dictionary) as cursor:
+            yield cursor
+
+    def _replicas_may_lag(self):
+        # Justo después de un commit las réplicas pueden no tenerlo todavía
+        return (self.replicas is not None
+                and time.monotonic() - self._last_commit < self.read_your_writes)
+
+    def _write(self, apply, data):
+        # Las escrituras individuales pasan por el group commit si está activo
+        if self.group_commit:
+            return self.group_commit.submit(apply, data)
+        return self._run_write(apply, data)
+
+    def _run_write(self, apply, data):
+        try:
+            with self._transaction() as cursor:
+                response, changes = apply(cursor, data)
+            self._notify_commit(changes)
+            return response
+
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+
+    def insert_employee(self, data):
+        return self._write(self._apply_insert, data)
+
+    def _apply_insert(self, cursor, data):
+        employee_id = self._insert_employee(cursor, data)
+        response = {'status': 'success', 'message': 'Empleado insertado correctamente', 'id': employee_id}
+        return response, [{'type': 'insert', 'id': employee_id, 'data': data}]
+
+    def _insert_employee(self, cursor, data):
+        insert_query = """
+        INSERT INTO empleados (
+            primer_nombre, segundo_nombre, primer_apellido, segundo_apellido,
+            email, celular, fecha_contratacion, departamento_id, cargo_id
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        insert_values = (
+            data['primer_nombre'],
+            data.get('segundo_nombre'),
+            data['primer_apellido'],
+            data.get('segundo_apellido'),
+            data['email'],
+            data['celular'],
+            data['fecha_contratacion'],
+            data['departamento_id'],
+            data['cargo_id']
+        )
+        cursor.execute(insert_query, insert_values)
+        employee_id = cursor.lastrowid
+
+        if 'salario' in data:
+            salary_query = """
+                INSERT INTO salarios (
+                    empleado_id, salario_base, bonificaciones,
+                    deducciones, salario_total
+                ) VALUES (
+                    %s, %s, %s, %s, %s
+                )
+            """
+            salario_total = (data['salario'].get('salario_base', 0) +
+                             data['salario'].get('bonificaciones', 0) -
+                             data['salario'].get('deducciones', 0))
+            cursor.execute(salary_query, (
+                employee_id,
+                data['salario'].get('salario_base'),
+                data['salario'].get('bonificaciones'),
+                data['salario'].get('deducciones'),
+                salario_total
+            ))
+
+        return employee_id
+
     def update_employee(self, data):
+        return self._write(self._apply_update, data)
+
+    def _apply_update(self, cursor, data):
+        changes = dict(data)
+        employee_id = self._update_employee(cursor, data)
+        response = {'status': 'success', 'message': 'Empleado actualizado correctamente'}
+        return response, [{'type': 'update', 'id': employee_id, 'data': changes}]
+
+    def _update_employee(self, cursor, data):
+        employee_id = data.pop('id')
+
+        update_fields = []
+        update_values = {}
+
+        for key, value in data.items():
+            if key != 'salario':
+                update_fields.append(f"{key} = %({key})s")
+                update_values[key] = value
+
+        if update_fields:
+            update_query = f"""
+                UPDATE empleados 
+                SET {', '.join(update_fields)}
+                WHERE id = %(employee_id)s
+            """
+            update_values['employee_id'] = employee_id
+            cursor.execute(update_query, update_values)
+
+        if 'salario' in data:
+            salary_query = """
+                UPDATE salarios
+                SET salario_base = %s, bonificaciones = %s,
+                    deducciones = %s, salario_total = %s
+                WHERE empleado_id = %s
+            """
+            salario_total = (data['salario'].get('salario_base', 0) +
+                             data['salario'].get('bonificaciones', 0) -
+                             data['salario'].get('deducciones', 0))
+            cursor.execute(salary_query, (
+                data['salario'].get('salario_base'),
+                data['salario'].get('bonificaciones'),
+                data['salario'].get('deducciones'),
+                salario_total,
+                employee_id
+            ))
+
+        return employee_id
+
+    def bulk_insert_employees(self, data):
+        employees = data.get('empleados') or []
+        batch_size = int(data.get('batch_size') or self.bulk_batch_size)
+        results = [None] * len(employees)
+
+        valid = []
+        for index, employee in enumerate(employees):
+            error = self._validate_bulk_insert(employee)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'message': error}
+            else:
+                valid.append((index, employee))
+
         try:
-            self._ensure_connection()
-            cursor = self.connection.cursor(dictionary=True)
-
-            employee_id = data.pop('id')
-
-            update_fields = []
-            update_values = {}
-
-            for key, value in data.items():
-                if key != 'salario':
-                    update_fields.append(f"{key} = %({key})s")
-                    update_values[key] = value
-
-            if update_fields:
-                update_query = f"""
-                    UPDATE empleados 
-                    SET {', '.join(update_fields)}
-                    WHERE id = %(employee_id)s
-                """
-                update_values['employee_id'] = employee_id
-                cursor.execute(update_query, update_values)
-
-            if 'salario' in data:
-                salary_query = """
-                    UPDATE salarios
-                    SET salario_base = %s, bonificaciones = %s,
-                        deducciones = %s, salario_total = %s
-                    WHERE empleado_id = %s
-                """
-                salario_total = (data['salario'].get('salario_base', 0) +
-                                 data['salario'].get('bonificaciones', 0) -
-                                 data['salario'].get('deducciones', 0))
-                cursor.execute(salary_query, (
-                    data['salario'].get('salario_base'),
-                    data['salario'].get('bonificaciones'),
-                    data['salario'].get('deducciones'),
-                    salario_total,
-                    employee_id
-                ))
-
-            self.connection.commit()
-            return {'status': 'success', 'message': 'Empleado actualizado correctamente'}
-
-        except mysql.connector.Error as err:
-            self.connection.rollback()
+            with self._transaction() as cursor:
+                for start in range(0, len(valid), batch_size):
+                    batch = valid[start:start + batch_size]
+                    cursor.execute("SAVEPOINT bulk_batch")
+                    try:
+                        ids = self._insert_employee_batch(cursor, [employee for _, employee in batch])
+                        cursor.execute("RELEASE SAVEPOINT bulk_batch")
+                        for (index, _), employee_id in zip(batch, ids):
+                            results[index] = {'index': index, 'status': 'success', 'id': employee_id}
+                    except self.backend.Error as err:
+                        # Algún registro del lote falla: se repite fila a fila para
+                        # saber cuáles, sin perder los lotes anteriores.
+                        logging.warning(f"Lote de inserción fallido, reintentando fila a fila: {err}")
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_batch")
+                        for index, employee in batch:
+                            results[index] = self._run_bulk_row(
+                                cursor, index, lambda: self._insert_employee(cursor, employee))
+
+        except self.backend.Error as err:
             return {'status': 'error', 'message': str(err)}
-        finally:
-            cursor.close()
 
-    def select_employee(self, data):
+        self._notify_commit([{'type': 'insert', 'id': result['id'], 'data': employees[result['index']]}
+                             for result in results if result['status'] == 'success'])
+        return self._bulk_response(results, 'insertados')
+
+    def bulk_update_employees(self, data):
+        employees = data.get('empleados') or []
+        batch_size = int(data.get('batch_size') or self.bulk_batch_size)
+        results = [None] * len(employees)
+
+        valid = []
+        for index, employee in enumerate(employees):
+            error = self._validate_bulk_update(employee)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'message': error}
+            else:
+                valid.append((index, employee))
+
         try:
-            self._ensure_connection()
-            cursor = self.connection.cursor(dictionary=True)
+            with self._transaction() as cursor:
+                for start in range(0, len(valid), batch_size):
+                    batch = valid[start:start + batch_size]
+                    existing = self._existing_employee_ids(cursor, [employee['id'] for _, employee in batch])
+                    found = []
+                    for index, employee in batch:
+                        if employee['id'] in existing:
+                            found.append((index, employee))
+                        else:
+                            results[index] = {'index': index, 'status': 'error',
+                                              'message': f"No existe el empleado {employee['id']}"}
 
-            query = """
-                SELECT e.*, s.salario_base, s.bonificaciones, s.deducciones, s.salario_total,
-                       d.nombre as departamento, c.titulo as cargo
-                FROM empleados e
-                LEFT JOIN salarios s ON e.id = s.empleado_id
-                LEFT JOIN departamentos d ON e.departamento_id = d.id
-                LEFT JOIN cargo c ON e.cargo_id = c.id
-            """
+                    cursor.execute("SAVEPOINT bulk_batch")
+                    try:
+                        self._update_employee_batch(cursor, [employee for _, employee in found])
+                        cursor.execute("RELEASE SAVEPOINT bulk_batch")
+                        for index, employee in found:
+                            results[index] = {'index': index, 'status': 'success', 'id': employee['id']}
+                    except self.backend.Error as err:
+                        logging.warning(f"Lote de actualización fallido, reintentando fila a fila: {err}")
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_batch")
+                        for index, employee in found:
+                            results[index] = self._run_bulk_row(
+                                cursor, index, lambda: self._update_employee(cursor, dict(employee)))
 
-            conditions = []
-            params = {}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
 
-            if 'id' in data:
-                conditions.append("e.id = %(id)s")
-                params['id'] = data['id']
-            if 'email' in data:
-                conditions.append("e.email = %(email)s")
-                params['email'] = data['email']
+        self._notify_commit([{'type': 'update', 'id': result['id'], 'data': employees[result['index']]}
+                             for result in results if result['status'] == 'success'])
+        return self._bulk_response(results, 'actualizados')
 
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
+    def _validate_bulk_insert(self, employee):
+        if not isinstance(employee, dict):
+            return 'El registro no es un objeto'
+        missing = [field for field in EMPLOYEE_REQUIRED_FIELDS if employee.get(field) in (None, '')]
+        if missing:
+            return f"Faltan campos obligatorios: {', '.join(missing)}"
+        if 'salario' in employee and not isinstance(employee['salario'], dict):
+            return 'El campo salario debe ser un objeto'
+        return None
 
-            cursor.execute(query, params)
-            result = cursor.fetchall()
+    def _validate_bulk_update(self, employee):
+        if not isinstance(employee, dict) or employee.get('id') is None:
+            return 'Falta el id del empleado'
+        unknown = [key for key in employee
+                   if key not in EMPLOYEE_UPDATABLE_FIELDS and key not in ('id', 'salario')]
+        if unknown:
+            return f"Campos no actualizables: {', '.join(unknown)}"
+        if 'salario' in employee and not isinstance(employee['salario'], dict):
+            return 'El campo salario debe ser un objeto'
+        return None
+
+    def _run_bulk_row(self, cursor, index, operation):
+        cursor.execute("SAVEPOINT bulk_row")
+        try:
+            employee_id = operation()
+            cursor.execute("RELEASE SAVEPOINT bulk_row")
+            return {'index': index, 'status': 'success', 'id': employee_id}
+        except self.backend.Error as err:
+            cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+            return {'index': index, 'status': 'error', 'message': str(err)}
 
-            logging.info(f"Resultados de la consulta: {result}")  # Agregado
+    def _bulk_response(self, results, verb):
+        succeeded = sum(1 for result in results if result['status'] == 'success')
+        failed = len(results) - succeeded
+        if failed == 0:
+            status = 'success'
+        elif succeeded == 0:
+            status = 'error'
+        else:
+            status = 'partial'
+        return {
+            'status': status,
+            'message': f"{succeeded} empleados {verb}, {failed} con errores",
+            'succeeded': succeeded,
+            'failed': failed,
+            'results': results
+        }
 
-            return {'status': 'success', 'data': result}
+    def _salary_values(self, salario):
+        salario_base = salario.get('salario_base', 0) or 0
+        bonificaciones = salario.get('bonificaciones', 0) or 0
+        deducciones = salario.get('deducciones', 0) or 0
+        return salario_base, bonificaciones, deducciones, salario_base + bonificaciones - deducciones
 
-        except mysql.connector.Error as err:
+    def _insert_employee_batch(self, cursor, employees):
+        insert_query = """
+        INSERT INTO empleados (
+            primer_nombre, segundo_nombre, primer_apellido, segundo_apellido,
+            email, celular, fecha_contratacion, departamento_id, cargo_id
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        # executemany reescribe el INSERT como una única sentencia multi-fila
+        cursor.executemany(insert_query, [(
+            employee['primer_nombre'],
+            employee.get('segundo_nombre'),
+            employee['primer_apellido'],
+            employee.get('segundo_apellido'),
+            employee['email'],
+            employee['celular'],
+            employee['fecha_contratacion'],
+            employee['departamento_id'],
+            employee['cargo_id']
+        ) for employee in employees])
+
+        # Los ids se recuperan por email (único) para no depender de que
+        # el AUTO_INCREMENT asigne valores consecutivos.
+        placeholders = ', '.join(['%s'] * len(employees))
+        cursor.execute(f"SELECT id, email FROM empleados WHERE email IN ({placeholders})",
+                       [employee['email'] for employee in employees])
+        ids_by_email = {email: employee_id for employee_id, email in cursor.fetchall()}
+        ids = [ids_by_email[employee['email']] for employee in employees]
+
+        salaries = [(employee_id, *self._salary_values(employee['salario']))
+                    for employee, employee_id in zip(employees, ids) if 'salario' in employee]
+        if salaries:
+            cursor.executemany("""
+                INSERT INTO salarios (
+                    empleado_id, salario_base, bonificaciones,
+                    deducciones, salario_total
+                ) VALUES (%s, %s, %s, %s, %s)
+            """, salaries)
+
+        return ids
+
+    def _existing_employee_ids(self, cursor, ids):
+        if not ids:
+            return set()
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"SELECT id FROM empleados WHERE id IN ({placeholders})", list(ids))
+        return {row[0] for row in cursor.fetchall()}
+
+    def _update_employee_batch(self, cursor, employees):
+        # Agrupa las filas que actualizan las mismas columnas y las resuelve con
+        # un único UPDATE ... SET col = CASE id WHEN ... END por grupo.
+        groups = {}
+        for employee in employees:
+            fields = tuple(sorted(key for key in employee if key in EMPLOYEE_UPDATABLE_FIELDS))
+            if fields:
+                groups.setdefault(fields, []).append(employee)
+
+        for fields, rows in groups.items():
+            assignments = []
+            params = []
+            for field in fields:
+                cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+                assignments.append(f"{field} = CASE id {cases} END")
+                for row in rows:
+                    params.extend((row['id'], row[field]))
+            params.extend(row['id'] for row in rows)
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(f"""
+                UPDATE empleados
+                SET {', '.join(assignments)}
+                WHERE id IN ({placeholders})
+            """, params)
+
+        salaries = [(employee['id'], self._salary_values(employee['salario']))
+                    for employee in employees if 'salario' in employee]
+        if salaries:
+            assignments = []
+            params = []
+            for position, column in enumerate(SALARY_FIELDS + ('salario_total',)):
+                cases = ' '.join(['WHEN %s THEN %s'] * len(salaries))
+                assignments.append(f"{column} = CASE empleado_id {cases} END")
+                for employee_id, values in salaries:
+                    params.extend((employee_id, values[position]))
+            params.extend(employee_id for employee_id, _ in salaries)
+            placeholders = ', '.join(['%s'] * len(salaries))
+            cursor.execute(f"""
+                UPDATE salarios
+                SET {', '.join(assignments)}
+                WHERE empleado_id IN ({placeholders})
+            """, params)
+
+    def _build_select_query(self, data, limit=None):
+        fields = data.get('fields') or list(SELECT_COLUMNS)
+        unknown = [field for field in fields if field not in SELECT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Campos no válidos: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields = ['id'] + list(fields)
+
+        # Con el catálogo cargado, departamento y cargo se resuelven en memoria
+        # a partir de su id; si el id no se pidió se lee y luego se quita.
+        resolved = []
+        if self.catalog and self.catalog.ready:
+            resolved = [field for field in fields if field in CATALOG_FIELDS]
+        hidden = [CATALOG_FIELDS[field][0] for field in resolved
+                  if CATALOG_FIELDS[field][0] not in fields]
+        sql_fields = [field for field in fields if field not in resolved] + hidden
+
+        # Solo se unen las tablas que necesita la proyección pedida
+        columns = [f"{SELECT_COLUMNS[field]} AS {field}" for field in sql_fields]
+        query = f"""
+            SELECT {', '.join(columns)}
+            FROM empleados e
+        """
+        if any(SELECT_COLUMNS[field].startswith('s.') for field in sql_fields):
+            query += " LEFT JOIN salarios s ON e.id = s.empleado_id"
+        if 'departamento' in sql_fields:
+            query += " LEFT JOIN departamentos d ON e.departamento_id = d.id"
+        if 'cargo' in sql_fields:
+            query += " LEFT JOIN cargo c ON e.cargo_id = c.id"
+
+        conditions = []
+        params = {}
+
+        if 'id' in data:
+            conditions.append("e.id = %(id)s")
+            params['id'] = data['id']
+        if 'email' in data:
+            conditions.append("e.email = %(email)s")
+            params['email'] = data['email']
+        for field in ('departamento_id', 'cargo_id', 'estado'):
+            if data.get(field) is not None:
+                conditions.append(f"e.{field} = %({field})s")
+                params[field] = data[field]
+
+        fecha_contratacion = data.get('fecha_contratacion') or {}
+        if fecha_contratacion.get('desde'):
+            conditions.append("e.fecha_contratacion >= %(fecha_desde)s")
+            params['fecha_desde'] = fecha_contratacion['desde']
+        if fecha_contratacion.get('hasta'):
+            conditions.append("e.fecha_contratacion <= %(fecha_hasta)s")
+            params['fecha_hasta'] = fecha_contratacion['hasta']
+
+        # Paginación por clave: la siguiente página empieza después del último id
+        if data.get('cursor'):
+            conditions.append("e.id > %(after_id)s")
+            params['after_id'] = decode_page_cursor(data['cursor'])
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        query += " ORDER BY e.id"
+        if limit:
+            query += f" LIMIT {int(limit) + 1}"
+
+        return query, params, (resolved, hidden)
+
+    def _resolve_names(self, rows, names):
+        resolved, hidden = names
+        if resolved:
+            self.catalog.resolve(rows, resolved, hidden)
+        return rows
+
+    def _page_limit(self, data):
+        if data.get('limit') is None:
+            return None
+        limit = int(data['limit'])
+        if limit < 1:
+            raise ValueError("El límite debe ser mayor que cero")
+        return min(limit, MAX_PAGE_SIZE)
+
+    def _fetch_rows(self, cursor):
+        rows = []
+        while True:
+            chunk = cursor.fetchmany(FETCH_SIZE)
+            if not chunk:
+                return rows
+            rows.extend(chunk)
+
+    def select_employee(self, data, primary=False):
+        cache_key = self.cache.key_for(data) if self.cache else None
+        if cache_key:
+            rows = self.cache.get(cache_key)
+            if rows is not None:
+                return {'status': 'success', 'data': rows}
+            generation = self.cache.generation
+
+        try:
+            limit = self._page_limit(data)
+            with self._read_cursor(primary=primary) as cursor:
+                query, params, names = self._build_select_query(data, limit)
+                cursor.execute(query, params)
+                rows = self._fetch_rows(cursor)
+            # Con la conexión ya devuelta: si falta un id el catálogo se
+            # refresca con otra conexión del pool
+            result = self._resolve_names(rows, names)
+
+            logging.debug(f"SELECT devolvió {len(result)} filas")
+            if cache_key and (primary or not self._replicas_may_lag()):
+                self.cache.put(cache_key, result, generation)
+
+            response = {'status': 'success', 'data': result}
+            if limit:
+                # Se pidió una fila de más para saber si hay otra página
+                next_cursor = None
+                if len(result) > limit:
+                    result = result[:limit]
+                    next_cursor = encode_page_cursor(result[-1]['id'])
+                response['data'] = result
+                response['next_cursor'] = next_cursor
+            return response
+
+        except self.backend.Error as err:
             return {'status': 'error', 'message': str(err)}
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
         except Exception as e:
             return {'status': 'error ', 'message': str(e)}
 
-    def delete_employee(self, data):
+    def iter_employees(self, data, chunk_size, primary=False):
+        # Igual que select_employee pero entrega las filas por bloques con
+        # fetchmany, para enviarlas en streaming sin cargar todo el resultado.
+        # La conexión queda prestada hasta que se consume o se cierra el generador,
+        # así que el catálogo solo se refresca si hay otra conexión libre al momento.
+        with self._read_cursor(primary=primary) as cursor:
+            query, params, names = self._build_select_query(data, self._page_limit(data))
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield self._resolve_names(rows, names)
+
+    def record_attendance(self, events, event_type=None):
+        # CLOCK_IN / CLOCK_OUT (un evento) y CLOCK_EVENTS (lista de eventos).
+        # Los eventos inválidos se informan y los demás se aceptan.
+        if not self.attendance:
+            return {'status': 'error', 'message': 'El registro de asistencias está desactivado'}
+        accepted = []
+        errors = []
+        for index, event in enumerate(events):
+            try:
+                accepted.append(parse_event(event, event_type))
+            except ValueError as e:
+                errors.append({'index': index, 'status': 'error', 'message': str(e)})
+        if not accepted:
+            message = errors[0]['message'] if len(errors) == 1 else 'Ningún evento válido'
+            return {'status': 'error', 'message': message, 'errors': errors}
+
         try:
-            self._ensure_connection()
-            cursor = self.connection.cursor()
+            sequence = self.attendance.submit(accepted)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        if sequence is None:
+            return {'status': 'busy',
+                    'message': 'La cola de asistencias está llena, reintente en unos segundos'}
 
-            fecha_retiro = datetime.now().date()
+        response = {
+            'status': 'partial' if errors else 'success',
+            'message': f"{len(accepted)} fichajes registrados",
+            'accepted': len(accepted),
+            'sequence': sequence
+        }
+        if errors:
+            response['errors'] = errors
+        return response
 
-            self.connection.start_transaction()
+    def payroll_report(self, data):
+        if not self.payroll:
+            return {'status': 'error', 'message': 'Los informes de nómina están desactivados o falta NumPy'}
+        try:
+            return self.payroll.report(data)
+        except (ValueError, TypeError) as e:
+            return {'status': 'error', 'message': str(e)}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
 
-            update_query = """
-            UPDATE empleados 
-            SET 
-                estado = 0, 
-                updated_at = %s 
-            WHERE id = %s
-            """
+    def workforce_timeseries(self, data):
+        # WORKFORCE_TIMESERIES: plantilla en una fecha (fecha) o plantilla,
+        # altas, bajas y rotación por periodo (fecha_inicio, fecha_fin, interval)
+        if not self.workforce:
+            return {'status': 'error', 'message': 'Las series de plantilla están desactivadas'}
+        try:
+            return self.workforce.timeseries(data)
+        except (ValueError, TypeError) as e:
+            return {'status': 'error', 'message': str(e)}
 
-            cursor.execute(update_query, (
-                datetime.now(),
-                data['id']
-            ))
+    def search_employees(self, data):
+        # SEARCH: los empleados activos que mejor coinciden con `query`
+        if not self.search:
+            return {'status': 'error', 'message': 'La búsqueda está desactivada'}
+        try:
+            limit = min(int(data.get('limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+            departamento_id = data.get('departamento_id')
+            departamento_id = None if departamento_id is None else int(departamento_id)
+            results = self.search.search(data.get('query') or '', limit, departamento_id)
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+        return {'status': 'success', 'data': results}
 
-            insert_historico_query = """
-            INSERT INTO historicos (
-                empleado_id, 
-                fecha_retiro, 
-                motivo
-            ) VALUES (%s, %s, %s)
-            """
+    def request_leave(self, data):
+        # LEAVE_REQUEST: registra un permiso si el empleado no tiene otro que se
+        # solape. Con max_department_out se rechaza también cuando ya hay ese
+        # número de compañeros del departamento ausentes en esas fechas.
+        if not self.leaves:
+            return {'status': 'error', 'message': 'La gestión de permisos está desactivada'}
+        try:
+            empleado_id = int(data['empleado_id'])
+            tipo_permiso_id = int(data['tipo_permiso_id'])
+        except (KeyError, TypeError, ValueError):
+            return {'status': 'error', 'message': 'Faltan empleado_id o tipo_permiso_id'}
+        try:
+            start, end = parse_range(data)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        max_out = data.get('max_department_out')
+        if max_out is not None:
+            try:
+                max_out = int(max_out)
+            except (TypeError, ValueError):
+                return {'status': 'error', 'message': 'max_department_out debe ser un número entero'}
 
-            cursor.execute(insert_historico_query, (
-                data['id'],
-                fecha_retiro,
-                data.get('motivo', '')
-            ))
+        try:
+            with self._transaction(dictionary=True) as cursor:
+                # El bloqueo de la fila del empleado serializa sus solicitudes
+                # aunque lleguen a procesos distintos.
+                cursor.execute("SELECT departamento_id FROM empleados WHERE id = %s FOR UPDATE",
+                               (empleado_id,))
+                employee = cursor.fetchone()
+                if employee is None:
+                    return {'status': 'error', 'message': f"No existe el empleado {empleado_id}"}
+                departamento_id = employee['departamento_id']
+                if departamento_id is not None:
+                    # Y el del departamento serializa las solicitudes de sus
+                    # empleados, para que dos compañeros a la vez no superen
+                    # max_department_out
+                    cursor.execute("SELECT id FROM departamentos WHERE id = %s FOR UPDATE",
+                                   (departamento_id,))
+                    cursor.fetchall()
 
-            self.connection.commit()
+                conflicts = self.leaves.overlapping(start, end, empleado_id=empleado_id,
+                                                    cursor=cursor)
+                if not conflicts:
+                    # El índice puede no tener aún los permisos de otros procesos
+                    cursor.execute("""
+                        SELECT id FROM permisos
+                        WHERE empleado_id = %s AND fecha_inicio <= %s AND fecha_fin >= %s
+                    """, (empleado_id, end, start))
+                    conflicts = [{'id': row['id']} for row in cursor.fetchall()]
+                if conflicts:
+                    return {'status': 'error', 'message': 'El empleado ya tiene un permiso en esas fechas',
+                            'conflicts': conflicts}
 
-            if cursor.rowcount > 0:
-                return {
-                    'status': 'success',
-                    'message': 'Empleado dado de baja exitosamente',
-                    'rows_affected': cursor.rowcount
-                }
-            else:
-                return {
-                    'status': 'error',
-                    'message': 'No se encontró el empleado o no se pudo dar de baja'
-                }
-
-        except mysql.connector.Error as err:
-            self.connection.rollback()
-            logging.error(f"Error en la base de datos: {err}")
+                # Con límite se cuenta en la base, dentro de la transacción: el
+                # índice no tiene aún lo que otros acaban de confirmar
+                colleagues = [leave for leave in self.leaves.overlapping(
+                    start, end, departamento_id=departamento_id, cursor=cursor,
+                    consistent=max_out is not None) if leave['empleado_id'] != empleado_id]
+                absent = len({leave['empleado_id'] for leave in colleagues})
+                if max_out is not None and absent >= max_out:
+                    return {'status': 'error',
+                            'message': f"Ya hay {absent} empleados del departamento ausentes en esas fechas",
+                            'conflicts': colleagues}
+
+                cursor.execute("""
+                    INSERT INTO permisos (fecha_inicio, fecha_fin, tipo_permiso_id, empleado_id)
+                    VALUES (%s, %s, %s, %s)
+                """, (start, end, tipo_permiso_id, empleado_id))
+                leave = {'id': cursor.lastrowid, 'empleado_id': empleado_id,
+                         'departamento_id': departamento_id, 'tipo_permiso_id': tipo_permiso_id,
+                         'fecha_inicio': start, 'fecha_fin': end}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+
+        self.leaves.add(leave)
+        return {'status': 'success', 'message': 'Permiso registrado', 'id': leave['id'],
+                'department_overlaps': colleagues}
+
+    def check_leave(self, data):
+        # LEAVE_CHECK: permisos que se solapan con un rango, de un empleado,
+        # de un departamento o de toda la empresa
+        if not self.leaves:
+            return {'status': 'error', 'message': 'La gestión de permisos está desactivada'}
+        try:
+            start, end = parse_range(data)
+            empleado_id, departamento_id = (None if data.get(key) is None else int(data[key])
+                                            for key in ('empleado_id', 'departamento_id'))
+            overlaps = self.leaves.overlapping(start, end, empleado_id, departamento_id)
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+        return {'status': 'success', 'data': overlaps, 'count': len(overlaps),
+                'employees': len({leave['empleado_id'] for leave in overlaps})}
+
+    def who_is_out(self, data):
+        # WHO_IS_OUT: quién tiene permiso en cada una de las fechas pedidas
+        if not self.leaves:
+            return {'status': 'error', 'message': 'La gestión de permisos está desactivada'}
+        days = data.get('fechas') or ([data['fecha']] if data.get('fecha') else [])
+        if not days:
+            return {'status': 'error', 'message': 'Falta fecha o fechas'}
+        result = {}
+        try:
+            departamento_id = data.get('departamento_id')
+            departamento_id = None if departamento_id is None else int(departamento_id)
+            for day in days:
+                day = str(day)[:10]
+                start = parse_moment(day)
+                result[start.date().isoformat()] = self.leaves.overlapping(
+                    start, parse_moment(day, end_of_day=True), departamento_id=departamento_id)
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+        return {'status': 'success', 'data': result}
+
+    def cancel_leave(self, data):
+        # LEAVE_CANCEL: borra un permiso por id
+        if not self.leaves:
+            return {'status': 'error', 'message': 'La gestión de permisos está desactivada'}
+        try:
+            leave_id = int(data['id'])
+        except (KeyError, TypeError, ValueError):
+            return {'status': 'error', 'message': 'Falta el id del permiso'}
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("DELETE FROM permisos WHERE id = %s", (leave_id,))
+                rows_affected = cursor.rowcount
+        except self.backend.Error as err:
+            return {'status': 'error', 'message': str(err)}
+        self.leaves.remove(leave_id)
+        if not rows_affected:
+            return {'status': 'error', 'message': f"No existe el permiso {leave_id}"}
+        return {'status': 'success', 'message': 'Permiso cancelado', 'rows_affected': rows_affected}
+
+    def list_catalog(self, table, filters=None):
+        # LIST_DEPARTAMENTOS, LIST_CARGOS y LIST_TIPOS_PERMISOS. Se sirven del
+        # catálogo en memoria; sin él (desactivado o sin cargar) se consulta la base.
+        filters = {column: value for column, value in (filters or {}).items() if value is not None}
+        if self.catalog and self.catalog.ready:
+            version, rows = self.catalog.list(table, **filters)
+            return {'status': 'success', 'data': rows, 'version': version}
+        try:
+            query = f"SELECT {', '.join(CATALOG_TABLES[table])} FROM {table}"
+            if filters:
+                query += " WHERE " + " AND ".join(f"{column} = %({column})s" for column in filters)
+            with self._read_cursor() as cursor:
+                cursor.execute(query + " ORDER BY id", filters)
+                return {'status': 'success', 'data': cursor.fetchall()}
+        except self.backend.Error as err:
             return {'status': 'error', 'message': str(err)}
+
+    def delete_employee(self, data):
+        try:
+            return self._write(self._apply_delete, data)
+
         except Exception as e:
-            self.connection.rollback()
             logging.error(f"Error inesperado: {e}")
             return {'status': 'error', 'message': str(e)}
-        finally:
-            if cursor:
-                cursor.close()
+
+    def _apply_delete(self, cursor, data):
+        rows_affected = self._delete_employee(cursor, data)
+        if rows_affected > 0:
+            return {
+                'status': 'success',
+                'message': 'Empleado dado de baja exitosamente',
+                'rows_affected': rows_affected
+            }, [{'type': 'delete', 'id': data['id'], 'data': data}]
+        else:
+            return {
+                'status': 'error',
+                'message': 'No se encontró el empleado o no se pudo dar de baja'
+            }, []
+
+    def _delete_employee(self, cursor, data):
+        fecha_retiro = datetime.now().date()
+
+        update_query = """
+        UPDATE empleados 
+        SET 
+            estado = 0, 
+            updated_at = %s 
+        WHERE id = %s
+        """
+
+        cursor.execute(update_query, (
+            datetime.now(),
+            data['id']
+        ))
+        rows_affected = cursor.rowcount
+        if rows_affected == 0:
+            return 0
+
+        insert_historico_query = """
+        INSERT INTO historicos (
+            empleado_id, 
+            fecha_retiro, 
+            motivo
+        ) VALUES (%s, %s, %s)
+        """
+
+        cursor.execute(insert_historico_query, (
+            data['id'],
+            fecha_retiro,
+            data.get('motivo', '')
+        ))
+
+        return rows_affected
+
+    def close(self):
+        if self.subscriptions:
+            self.subscriptions.close()
+        if self.attendance:
+            self.attendance.close()
+        if self.group_commit:
+            self.group_commit.close()
+        if self.catalog:
+            self.catalog.close()
+        if self.leaves:
+            self.leaves.close()
+        if self.workforce:
+            self.workforce.close()
+        if self.search:
+            self.search.close()
+        if self.replicas:
+            self.replicas.close()
+        self.pool.close()
+        self.backend.close()
 
     def __del__(self):
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
\ No newline at end of file
+        if getattr(self, 'pool', None):
+            self.pool.close()
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+
+
+class PendingWrite:
+    # Escritura de un cliente a la espera de que se confirme su grupo
+    def __init__(self, apply, data):
+        self.apply = apply
+        self.data = data
+        self.response = None
+        self.changes = []
+        self.error = None
+        self.done = threading.Event()
+
+    def reset(self):
+        self.response = None
+        self.changes = []
+        self.error = None
+
+
+class GroupCommitWriter:
+    # Agrupa las escrituras de varios clientes en una sola transacción para
+    # pagar un único commit (fsync) por grupo. Cada petición se ejecuta dentro
+    # de su propio SAVEPOINT: si falla, solo se deshace lo suyo y su cliente
+    # recibe el error, mientras el resto del grupo se confirma.
+    #
+    # apply(cursor, data) ejecuta la escritura sin confirmarla y devuelve la
+    # respuesta para el cliente y la lista de cambios para los listeners.
+    def __init__(self, handler, window=0.002, max_batch=64):
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.fallbacks = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, apply, data):
+        request = PendingWrite(apply, data)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("El escritor de group commit está cerrado")
+            self._queue.append(request)
+            self._condition.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.response
+
+    def _next_batch(self):
+        # Espera la primera escritura y, desde ella, hasta `window` segundos
+        # o hasta reunir max_batch. Lo que llega mientras se confirma un grupo
+        # forma el siguiente sin esperar más.
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if not self._queue:
+                return None
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._commit_batch(batch)
+            finally:
+                for request in batch:
+                    request.done.set()
+
+    def _commit_batch(self, batch):
+        handler = self.handler
+        try:
+            with handler._transaction() as cursor:
+                for request in batch:
+                    self._apply(cursor, request)
+        except Exception as e:
+            # Ha fallado la transacción completa (commit, deadlock, conexión
+            # perdida...): cada petición se repite en su propia transacción.
+            logging.warning(f"Group commit de {len(batch)} escrituras fallido, "
+                            f"se repiten una a una: {e}")
+            with self._stats_lock:
+                self.fallbacks += 1
+            for request in batch:
+                request.reset()
+                try:
+                    request.response = handler._run_write(request.apply, dict(request.data))
+                except Exception as error:
+                    request.error = error
+            return
+
+        handler._notify_commit([change for request in batch for change in request.changes])
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def _apply(self, cursor, request):
+        # Se pasa una copia: algunas escrituras modifican sus datos y la
+        # petición puede tener que repetirse si el grupo falla.
+        cursor.execute("SAVEPOINT group_request")
+        try:
+            request.response, request.changes = request.apply(cursor, dict(request.data))
+        except self.handler.backend.Error as err:
+            cursor.execute("ROLLBACK TO SAVEPOINT group_request")
+            request.response = {'status': 'error', 'message': str(err)}
+            request.changes = []
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT group_request")
+            request.error = e
+            request.changes = []
+        else:
+            cursor.execute("RELEASE SAVEPOINT group_request")
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch': round(self.requests / self.batches, 2) if self.batches else 0,
+                'largest_batch': self.largest_batch,
+                'fallbacks': self.fallbacks,
+                'window_ms': self.window * 1000,
+                'max_batch': self.max_batch
+            }
+
+    def close(self):
+        # Las escrituras ya encoladas se confirman antes de terminar
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,455 @@
+import logging
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+LEAVE_COLUMNS = ('id', 'empleado_id', 'departamento_id', 'tipo_permiso_id', 'fecha_inicio', 'fecha_fin')
+# updated_at de ambas tablas: el refresco incremental pide las filas cuyo
+# permiso o empleado (cambio de departamento) cambió desde el último
+LEAVE_QUERY = """
+    SELECT p.id, p.empleado_id, e.departamento_id, p.tipo_permiso_id, p.fecha_inicio, p.fecha_fin,
+           p.updated_at, e.updated_at AS empleado_updated_at
+    FROM permisos p
+    JOIN empleados e ON e.id = p.empleado_id
+"""
+DAY_END = timedelta(days=1, seconds=-1)
+
+
+def parse_moment(value, end_of_day=False):
+    # Fecha ('2026-10-17') o fecha y hora ISO. Una fecha sola como fin de un
+    # rango se toma hasta el último segundo del día.
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        moment = datetime.combine(value, datetime.min.time())
+        return moment + DAY_END if end_of_day else moment
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    if end_of_day and len(str(value)) == 10:
+        moment += DAY_END
+    return moment
+
+
+def parse_range(data):
+    if data.get('fecha_inicio') is None or data.get('fecha_fin') is None:
+        raise ValueError('Faltan fecha_inicio o fecha_fin')
+    start = parse_moment(data['fecha_inicio'])
+    end = parse_moment(data['fecha_fin'], end_of_day=True)
+    if end < start:
+        raise ValueError('La fecha_fin es anterior a la fecha_inicio')
+    return start, end
+
+
+def _watermark(rows, current=None):
+    stamps = [stamp for row in rows for stamp in (row['updated_at'], row['empleado_updated_at'])
+              if stamp is not None]
+    if current is not None:
+        stamps.append(current)
+    return max(stamps) if stamps else None
+
+
+class _Node:
+    __slots__ = ('start', 'end', 'key', 'value', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, key, value):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+
+def _update(node):
+    max_end = node.end
+    if node.left is not None and node.left.max_end > max_end:
+        max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end = node.right.max_end
+    node.max_end = max_end
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left = left.right
+    left.right = node
+    _update(node)
+    _update(left)
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right = right.left
+    right.left = node
+    _update(node)
+    _update(right)
+    return right
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if (new.start, new.key) < (node.start, node.key):
+        node.left = _insert(node.left, new)
+        if node.left.priority > node.priority:
+            return _rotate_right(node)
+    else:
+        node.right = _insert(node.right, new)
+        if node.right.priority > node.priority:
+            return _rotate_left(node)
+    _update(node)
+    return node
+
+
+def _merge(left, right):
+    # Todas las claves de left son menores que las de right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _remove(node, start, key):
+    if node is None:
+        return None, False
+    if (start, key) == (node.start, node.key):
+        return _merge(node.left, node.right), True
+    if (start, key) < (node.start, node.key):
+        node.left, removed = _remove(node.left, start, key)
+    else:
+        node.right, removed = _remove(node.right, start, key)
+    if removed:
+        _update(node)
+    return node, removed
+
+
+class IntervalTree:
+    # Árbol de intervalos cerrados [start, end] sobre un treap ordenado por
+    # (start, key). Cada nodo guarda el mayor fin de su subárbol, de modo que
+    # una consulta descarta las ramas que terminan antes del rango buscado y
+    # cuesta O(log n + resultados).
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def build(cls, items):
+        # Construye el árbol en O(n) a partir de (start, end, key, value) ya
+        # ordenados por (start, key): es un árbol cartesiano por prioridad.
+        tree = cls()
+        stack = []
+        for start, end, key, value in items:
+            node = _Node(start, end, key, value)
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        tree._root = stack[0] if stack else None
+        tree._size = len(items)
+
+        # max_end de abajo arriba: en preorden inverso los hijos van antes
+        preorder = []
+        pending = [tree._root]
+        while pending:
+            node = pending.pop()
+            if node is not None:
+                preorder.append(node)
+                pending.append(node.left)
+                pending.append(node.right)
+        for node in reversed(preorder):
+            _update(node)
+        return tree
+
+    def insert(self, start, end, key, value=None):
+        self._root = _insert(self._root, _Node(start, end, key, value))
+        self._size += 1
+
+    def remove(self, start, key):
+        self._root, removed = _remove(self._root, start, key)
+        if removed:
+            self._size -= 1
+        return removed
+
+    def overlapping(self, start, end):
+        # Valores de los intervalos que se solapan con [start, end]
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < start:
+                continue
+            stack.append(node.left)
+            # A la derecha todos empiezan en node.start o después
+            if node.start <= end:
+                if node.end >= start:
+                    found.append(node.value)
+                stack.append(node.right)
+        return found
+
+
+class LeaveTrees:
+    # Los árboles de intervalos de un conjunto de permisos: uno global, uno
+    # por departamento y uno por empleado. Sin lock propio.
+    def __init__(self):
+        self.leaves = {}
+        self.all = IntervalTree()
+        self.by_department = {}
+        self.by_employee = {}
+
+    @classmethod
+    def build(cls, rows):
+        trees = cls()
+        by_employee = {}
+        by_department = {}
+        items = []
+        for row in sorted(rows, key=lambda row: (row['fecha_inicio'], row['id'])):
+            leave = {column: row[column] for column in LEAVE_COLUMNS}
+            trees.leaves[leave['id']] = leave
+            item = (leave['fecha_inicio'], leave['fecha_fin'], leave['id'], leave)
+            items.append(item)
+            by_employee.setdefault(leave['empleado_id'], []).append(item)
+            by_department.setdefault(leave['departamento_id'], []).append(item)
+        trees.all = IntervalTree.build(items)
+        trees.by_employee = {owner: IntervalTree.build(group) for owner, group in by_employee.items()}
+        trees.by_department = {owner: IntervalTree.build(group)
+                               for owner, group in by_department.items()}
+        return trees
+
+    def add(self, leave):
+        leave = {column: leave[column] for column in LEAVE_COLUMNS}
+        if leave['id'] in self.leaves:
+            self.remove(leave['id'])
+        self.leaves[leave['id']] = leave
+        start, end, key = leave['fecha_inicio'], leave['fecha_fin'], leave['id']
+        self.all.insert(start, end, key, leave)
+        self.by_employee.setdefault(leave['empleado_id'], IntervalTree()).insert(start, end, key, leave)
+        self.by_department.setdefault(leave['departamento_id'], IntervalTree()).insert(
+            start, end, key, leave)
+
+    def remove(self, leave_id):
+        leave = self.leaves.pop(leave_id, None)
+        if leave is None:
+            return None
+        start = leave['fecha_inicio']
+        self.all.remove(start, leave_id)
+        for trees, owner in ((self.by_employee, leave['empleado_id']),
+                             (self.by_department, leave['departamento_id'])):
+            tree = trees.get(owner)
+            if tree is not None:
+                tree.remove(start, leave_id)
+                if not tree:
+                    del trees[owner]
+        return leave
+
+    def move_employee(self, employee_id, department):
+        # Un empleado cambió de departamento: sus permisos pasan al árbol del nuevo
+        tree = self.by_employee.get(employee_id)
+        for leave in tree.overlapping(datetime.min, datetime.max) if tree else []:
+            if leave['departamento_id'] != department:
+                self.add(dict(leave, departamento_id=department))
+
+    def overlapping(self, start, end, empleado_id=None, departamento_id=None):
+        if empleado_id is not None:
+            tree = self.by_employee.get(empleado_id)
+            found = tree.overlapping(start, end) if tree else []
+            if departamento_id is not None:
+                found = [leave for leave in found if leave['departamento_id'] == departamento_id]
+            return found
+        if departamento_id is not None:
+            tree = self.by_department.get(departamento_id)
+            return tree.overlapping(start, end) if tree else []
+        return self.all.overlapping(start, end)
+
+
+class LeaveIndex:
+    # Permisos vigentes en memoria para comprobar solapes y responder quién
+    # está ausente sin recorrer la tabla. Se cargan los permisos que terminan
+    # después de `horizon` (hoy menos history_days); las consultas anteriores
+    # a esa fecha van a la base. Las altas y bajas de este proceso se aplican
+    # al momento; las de otros procesos se recogen cada refresh_interval
+    # segundos leyendo solo las filas con updated_at posterior al último
+    # refresco. Si el número de permisos no cuadra (se borró alguno) o cambia
+    # el día, se recarga todo.
+    def __init__(self, handler, history_days=365, refresh_interval=60.0):
+        self.handler = handler
+        self.history_days = history_days
+        self.refresh_interval = refresh_interval
+        self.horizon = None
+        self.ready = False
+        self.reloads = 0
+        self.refreshes = 0
+        self.queries = 0
+        self.fallbacks = 0
+        self._trees = LeaveTrees()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._watermark = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.reload()
+        if self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='leave-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def _horizon(self):
+        return datetime.combine(date.today() - timedelta(days=self.history_days), datetime.min.time())
+
+    def refresh(self):
+        horizon = self._horizon()
+        if not self.ready or horizon != self.horizon or self._watermark is None:
+            return self.reload()
+        try:
+            with self.handler._cursor() as cursor:
+                cursor.execute(LEAVE_QUERY + " WHERE p.fecha_fin >= %s"
+                               " AND (p.updated_at >= %s OR e.updated_at >= %s)",
+                               (horizon, self._watermark, self._watermark))
+                rows = cursor.fetchall()
+                cursor.execute("SELECT COUNT(*) AS total FROM permisos WHERE fecha_fin >= %s",
+                               (horizon,))
+                total = cursor.fetchone()['total']
+        except self.handler.backend.Error as err:
+            logging.error(f"Error refrescando los permisos: {err}")
+            return False
+
+        with self._lock:
+            for row in rows:
+                self._apply(LeaveTrees.add, row)
+            self._watermark = _watermark(rows, self._watermark)
+            self.refreshes += 1
+            complete = len(self._trees.leaves) == total
+        return complete or self.reload()
+
+    def reload(self):
+        # El índice nuevo se construye fuera del lock; los cambios locales que
+        # llegan mientras tanto se anotan y se repiten antes de sustituirlo.
+        horizon = self._horizon()
+        with self._lock:
+            self._pending = []
+        try:
+            with self.handler._cursor() as cursor:
+                cursor.execute(LEAVE_QUERY + " WHERE p.fecha_fin >= %s", (horizon,))
+                rows = cursor.fetchall()
+        except self.handler.backend.Error as err:
+            logging.error(f"Error cargando los permisos: {err}")
+            with self._lock:
+                self._pending = None
+            return False
+
+        trees = LeaveTrees.build(rows)
+        with self._lock:
+            for apply, argument in self._pending:
+                apply(trees, *argument)
+            self._pending = None
+            self._trees = trees
+            self._watermark = _watermark(rows)
+            self.horizon = horizon
+            self.reloads += 1
+            self.ready = True
+        return True
+
+    def _apply(self, apply, *argument):
+        # Con el lock tomado
+        result = apply(self._trees, *argument)
+        if self._pending is not None:
+            self._pending.append((apply, argument))
+        return result
+
+    def add(self, leave):
+        # Los permisos que terminan antes del horizonte no se indexan
+        with self._lock:
+            if self.horizon is None or leave['fecha_fin'] >= self.horizon:
+                self._apply(LeaveTrees.add, leave)
+
+    def remove(self, leave_id):
+        with self._lock:
+            return self._apply(LeaveTrees.remove, leave_id)
+
+    def on_commit(self, changes):
+        # Listener de commits de DatabaseHandler: cambios de departamento
+        with self._lock:
+            for change in changes:
+                data = change.get('data') or {}
+                if change.get('type') != 'update' or data.get('departamento_id') is None:
+                    continue
+                try:
+                    self._apply(LeaveTrees.move_employee, int(change['id']),
+                                int(data['departamento_id']))
+                except (TypeError, ValueError):
+                    continue
+
+    def overlapping(self, start, end, empleado_id=None, departamento_id=None, cursor=None,
+                    consistent=False):
+        # Permisos que se solapan con [start, end], ordenados por inicio.
+        # cursor: el de la transacción en curso, para que la consulta a la
+        # base no pida otra conexión al pool. consistent: se consulta siempre
+        # la base, para ver también lo confirmado por otros procesos.
+        if consistent or not self.ready or start < self.horizon:
+            return self._query_database(start, end, empleado_id, departamento_id, cursor)
+        with self._lock:
+            self.queries += 1
+            found = self._trees.overlapping(start, end, empleado_id, departamento_id)
+        return sorted(found, key=lambda leave: (leave['fecha_inicio'], leave['id']))
+
+    def _query_database(self, start, end, empleado_id, departamento_id, cursor=None):
+        with self._lock:
+            self.fallbacks += 1
+        conditions = ["p.fecha_inicio <= %s", "p.fecha_fin >= %s"]
+        params = [end, start]
+        if empleado_id is not None:
+            conditions.append("p.empleado_id = %s")
+            params.append(empleado_id)
+        if departamento_id is not None:
+            conditions.append("e.departamento_id = %s")
+            params.append(departamento_id)
+        query = LEAVE_QUERY + f" WHERE {' AND '.join(conditions)} ORDER BY p.fecha_inicio, p.id"
+        if cursor is not None:
+            cursor.execute(query, params)
+            return [{column: row[column] for column in LEAVE_COLUMNS} for row in cursor.fetchall()]
+        with self.handler._cursor() as cursor:
+            cursor.execute(query, params)
+            return [{column: row[column] for column in LEAVE_COLUMNS} for row in cursor.fetchall()]
+
+    def stats(self):
+        with self._lock:
+            trees = self._trees
+            return {
+                'leaves': len(trees.leaves),
+                'departments': len(trees.by_department),
+                'employees': len(trees.by_employee),
+                'horizon': self.horizon.isoformat(' ') if self.horizon else None,
+                'reloads': self.reloads,
+                'refreshes': self.refreshes,
+                'queries': self.queries,
+                'database_fallbacks': self.fallbacks
+            }
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,332 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Límites superiores (segundos) de los buckets de los histogramas de latencia
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_PROFILES_KEPT = 20
+
+
+class Histogram:
+    # Histograma de buckets fijos: registrar un valor cuesta una búsqueda
+    # binaria, y los percentiles se estiman interpolando dentro del bucket.
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= target and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                position = (target - cumulative) / bucket_count
+                return min(lower + (upper - lower) * position, self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.sum / self.count) if self.count else None,
+            'p50_ms': ms(self.percentile(0.50)),
+            'p95_ms': ms(self.percentile(0.95)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'max_ms': ms(self.max) if self.count else None
+        }
+
+
+class SlowRequestProfiler:
+    # Perfila con cProfile una muestra de las peticiones y conserva el perfil
+    # de las que superan el umbral. cProfile no admite dos perfiles activos a
+    # la vez, así que si ya hay uno en curso la petición no se perfila.
+    def __init__(self, threshold=0.5, sample_rate=0.01, output_dir=None, keep=SLOW_PROFILES_KEPT):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.captured = deque(maxlen=keep)
+        self._busy = threading.Lock()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def run(self, operation, func, *args):
+        if random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return func(*args)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                return func(*args)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - started
+                if elapsed >= self.threshold:
+                    self._capture(operation, elapsed, profiler)
+        finally:
+            self._busy.release()
+
+    def _capture(self, operation, elapsed, profiler):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(15)
+        entry = {
+            'operation': operation,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'summary': output.getvalue()
+        }
+        if self.output_dir:
+            path = os.path.join(self.output_dir, f"{operation or 'unknown'}-{time.time_ns()}.prof")
+            stats.dump_stats(path)
+            entry['file'] = path
+        self.captured.append(entry)
+        logging.warning(f"Petición lenta {operation}: {entry['elapsed_ms']} ms (perfil guardado)")
+
+    def snapshot(self):
+        return [{key: value for key, value in entry.items() if key != 'summary'}
+                for entry in self.captured]
+
+
+class Metrics:
+    # Contadores e histogramas por operación y etapa (decode, execute, encode,
+    # send y total), espera del pool, conexiones y bytes transferidos.
+    def __init__(self, profiler=None):
+        self.started_at = time.time()
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+        self.coalesced = {}
+        self.latency = {}
+        self.pool_wait = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections_total = 0
+        self.active_connections = 0
+
+    def observe(self, operation, stage, seconds):
+        key = (operation, stage)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count_request(self, operation, response):
+        failed = not isinstance(response, dict) or response.get('status') not in ('success', 'partial')
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def count_coalesced(self, operation, response):
+        # Petición atendida con el resultado de otra idéntica que estaba en curso
+        self.count_request(operation, response)
+        with self._lock:
+            self.coalesced[operation] = self.coalesced.get(operation, 0) + 1
+
+    def observe_pool_wait(self, seconds):
+        with self._lock:
+            self.pool_wait.observe(seconds)
+
+    def add_bytes_in(self, size):
+        with self._lock:
+            self.bytes_in += size
+
+    def add_bytes_out(self, size):
+        with self._lock:
+            self.bytes_out += size
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections_total += 1
+            self.active_connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.active_connections -= 1
+
+    def merge(self, other):
+        # Suma las métricas de otro proceso (modo multiproceso)
+        with self._lock:
+            for operation, count in other.requests.items():
+                self.requests[operation] = self.requests.get(operation, 0) + count
+            for operation, count in other.errors.items():
+                self.errors[operation] = self.errors.get(operation, 0) + count
+            for operation, count in other.coalesced.items():
+                self.coalesced[operation] = self.coalesced.get(operation, 0) + count
+            for key, histogram in other.latency.items():
+                if key not in self.latency:
+                    self.latency[key] = Histogram(histogram.buckets)
+                self.latency[key].merge(histogram)
+            self.pool_wait.merge(other.pool_wait)
+            self.bytes_in += other.bytes_in
+            self.bytes_out += other.bytes_out
+            self.connections_total += other.connections_total
+            self.active_connections += other.active_connections
+            self.started_at = min(self.started_at, other.started_at)
+
+    def __getstate__(self):
+        # Se envía entre procesos sin el lock ni el perfilador
+        with self._lock:
+            state = dict(self.__dict__)
+        state.pop('_lock')
+        state['profiler'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def run_profiled(self, operation, func, *args):
+        if self.profiler is None:
+            return func(*args)
+        return self.profiler.run(operation, func, *args)
+
+    def snapshot(self, pool=None, cache=None):
+        with self._lock:
+            operations = {}
+            for (operation, stage), histogram in sorted(self.latency.items(), key=lambda item: str(item[0])):
+                entry = operations.setdefault(operation, {
+                    'requests': self.requests.get(operation, 0),
+                    'errors': self.errors.get(operation, 0)
+                })
+                if operation in self.coalesced:
+                    entry['coalesced'] = self.coalesced[operation]
+                entry[stage] = histogram.snapshot()
+            snapshot = {
+                'uptime': round(time.time() - self.started_at, 3),
+                'connections': {'active': self.active_connections, 'total': self.connections_total},
+                'bytes': {'in': self.bytes_in, 'out': self.bytes_out},
+                'operations': operations,
+                'pool_wait': self.pool_wait.snapshot()
+            }
+        if pool is not None:
+            snapshot['pool'] = pool
+        if cache is not None:
+            snapshot['cache'] = cache
+        if self.profiler is not None:
+            snapshot['slow_requests'] = self.profiler.snapshot()
+        return snapshot
+
+    def prometheus(self, pool=None):
+        # Formato de texto de Prometheus (version 0.0.4)
+        lines = [
+            '# TYPE rh_connections_active gauge',
+            f'rh_connections_active {self.active_connections}',
+            '# TYPE rh_connections_total counter',
+            f'rh_connections_total {self.connections_total}',
+            '# TYPE rh_bytes_received_total counter',
+            f'rh_bytes_received_total {self.bytes_in}',
+            '# TYPE rh_bytes_sent_total counter',
+            f'rh_bytes_sent_total {self.bytes_out}',
+            '# TYPE rh_requests_total counter'
+        ]
+        with self._lock:
+            for operation, count in sorted(self.requests.items(), key=lambda item: str(item[0])):
+                lines.append(f'rh_requests_total{{operation="{operation}"}} {count}')
+            lines.append('# TYPE rh_request_errors_total counter')
+            for operation, count in sorted(self.errors.items(), key=lambda item: str(item[0])):
+                lines.append(f'rh_request_errors_total{{operation="{operation}"}} {count}')
+            lines.append('# TYPE rh_requests_coalesced_total counter')
+            for operation, count in sorted(self.coalesced.items(), key=lambda item: str(item[0])):
+                lines.append(f'rh_requests_coalesced_total{{operation="{operation}"}} {count}')
+            lines.append('# TYPE rh_request_duration_seconds histogram')
+            for (operation, stage), histogram in sorted(self.latency.items(), key=lambda item: str(item[0])):
+                labels = f'operation="{operation}",stage="{stage}"'
+                lines.extend(self._histogram_lines('rh_request_duration_seconds', labels, histogram))
+            lines.append('# TYPE rh_pool_wait_seconds histogram')
+            lines.extend(self._histogram_lines('rh_pool_wait_seconds', '', self.pool_wait))
+        if pool is not None:
+            for key in ('size', 'idle', 'in_use', 'waiting'):
+                lines.append(f'# TYPE rh_pool_{key} gauge')
+                lines.append(f'rh_pool_{key} {pool[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def _histogram_lines(self, name, labels, histogram):
+        separator = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bucket}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {histogram.sum}')
+        lines.append(f'{name}_count{suffix} {histogram.count}')
+        return lines
+
+
+class MetricsExporter:
+    # Servidor HTTP mínimo que publica /metrics en formato Prometheus y /stats
+    # en JSON. collect() devuelve las métricas y el estado del pool a publicar.
+    def __init__(self, host, port, collect):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/metrics':
+                    metrics, pool = collect()
+                    body = metrics.prometheus(pool).encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                elif path == '/stats':
+                    metrics, pool = collect()
+                    body = json.dumps(metrics.snapshot(pool)).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-exporter',
+                                       daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"Métricas Prometheus en http://{self.httpd.server_address[0]}:"
+                     f"{self.httpd.server_address[1]}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él PAYROLL_REPORT no está disponible
+    np = None
+
+# Columnas de la copia en memoria, en el orden del SELECT
+PAYROLL_COLUMNS = ('id', 'departamento_id', 'cargo_id', 'estado',
+                   'salario_base', 'bonificaciones', 'deducciones', 'salario_total')
+AMOUNT_COLUMNS = ('salario_base', 'bonificaciones', 'deducciones', 'salario_total')
+# Agrupaciones permitidas: nombre -> (columna, tabla del catálogo, columna del nombre)
+GROUP_COLUMNS = {
+    'departamento': ('departamento_id', 'departamentos', 'nombre'),
+    'cargo': ('cargo_id', 'cargo', 'titulo')
+}
+DEFAULT_PERCENTILES = (50, 90)
+# Con más empleados modificados que esto se recarga la copia entera
+MAX_INCREMENTAL_IDS = 5000
+
+# Los nulos se convierten en la consulta: -1 para "sin departamento/cargo"
+# y 0 en los importes, para poder cargar todo en arrays de enteros.
+PAYROLL_QUERY = """
+    SELECT e.id, COALESCE(e.departamento_id, -1), COALESCE(e.cargo_id, -1),
+           COALESCE(e.estado, 1), s.salario_base, COALESCE(s.bonificaciones, 0),
+           COALESCE(s.deducciones, 0), s.salario_total
+    FROM empleados e
+    JOIN salarios s ON e.id = s.empleado_id
+"""
+
+
+class PayrollSnapshot:
+    # Copia por columnas de empleados con salario, ordenada por id (un
+    # empleado por fila). No se modifica: cada refresco crea otra.
+    def __init__(self, version, columns):
+        self.version = version
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, version, rows):
+        matrix = np.array(rows, dtype=np.int64).reshape(-1, len(PAYROLL_COLUMNS))
+        return cls(version, cls._normalize(matrix))
+
+    @staticmethod
+    def _normalize(matrix):
+        # Ordena por id y, si un empleado tiene varias filas en salarios, se
+        # queda con la última (la de mayor id de salario, por el ORDER BY).
+        order = np.argsort(matrix[:, 0], kind='stable')
+        matrix = matrix[order]
+        ids = matrix[:, 0]
+        keep = np.ones(len(ids), dtype=bool)
+        keep[:-1] = ids[1:] != ids[:-1]
+        matrix = matrix[keep]
+        return {name: np.ascontiguousarray(matrix[:, position])
+                for position, name in enumerate(PAYROLL_COLUMNS)}
+
+    def patched(self, version, changed_ids, rows):
+        # Quita los empleados modificados y añade sus filas actuales
+        ids = self.columns['id']
+        kept = ~np.isin(ids, np.fromiter(changed_ids, dtype=np.int64, count=len(changed_ids)))
+        current = np.stack([self.columns[name][kept] for name in PAYROLL_COLUMNS], axis=1)
+        fresh = np.array(rows, dtype=np.int64).reshape(-1, len(PAYROLL_COLUMNS))
+        return PayrollSnapshot(version, self._normalize(np.concatenate([current, fresh])))
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+
+class PayrollEngine:
+    # Informes de nómina (PAYROLL_REPORT) calculados con NumPy sobre una copia
+    # en memoria de salarios. La copia se carga con el primer informe; después
+    # solo se vuelven a leer los empleados que cambiaron en los commits de
+    # este proceso, y se recarga entera cada max_age segundos para recoger
+    # las escrituras de otros procesos.
+    def __init__(self, handler, max_age=30.0):
+        self.handler = handler
+        self.max_age = max_age
+        self.snapshot = None
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self.reports = 0
+        self._loaded_at = 0.0
+        self._dirty = set()
+        self._reload = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def on_commit(self, changes):
+        # Listener de commits de DatabaseHandler
+        with self._lock:
+            for change in changes:
+                try:
+                    self._dirty.add(int(change['id']))
+                except (KeyError, TypeError, ValueError):
+                    self._reload = True
+
+    def current(self):
+        with self._refresh_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                reload, self._reload = self._reload, False
+            snapshot = self.snapshot
+            try:
+                if (snapshot is None or reload or len(dirty) > MAX_INCREMENTAL_IDS
+                        or time.monotonic() - self._loaded_at >= self.max_age):
+                    self._load_all()
+                elif dirty:
+                    self._load_changed(dirty)
+            except Exception:
+                # Se recuerdan los cambios pendientes para el próximo intento
+                with self._lock:
+                    self._dirty |= dirty
+                    self._reload = self._reload or reload
+                raise
+            return self.snapshot
+
+    def _load_all(self):
+        started = time.perf_counter()
+        with self.handler._cursor(dictionary=False) as cursor:
+            cursor.execute(PAYROLL_QUERY + " ORDER BY e.id, s.id")
+            rows = cursor.fetchall()
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        self.snapshot = PayrollSnapshot.from_rows(version, rows)
+        self._loaded_at = time.monotonic()
+        self.full_loads += 1
+        logging.info(f"Nómina cargada en memoria: {len(self.snapshot)} empleados en "
+                     f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _load_changed(self, ids):
+        ids = sorted(ids)
+        rows = []
+        with self.handler._cursor(dictionary=False) as cursor:
+            for start in range(0, len(ids), 1000):
+                chunk = ids[start:start + 1000]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(PAYROLL_QUERY + f" WHERE e.id IN ({placeholders}) ORDER BY e.id, s.id",
+                               chunk)
+                rows.extend(cursor.fetchall())
+        self.snapshot = self.snapshot.patched(self.snapshot.version + 1, ids, rows)
+        self.incremental_loads += 1
+
+    def report(self, data):
+        group_by = data.get('group_by', ['departamento'])
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        unknown = [group for group in group_by if group not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Agrupación no válida: {', '.join(map(str, unknown))} "
+                             f"(use {', '.join(GROUP_COLUMNS)})")
+        percentiles = [float(p) for p in data.get('percentiles', DEFAULT_PERCENTILES)]
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError("Los percentiles deben estar entre 0 y 100")
+
+        snapshot = self.current()
+        columns = snapshot.columns
+        # Por defecto solo los empleados activos; estado=null los incluye todos
+        mask = np.ones(len(snapshot), dtype=bool)
+        filters = {'estado': data.get('estado', 1),
+                   'departamento_id': data.get('departamento_id'),
+                   'cargo_id': data.get('cargo_id')}
+        for column, value in filters.items():
+            if value is not None:
+                mask &= columns[column] == int(value)
+        selected = {name: values[mask] for name, values in columns.items()}
+
+        amounts = {name: selected[name].astype(np.float64) for name in AMOUNT_COLUMNS}
+        adjustments = data.get('adjustments') or []
+        baseline = None
+        if adjustments:
+            baseline = amounts['salario_total']
+            amounts = self._adjust(selected, amounts, adjustments)
+
+        keys = [selected[GROUP_COLUMNS[group][0]] for group in group_by]
+        rows = self._aggregate(keys, amounts, baseline, percentiles)
+        rows = self._label(rows, group_by)
+        totals = self._aggregate([], amounts, baseline, percentiles)[0]
+        del totals['key']
+        with self._lock:
+            self.reports += 1
+        return {
+            'status': 'success',
+            'data': rows,
+            'totals': totals,
+            'group_by': group_by,
+            'employees': int(mask.sum()),
+            'version': snapshot.version
+        }
+
+    def _adjust(self, selected, amounts, adjustments):
+        # Escenario hipotético: cada ajuste sube salario_base un porcentaje a
+        # los empleados que cumplen sus filtros (todos si no tiene ninguno).
+        # Los ajustes que coinciden en un empleado se acumulan.
+        factor = np.ones(len(selected['id']))
+        for adjustment in adjustments:
+            if not isinstance(adjustment, dict) or 'raise_pct' not in adjustment:
+                raise ValueError("Cada ajuste necesita raise_pct")
+            target = np.ones(len(factor), dtype=bool)
+            for column in ('departamento_id', 'cargo_id'):
+                if adjustment.get(column) is not None:
+                    target &= selected[column] == int(adjustment[column])
+            factor[target] *= 1 + float(adjustment['raise_pct']) / 100
+        adjusted = dict(amounts)
+        adjusted['salario_base'] = np.round(amounts['salario_base'] * factor, 2)
+        adjusted['salario_total'] = (amounts['salario_total']
+                                     + adjusted['salario_base'] - amounts['salario_base'])
+        return adjusted
+
+    def _aggregate(self, keys, amounts, baseline, percentiles):
+        # Una fila por combinación de claves. Sumas y recuentos con bincount;
+        # los percentiles de salario_total se interpolan sobre los valores
+        # ordenados por grupo, igual que np.percentile (método lineal).
+        count = len(amounts['salario_total'])
+        if keys:
+            groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            groups = np.empty((1, 0), dtype=np.int64)
+            inverse = np.zeros(count, dtype=np.intp)
+        size = len(groups)
+        headcount = np.bincount(inverse, minlength=size)
+        divisor = np.maximum(headcount, 1)
+
+        stats = {}
+        for name, values in amounts.items():
+            total = np.bincount(inverse, weights=values, minlength=size)
+            stats[name] = {'total': total, 'mean': total / divisor}
+
+        values = amounts['salario_total']
+        ordered = values[np.lexsort((values, inverse))]
+        starts = np.concatenate(([0], np.cumsum(headcount)[:-1]))
+        for p in percentiles:
+            if count:
+                position = starts + np.maximum(headcount - 1, 0) * (p / 100)
+                low = np.floor(position).astype(np.intp)
+                high = np.minimum(np.ceil(position).astype(np.intp), count - 1)
+                value = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+            else:
+                value = np.zeros(size)
+            stats['salario_total'][f"p{p:g}"] = value
+        if baseline is not None:
+            stats['salario_total']['baseline'] = np.bincount(inverse, weights=baseline,
+                                                             minlength=size)
+            stats['salario_total']['delta'] = (stats['salario_total']['total']
+                                               - stats['salario_total']['baseline'])
+
+        rows = []
+        for index in range(size):
+            row = {'key': [int(value) for value in groups[index]],
+                   'headcount': int(headcount[index])}
+            for name, measures in stats.items():
+                row[name] = {measure: (round(float(value[index]), 2) if headcount[index] else None)
+                             for measure, value in measures.items()}
+            rows.append(row)
+        return rows
+
+    def _label(self, rows, group_by):
+        # Cambia la clave numérica por id y nombre (desde el catálogo)
+        catalog = self.handler.catalog
+        snapshot = catalog.snapshot if catalog and catalog.ready else None
+        labeled = []
+        for row in rows:
+            label = {}
+            for group, value in zip(group_by, row.pop('key')):
+                column, table, name_column = GROUP_COLUMNS[group]
+                label[column] = None if value == -1 else value
+                entry = snapshot.get(table, value) if snapshot else None
+                label[group] = entry[name_column] if entry else None
+            labeled.append(dict(label, **row))
+        return labeled
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'employees': len(snapshot) if snapshot else 0,
+            'version': snapshot.version if snapshot else 0,
+            'full_loads': self.full_loads,
+            'incremental_loads': self.incremental_loads,
+            'reports': self.reports,
+            'max_age': self.max_age
+        }
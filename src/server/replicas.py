@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from itertools import count
+
+SELECTION_POLICIES = ('round_robin', 'least_loaded')
+
+
+class Replica:
+    def __init__(self, name, backend, pool):
+        self.name = name
+        self.backend = backend
+        self.pool = pool
+        self.healthy = True
+        self.reads = 0
+        self.errors = 0
+        # Lecturas que fueron al primario porque el pool de la réplica estaba lleno
+        self.saturated = 0
+        self.last_error = None
+
+    def load(self):
+        # Fracción del pool en uso: la réplica menos cargada es la que tiene
+        # más conexiones libres en proporción a su tamaño
+        stats = self.pool.stats()
+        return stats['in_use'] / stats['max_size']
+
+
+class ReplicaSet:
+    # Réplicas de lectura con un pool de conexiones cada una. Las lecturas se
+    # reparten entre las sanas por turno (round_robin) o eligiendo la de menos
+    # conexiones en uso (least_loaded). Una réplica que falla deja de recibir
+    # lecturas hasta que la comprobación periódica vuelve a conectar con ella.
+    def __init__(self, replicas, selection='round_robin', health_check_interval=5.0,
+                 acquire_timeout=1.0):
+        if selection not in SELECTION_POLICIES:
+            raise ValueError(f"selection debe ser uno de: {', '.join(SELECTION_POLICIES)}")
+        self.replicas = replicas
+        self.selection = selection
+        self.health_check_interval = health_check_interval
+        # Espera máxima por una conexión de réplica antes de leer del primario
+        self.acquire_timeout = acquire_timeout
+        self.primary_reads = 0
+        self._turn = count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.health_check_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='replica-health', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.health_check_interval):
+            self.check()
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                with replica.pool.connection(self.acquire_timeout) as connection:
+                    alive = replica.backend.is_alive(connection)
+            except Exception as e:
+                alive = False
+                replica.last_error = str(e)
+            if alive != replica.healthy:
+                if alive:
+                    logging.info(f"La réplica {replica.name} vuelve a recibir lecturas")
+                else:
+                    logging.warning(f"La réplica {replica.name} no responde: {replica.last_error}")
+            replica.healthy = alive
+
+    def choose(self):
+        # Devuelve None si no hay ninguna réplica sana: se lee del primario
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.selection == 'least_loaded':
+            replica = min(healthy, key=Replica.load)
+        else:
+            replica = healthy[next(self._turn) % len(healthy)]
+        with self._lock:
+            replica.reads += 1
+        return replica
+
+    def mark_failed(self, replica, error):
+        with self._lock:
+            replica.errors += 1
+        replica.last_error = str(error)
+        if replica.healthy:
+            replica.healthy = False
+            logging.warning(f"Réplica {replica.name} fuera de servicio: {error}")
+
+    def count_saturated(self, replica):
+        with self._lock:
+            replica.saturated += 1
+
+    def count_primary_read(self):
+        with self._lock:
+            self.primary_reads += 1
+
+    def stats(self):
+        return {
+            'selection': self.selection,
+            'primary_reads': self.primary_reads,
+            'replicas': [{
+                'name': replica.name,
+                'healthy': replica.healthy,
+                'reads': replica.reads,
+                'errors': replica.errors,
+                'saturated': replica.saturated,
+                'last_error': replica.last_error,
+                'pool': replica.pool.stats()
+            } for replica in self.replicas]
+        }
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        for replica in self.replicas:
+            replica.pool.close()
+            replica.backend.close()
@@ -0,0 +1,379 @@
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+# Campos indexados y su peso en la puntuación
+SEARCH_FIELDS = {
+    'primer_nombre': 1.0,
+    'primer_apellido': 1.0,
+    'segundo_nombre': 0.8,
+    'segundo_apellido': 0.8,
+    'email': 0.6,
+    'celular': 0.6
+}
+RESULT_FIELDS = ('id',) + tuple(SEARCH_FIELDS) + ('departamento_id', 'cargo_id')
+SEARCH_QUERY = f"SELECT {', '.join(RESULT_FIELDS)}, estado, updated_at FROM empleados"
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Palabras que se prueban por prefijo y empleados que se puntúan como mucho
+# por consulta: con prefijos muy cortos ("a") se toman las mejores palabras
+# de las primeras en orden alfabético.
+MAX_PREFIX_WORDS = 200
+MAX_CANDIDATES = 100
+# Palabras de la consulta con más empleados que esto no se cruzan como
+# conjuntos: se comprueban sobre los candidatos de las demás
+MAX_UNION = 50000
+# Similitud mínima (coeficiente de Dice sobre trigramas) de una palabra con
+# una errata respecto a la buscada. Solo se indexan por trigramas las palabras
+# alfabéticas (nombres y partes del email), no emails completos ni celulares.
+FUZZY_THRESHOLD = 0.5
+FUZZY_MIN_LENGTH = 3
+# Con más empleados modificados que esto se recarga el índice entero
+MAX_INCREMENTAL_IDS = 5000
+
+_SEPARATORS = re.compile(r'[\s\-]+')
+_ALPHANUMERIC = re.compile(r'[a-z]+|\d+')
+_EMAIL_CHARACTERS = re.compile(r'[^0-9a-z@._+\-]')
+
+
+@lru_cache(maxsize=65536)
+def _strip_accents(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize(text):
+    # Minúsculas y sin tildes: "Ángela Muñoz" -> "angela munoz". Los nombres
+    # se repiten mucho, así que la parte lenta se cachea.
+    text = str(text).lower()
+    return text if text.isascii() else _strip_accents(text)
+
+
+def tokenize(row):
+    # Palabras de cada campo con su peso. El email se indexa entero y por
+    # partes (juan.perez2@x.com -> juan, perez, 2, x, com) y el celular solo
+    # con sus dígitos.
+    tokens = {}
+    for field, weight in SEARCH_FIELDS.items():
+        value = row.get(field)
+        if not value:
+            continue
+        value = normalize(value)
+        if field == 'email':
+            words = [value] + _ALPHANUMERIC.findall(value)
+        elif field == 'celular':
+            words = [re.sub(r'\D', '', value)]
+        else:
+            words = _SEPARATORS.split(value)
+        for word in words:
+            if word and tokens.get(word, 0) < weight:
+                tokens[word] = weight
+    return tokens
+
+
+def query_terms(query):
+    # Una palabra con @ o punto se busca entre los emails completos; las
+    # demás se parten en letras y dígitos como al indexar
+    terms = []
+    for word in normalize(query).split():
+        if '@' in word or '.' in word:
+            terms.append(_EMAIL_CHARACTERS.sub('', word))
+        else:
+            terms.extend(_ALPHANUMERIC.findall(word))
+    return [term for term in terms if term]
+
+
+def is_email(word):
+    return '@' in word or '.' in word
+
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    # Índice en memoria para el autocompletado (SEARCH) sobre los nombres,
+    # email y celular de los empleados activos. Cada palabra normalizada
+    # apunta a los empleados que la contienen; las palabras se guardan
+    # ordenadas para encontrar las que empiezan por un prefijo con bisect, y
+    # un índice de trigramas de las palabras permite encontrar erratas.
+    #
+    # Las escrituras de este proceso marcan los empleados afectados y se
+    # releen antes de la siguiente búsqueda; las de otros procesos se recogen
+    # cada refresh_interval segundos por updated_at.
+    def __init__(self, handler, refresh_interval=30.0):
+        self.handler = handler
+        self.refresh_interval = refresh_interval
+        self.ready = False
+        self.searches = 0
+        self.reloads = 0
+        self.refreshes = 0
+        self._rows = {}
+        self._docs = {}
+        self._postings = {}
+        self._words = []
+        self._emails = []
+        self._trigrams = {}
+        self._watermark = None
+        self._dirty = set()
+        self._reload = False
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.reload()
+        if self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='search-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def reload(self):
+        try:
+            with self.handler._cursor() as cursor:
+                cursor.execute(SEARCH_QUERY + " WHERE estado = 1")
+                rows = cursor.fetchall()
+        except self.handler.backend.Error as err:
+            logging.error(f"Error cargando el índice de búsqueda: {err}")
+            return False
+        with self._lock:
+            self._rows = {}
+            self._docs = {}
+            self._postings = {}
+            self._trigrams = {}
+            for row in rows:
+                self._add(row, sort=False)
+            self._words = sorted(word for word in self._postings if not is_email(word))
+            self._emails = sorted(word for word in self._postings if is_email(word))
+            self._watermark = max((row['updated_at'] for row in rows if row['updated_at']),
+                                  default=None)
+            self.reloads += 1
+            self.ready = True
+        return True
+
+    def refresh(self):
+        # Empleados modificados desde el último refresco (altas, cambios y bajas)
+        if not self.ready or self._watermark is None:
+            return self.reload()
+        try:
+            with self.handler._cursor() as cursor:
+                cursor.execute(SEARCH_QUERY + " WHERE updated_at >= %s", (self._watermark,))
+                rows = cursor.fetchall()
+        except self.handler.backend.Error as err:
+            logging.error(f"Error refrescando el índice de búsqueda: {err}")
+            return False
+        with self._lock:
+            for row in rows:
+                self._replace(row['id'], row)
+            stamps = [row['updated_at'] for row in rows if row['updated_at']] + [self._watermark]
+            self._watermark = max(stamps)
+            self.refreshes += 1
+        return True
+
+    def on_commit(self, changes):
+        # Listener de commits de DatabaseHandler
+        with self._lock:
+            for change in changes:
+                try:
+                    self._dirty.add(int(change['id']))
+                except (KeyError, TypeError, ValueError):
+                    self._reload = True
+
+    def _flush(self):
+        # Relee los empleados modificados en este proceso antes de buscar
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            reload, self._reload = self._reload, False
+        if not dirty and not reload:
+            return
+        if reload or len(dirty) > MAX_INCREMENTAL_IDS:
+            self.reload()
+            return
+        ids = sorted(dirty)
+        rows = {}
+        try:
+            with self.handler._cursor() as cursor:
+                for start in range(0, len(ids), 1000):
+                    chunk = ids[start:start + 1000]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    cursor.execute(SEARCH_QUERY + f" WHERE id IN ({placeholders})", chunk)
+                    rows.update((row['id'], row) for row in cursor.fetchall())
+        except self.handler.backend.Error:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        with self._lock:
+            for employee_id in ids:
+                self._replace(employee_id, rows.get(employee_id))
+
+    def _replace(self, employee_id, row):
+        self._remove(employee_id)
+        if row is not None and row['estado']:
+            self._add(row)
+
+    def _add(self, row, sort=True):
+        employee_id = row['id']
+        self._rows[employee_id] = {field: row[field] for field in RESULT_FIELDS}
+        tokens = self._docs[employee_id] = tokenize(row)
+        for word in tokens:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                if word.isalpha():
+                    for trigram in trigrams(word):
+                        self._trigrams.setdefault(trigram, set()).add(word)
+                if sort:
+                    insort(self._emails if is_email(word) else self._words, word)
+            postings.add(employee_id)
+
+    def _remove(self, employee_id):
+        self._rows.pop(employee_id, None)
+        for word in self._docs.pop(employee_id, ()):
+            postings = self._postings[word]
+            postings.discard(employee_id)
+            if postings:
+                continue
+            del self._postings[word]
+            words = self._emails if is_email(word) else self._words
+            del words[bisect_left(words, word)]
+            for trigram in trigrams(word) if word.isalpha() else ():
+                words = self._trigrams[trigram]
+                words.discard(word)
+                if not words:
+                    del self._trigrams[trigram]
+
+    def search(self, query, limit=DEFAULT_LIMIT, departamento_id=None):
+        # Los `limit` empleados con mejor puntuación. Cada palabra de la
+        # consulta debe coincidir (entera, como prefijo o, si no hay bastantes
+        # resultados, con una errata) con alguna palabra del empleado.
+        self._flush()
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            self.searches += 1
+            expansions = [self._prefix_words(term) for term in terms]
+            scored = self._score(expansions, departamento_id)
+            if len(scored) < limit:
+                expansions = [self._fuzzy_words(term, words) for term, words in zip(terms, expansions)]
+                scored.update(self._score(expansions, departamento_id))
+            best = sorted(scored.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [dict(self._rows[employee_id], score=round(score, 3)) for employee_id, score in best]
+
+    def _prefix_words(self, term):
+        # Palabras que empiezan por term -> calidad de la coincidencia
+        words = self._emails if is_email(term) else self._words
+        start = bisect_left(words, term)
+        matches = {}
+        for word in words[start:start + MAX_PREFIX_WORDS]:
+            if not word.startswith(term):
+                break
+            matches[word] = 1.0 if word == term else 0.6 + 0.3 * len(term) / len(word)
+        return matches
+
+    def _fuzzy_words(self, term, matches):
+        # Añade las palabras parecidas por trigramas a las que ya coinciden
+        if len(term) < FUZZY_MIN_LENGTH:
+            return matches
+        wanted = trigrams(term)
+        shared = {}
+        for trigram in wanted:
+            for word in self._trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        matches = dict(matches)
+        for word, count in shared.items():
+            similarity = 2 * count / (len(wanted) + len(trigrams(word)))
+            if similarity >= FUZZY_THRESHOLD and word not in matches:
+                matches[word] = 0.5 * similarity
+        return matches
+
+    def _candidates(self, expansions, departamento_id=None):
+        # Con varias palabras se cruzan los conjuntos de empleados de cada una
+        # (en C, sin recorrerlos en Python), empezando por la más selectiva.
+        # Si quedan más de MAX_CANDIDATES, o no se pudo cruzar, se recorren los
+        # empleados de la palabra más selectiva empezando por sus mejores
+        # coincidencias. El departamento se filtra aquí, antes de recortar.
+        sizes = [sum(len(self._postings[word]) for word in words) for words in expansions]
+        order = sorted(range(len(expansions)), key=sizes.__getitem__)
+        candidates = None
+        if len(expansions) > 1:
+            for index in order:
+                if sizes[index] > MAX_UNION or (candidates is not None
+                                                 and len(candidates) <= MAX_CANDIDATES):
+                    break
+                words = expansions[index]
+                if len(words) == 1:
+                    union = self._postings[next(iter(words))]
+                else:
+                    union = set().union(*(self._postings[word] for word in words))
+                candidates = union if candidates is None else candidates & union
+        if candidates is not None and len(candidates) <= MAX_CANDIDATES:
+            # Puede ser el conjunto de un índice: no se modifica
+            return [employee_id for employee_id in candidates
+                    if self._in_department(employee_id, departamento_id)]
+
+        driver = expansions[order[0]]
+        found = {}
+        for word in sorted(driver, key=driver.get, reverse=True):
+            for employee_id in self._postings[word]:
+                if candidates is not None and employee_id not in candidates:
+                    continue
+                if not self._in_department(employee_id, departamento_id):
+                    continue
+                found[employee_id] = None
+                if len(found) >= MAX_CANDIDATES:
+                    return found
+        return found
+
+    def _in_department(self, employee_id, departamento_id):
+        return departamento_id is None or self._rows[employee_id]['departamento_id'] == departamento_id
+
+    def _score(self, expansions, departamento_id):
+        scored = {}
+        for employee_id in self._candidates(expansions, departamento_id):
+            tokens = self._docs[employee_id]
+            score = 0.0
+            for words in expansions:
+                # Se recorre el menor de los dos: palabras del empleado o
+                # palabras que coinciden con la de la consulta
+                best = 0.0
+                if len(words) < len(tokens):
+                    for word, quality in words.items():
+                        weight = tokens.get(word)
+                        if weight is not None and quality * weight > best:
+                            best = quality * weight
+                else:
+                    for word, weight in tokens.items():
+                        quality = words.get(word)
+                        if quality is not None and quality * weight > best:
+                            best = quality * weight
+                if not best:
+                    break
+                score += best
+            else:
+                scored[employee_id] = score
+        return scored
+
+    def stats(self):
+        with self._lock:
+            return {
+                'employees': len(self._rows),
+                'words': len(self._words),
+                'emails': len(self._emails),
+                'trigrams': len(self._trigrams),
+                'searches': self.searches,
+                'reloads': self.reloads,
+                'refreshes': self.refreshes
+            }
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
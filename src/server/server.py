@@ -1,40 +1,185 @@
+import argparse
+import os
+import signal
 import socket
+import sys
 import json
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from admission import AdmissionControl
 from database_handler import DatabaseHandler
+from coalesce import SingleFlight, SharedResponse, coalesce_key
+from metrics import Metrics, MetricsExporter, SlowRequestProfiler
+# El protocolo se comparte con los clientes: vive en src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (CustomJSONEncoder, SocketReader, ProtocolError, encode_frame, encode_message,
+                      CODECS, MODE_FRAMED, PROTOCOL_VERSION, MAX_FRAME_SIZE, DEFAULT_CHUNK_SIZE,
+                      FRAME_HELLO, FRAME_MESSAGE, FRAME_CHUNK, FRAME_END)
 import logging
 import traceback
-from datetime import date, datetime
 
 logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        return super().default(obj)
+DEFAULT_MAX_PIPELINE = 64
+DEFAULT_DRAIN_TIMEOUT = 30
+# Al detenerse, una conexión sin peticiones en curso ni actividad durante este
+# tiempo se considera inactiva y se le corta la lectura.
+DRAIN_IDLE_GRACE = 0.1
+# Cada cuánto se buscan conexiones inactivas con idle_timeout
+IDLE_CHECK_INTERVAL = 1.0
+SUBSCRIPTION_OPERATIONS = ('SUBSCRIBE', 'UNSUBSCRIBE')
+# Operaciones que atiende el servidor. Las métricas se agrupan por operación:
+# cualquier otro valor enviado por el cliente cuenta como UNKNOWN, para no
+# crear series sin límite ni etiquetas de Prometheus con texto arbitrario.
+OPERATIONS = frozenset((
+    'INSERT', 'UPDATE', 'SELECT', 'DELETE', 'BULK_INSERT', 'BULK_UPDATE', 'CLOCK_IN',
+    'CLOCK_OUT', 'CLOCK_EVENTS', 'SEARCH', 'LEAVE_REQUEST', 'LEAVE_CHECK', 'LEAVE_CANCEL',
+    'WHO_IS_OUT', 'PAYROLL_REPORT', 'WORKFORCE_TIMESERIES', 'LIST_DEPARTAMENTOS', 'LIST_CARGOS',
+    'LIST_TIPOS_PERMISOS', 'CACHE_STATS', 'CACHE_FLUSH', 'STATS', 'PING'
+) + SUBSCRIPTION_OPERATIONS)
+UNKNOWN_OPERATION = 'UNKNOWN'
+# Operaciones que escriben empleados: tras ellas la sesión lee del primario
+WRITE_OPERATIONS = ('INSERT', 'UPDATE', 'DELETE', 'BULK_INSERT', 'BULK_UPDATE')
+# Espera máxima, al cerrar una conexión, a que cada suscripción envíe su
+# frame final
+SUBSCRIPTION_CLOSE_TIMEOUT = 1
+
+
+class ClientConnection:
+    # Estado de una conexión abierta que se necesita para el cierre ordenado
+    def __init__(self, sock, reader):
+        self.socket = sock
+        self.reader = reader
+        self.in_flight = 0
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()
+        # Read-your-writes: segundos tras una escritura de esta conexión en los
+        # que sus lecturas van al primario en lugar de a una réplica
+        self.read_your_writes = 0.0
+        self.last_write = None
+        # Suscripciones abiertas (protocolo con frames): la conexión no se
+        # cierra por inactividad mientras tenga alguna
+        self.subscriptions = None
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def subscribed(self):
+        return bool(self.subscriptions)
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+            self.last_activity = time.monotonic()
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.last_activity = time.monotonic()
+
+    def wrote(self):
+        self.last_write = time.monotonic()
+
+    def reads_from_primary(self):
+        return (self.last_write is not None
+                and time.monotonic() - self.last_write < self.read_your_writes)
+
+    def close_if_idle(self, grace=DRAIN_IDLE_GRACE):
+        # Cortar la lectura hace que el bucle de la conexión vea el fin de
+        # datos, espere las respuestas pendientes y cierre el socket.
+        with self.lock:
+            if (self.in_flight or self.reader.buffer
+                    or time.monotonic() - self.last_activity < grace):
+                return False
+        try:
+            self.socket.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        return True
+
 
 class Server:
-    def __init__(self, host='localhost', port=33056):
+    def __init__(self, host='localhost', port=33056, backlog=5, workers=None,
+                 max_pipeline=DEFAULT_MAX_PIPELINE, config_path=None, metrics_port=None,
+                 profile_slow=None, profile_sample_rate=0.01, profile_dir=None,
+                 listen_socket=None, reuse_port=False, drain_timeout=DEFAULT_DRAIN_TIMEOUT,
+                 initialize_database=True, coalesce_reads=True, cache=True, max_in_flight=None,
+                 rate_limit=None, rate_burst=None, queue_timeout=None, idle_timeout=None):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.db_handler = DatabaseHandler()
+        self.backlog = backlog
+        # En modo multiproceso cada worker abre su socket con SO_REUSEPORT o
+        # recibe el socket de escucha ya creado por el supervisor.
+        self.listening = listen_socket is not None
+        if listen_socket is None:
+            listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.server_socket = listen_socket
+        self.drain_timeout = drain_timeout
+        # Conexiones sin actividad durante idle_timeout segundos se cierran
+        self.idle_timeout = idle_timeout
+        self.admission = AdmissionControl(max_in_flight, rate_limit, rate_burst, queue_timeout)
+        self.stopping = False
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        self.db_handler = DatabaseHandler(config_path, initialize_database, cache)
+        # Hilos que atienden las peticiones en paralelo de una misma conexión
+        # (pipelining). Por defecto tantos como conexiones tiene el pool: más
+        # hilos solo esperarían una conexión libre.
+        self.workers = workers or self.db_handler.pool.max_size
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='request-worker')
+        self.max_pipeline = max_pipeline
+        # Los SELECT idénticos que llegan mientras otro igual está en curso
+        # comparten su ejecución y su respuesta codificada.
+        self.single_flight = None
+        if coalesce_reads:
+            self.single_flight = SingleFlight()
+            self.db_handler.add_commit_listener(self.single_flight.invalidate)
+
+        # Con profile_slow (segundos) se perfila una muestra de las peticiones
+        # y se guardan los perfiles de las que superan ese tiempo.
+        profiler = None
+        if profile_slow is not None:
+            profiler = SlowRequestProfiler(profile_slow, profile_sample_rate, profile_dir)
+        self.metrics = Metrics(profiler)
+        self.db_handler.pool.on_wait = self.metrics.observe_pool_wait
+        self.exporter = None
+        if metrics_port:
+            self.exporter = MetricsExporter(host, metrics_port, self.collect_metrics)
+
+    def collect_metrics(self):
+        return self.metrics, self.db_handler.pool.stats()
 
     def start(self):
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            if self.exporter:
+                self.exporter.start()
+            if not self.listening:
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen(self.backlog)
+                self.listening = True
             logging.info(f"Servidor iniciado en {self.host}:{self.port}")
+            if self.idle_timeout:
+                threading.Thread(target=self._close_idle_loop, name='idle-connections',
+                                 daemon=True).start()
 
-            while True:
-                client_socket, address = self.server_socket.accept()
+            while not self.stopping:
+                try:
+                    client_socket, address = self.server_socket.accept()
+                except OSError:
+                    if self.stopping:
+                        break
+                    raise
                 logging.info(f"Cliente conectado desde {address}")
                 client_thread = threading.Thread(
                     target=self.handle_client,
-                    args=(client_socket, address)
+                    args=(client_socket, address),
+                    daemon=True
                 )
                 client_thread.start()
 
@@ -43,50 +188,412 @@ class Server:
             logging.error(traceback.format_exc())
         finally:
             self.server_socket.close()
+            self.drain()
+
+    def stop(self):
+        # Deja de aceptar conexiones; drain() cierra las abiertas a medida que
+        # terminan sus peticiones en curso.
+        if self.stopping:
+            return
+        self.stopping = True
+        logging.info("Deteniendo el servidor...")
+        try:
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close_idle_connections(self, grace=DRAIN_IDLE_GRACE, keep_subscribed=False):
+        with self.connections_lock:
+            connections = list(self.connections)
+        closed = 0
+        for connection in connections:
+            if keep_subscribed and connection.subscribed():
+                continue
+            if connection.close_if_idle(grace):
+                closed += 1
+        return closed
+
+    def close_expired_connections(self):
+        # Cierra las conexiones sin actividad durante idle_timeout. Las que
+        # tienen suscripciones abiertas pueden pasar mucho tiempo sin enviar
+        # peticiones y no se cierran.
+        for _ in range(self.close_idle_connections(self.idle_timeout, keep_subscribed=True)):
+            self.admission.count_idle_closed()
+
+    def _close_idle_loop(self):
+        while not self.stopping:
+            time.sleep(min(IDLE_CHECK_INTERVAL, self.idle_timeout))
+            self.close_expired_connections()
+
+    def drain(self):
+        # Espera a que terminen las conexiones abiertas, como mucho drain_timeout
+        deadline = time.monotonic() + self.drain_timeout
+        while self.metrics.active_connections > 0 and time.monotonic() < deadline:
+            self.close_idle_connections()
+            time.sleep(0.05)
+        if self.metrics.active_connections > 0:
+            logging.warning(f"Se cierran {self.metrics.active_connections} conexiones sin terminar")
+        self.executor.shutdown(wait=False)
+        self.db_handler.close()
 
     def handle_client(self, client_socket, address):
+        reader = SocketReader(client_socket, on_read=self.metrics.add_bytes_in)
+        connection = ClientConnection(client_socket, reader)
+        connection.read_your_writes = self.db_handler.read_your_writes
+        self.metrics.connection_opened()
+        with self.connections_lock:
+            self.connections.add(connection)
+        try:
+            mode = reader.detect_mode()
+            if mode is None:
+                logging.info(f"Cliente {address} desconectado")
+            elif mode == MODE_FRAMED:
+                self._handle_framed(connection, address)
+            else:
+                self._handle_legacy(connection, address)
+
+        except Exception as e:
+            logging.error(f"Error manejando cliente {address}: {e}")
+        finally:
+            with self.connections_lock:
+                self.connections.discard(connection)
+            self.metrics.connection_closed()
+            client_socket.close()
+
+    def _socket_sender(self, client_socket):
+        def send(data):
+            client_socket.sendall(data)
+            self.metrics.add_bytes_out(len(data))
+        return send
+
+    def _handle_legacy(self, connection, address):
+        reader = connection.reader
+        send = self._socket_sender(connection.socket)
+        while True:
+            try:
+                request = reader.read_json()
+            except json.JSONDecodeError:
+                logging.error(f"Error decodificando JSON de {address}")
+                response = {'status': 'error', 'message': 'JSON inválido'}
+                send(json.dumps(response).encode('utf-8'))
+                continue
+
+            if request is None:
+                logging.info(f"Cliente {address} desconectado")
+                break
+
+            received_at = time.perf_counter()
+            operation = request_operation(request)
+            logging.debug(f"Solicitud {operation} recibida de {address}")
+            rejection = self._admit(connection, address, operation)
+            if rejection is not None:
+                send(encode_legacy(rejection))
+                continue
+            connection.begin()
+            try:
+                response = self._execute_shared(request, address, connection, received_at)
+                self._send_response(send, operation, received_at,
+                                    lambda: response.encoded('legacy', encode_legacy))
+            finally:
+                connection.end()
+                self.admission.release()
+
+    def _handle_framed(self, connection, address):
+        reader = connection.reader
+        frame = reader.read_frame()
+        if frame is None:
+            logging.info(f"Cliente {address} desconectado")
+            return
+
+        frame_type, stream_id, payload = frame
+        hello, response = self._handshake(frame_type, payload)
+        socket_send = self._socket_sender(connection.socket)
+        socket_send(encode_message(response, FRAME_HELLO, stream_id))
+        if hello is None:
+            return
+        if not hello.get('read_your_writes', True):
+            connection.read_your_writes = 0.0
+
+        # El id de stream de cada frame es el id de la petición. Con pipelining
+        # las peticiones se atienden en paralelo y las respuestas pueden salir
+        # en otro orden; el cliente las empareja por id.
+        send_lock = threading.Lock()
+
+        def send(frame_bytes):
+            with send_lock:
+                socket_send(frame_bytes)
+
+        pipelining = response['pipelining']
+        codec = CODECS[response['encoding']]
+        in_flight = threading.BoundedSemaphore(self.max_pipeline)
+        pending = set()
+        pending_lock = threading.Lock()
+        # Suscripciones abiertas en la conexión: id de stream -> (suscripción, hilo)
+        subscriptions = connection.subscriptions = {}
+
+        def finished(future):
+            with pending_lock:
+                pending.discard(future)
+            in_flight.release()
+            connection.end()
+            self.admission.release()
+
         try:
             while True:
-                data = client_socket.recv(4096)
-                if not data:
+                frame = reader.read_frame()
+                if frame is None:
                     logging.info(f"Cliente {address} desconectado")
                     break
 
+                frame_type, stream_id, payload = frame
+                if frame_type != FRAME_MESSAGE:
+                    raise ProtocolError(f"Tipo de frame inesperado: {frame_type}")
+
+                received_at = time.perf_counter()
                 try:
-                    request = json.loads(data.decode('utf-8'))
-                    logging.debug(f"Solicitud recibida de {address}: {request}")
-                except json.JSONDecodeError:
-                    logging.error(f"Error decodificando JSON de {address}")
-                    response = {'status': 'error', 'message': 'JSON inválido'}
-                    client_socket.send(json.dumps(response).encode('utf-8'))
+                    request = codec.decode(payload)
+                except (ValueError, ProtocolError):
+                    logging.error(f"Error decodificando la solicitud de {address}")
+                    response = {'status': 'error', 'message': 'Mensaje inválido'}
+                    send(encode_message(response, FRAME_MESSAGE, stream_id, codec))
                     continue
+                operation = request_operation(request)
+                self.metrics.observe(operation, 'decode', time.perf_counter() - received_at)
+                logging.debug(f"Solicitud {operation} recibida de {address}")
 
-                try:
-                    response = self.process_request(request)
-                    logging.debug(f"Respuesta para {address}: {response}")
+                # SUBSCRIBE deja el stream abierto: los eventos los envía un
+                # hilo propio y no ocupan un worker ni cuentan como en curso
+                if operation in SUBSCRIPTION_OPERATIONS:
+                    connection.touch()
+                    self._handle_subscription(send, request, stream_id, codec, subscriptions,
+                                              received_at)
+                    continue
 
-                    if not response:
-                        response = {'status': 'error', 'message': 'Sin respuesta del servidor'}
+                # Las peticiones que no se admiten se responden enseguida con
+                # 'busy', sin ocupar un worker ni una conexión de la base de datos
+                rejection = self._admit(connection, address, operation)
+                if rejection is not None:
+                    send(encode_message(rejection, FRAME_MESSAGE, stream_id, codec))
+                    continue
+
+                connection.begin()
+                if not pipelining:
+                    try:
+                        self._serve_request(send, request, stream_id, address, codec, received_at,
+                                            connection)
+                    finally:
+                        connection.end()
+                        self.admission.release()
+                    continue
 
-                    response_json = json.dumps(response, cls=CustomJSONEncoder)
-                    client_socket.send(response_json.encode('utf-8'))
+                # Si el cliente tiene demasiadas peticiones en curso se deja de
+                # leer del socket hasta que termine alguna.
+                in_flight.acquire()
+                future = self.executor.submit(self._serve_request, send, request, stream_id, address,
+                                              codec, received_at, connection)
+                with pending_lock:
+                    pending.add(future)
+                future.add_done_callback(finished)
+        finally:
+            # Las respuestas pendientes se terminan de enviar antes de cerrar
+            with pending_lock:
+                remaining = list(pending)
+            wait(remaining)
+            reason = 'shutdown' if self.stopping else 'disconnected'
+            for subscription, thread in subscriptions.values():
+                self.db_handler.subscriptions.unsubscribe(subscription, reason)
+            for subscription, thread in subscriptions.values():
+                thread.join(SUBSCRIPTION_CLOSE_TIMEOUT)
 
-                except Exception as e:
-                    logging.error(f"Error procesando solicitud de {address}: {e}")
-                    error_response = {
-                        'status': 'error',
-                        'message': f'Error interno del servidor: {str(e)}'
-                    }
-                    client_socket.send(json.dumps(error_response).encode('utf-8'))
+    def _handle_subscription(self, send, request, stream_id, codec, subscriptions, received_at):
+        operation = request_operation(request)
+        hub = self.db_handler.subscriptions
+        data = request.get('data') or {}
+        if operation == 'UNSUBSCRIBE':
+            entry = subscriptions.pop(data.get('stream_id'), None)
+            if entry is None:
+                response = {'status': 'error', 'message': 'No hay ninguna suscripción con ese stream_id'}
+            else:
+                hub.unsubscribe(entry[0])
+                response = {'status': 'success', 'message': 'Suscripción cancelada'}
+            self.metrics.count_request(operation, response)
+            self._send_response(send, operation, received_at,
+                                lambda: encode_message(response, FRAME_MESSAGE, stream_id, codec))
+            return
 
+        try:
+            if hub is None:
+                raise ValueError('Las suscripciones están desactivadas')
+            if stream_id in subscriptions:
+                raise ValueError('Ya hay una suscripción abierta con ese stream_id')
+            subscription = hub.subscribe(data)
         except Exception as e:
-            logging.error(f"Error manejando cliente {address}: {e}")
-        finally:
-            client_socket.close()
+            end = {'status': 'error', 'message': str(e)}
+            if hub is not None:
+                end.update(hub.position())
+            self.metrics.count_request(operation, end)
+            send(encode_message(end, FRAME_END, stream_id, codec))
+            return
+        thread = threading.Thread(target=self._push_events,
+                                  args=(send, subscription, stream_id, codec),
+                                  name=f'subscription-{stream_id}', daemon=True)
+        subscriptions[stream_id] = (subscription, thread)
+        thread.start()
+
+    def _push_events(self, send, subscription, stream_id, codec):
+        # Envía los eventos de una suscripción por lotes: el primer frame
+        # confirma la suscripción y el último indica por qué terminó
+        hub = self.db_handler.subscriptions
+        first = True
+        try:
+            while True:
+                subscription.wait()
+                events, seq, reason = hub.take(subscription)
+                if seq is not None and (events or first):
+                    payload = {'events': events, 'seq': seq}
+                    if first:
+                        payload = dict(status='success', epoch=hub.epoch, **payload)
+                        first = False
+                    send(encode_message(payload, FRAME_CHUNK, stream_id, codec))
+                    subscription.delivered_seq = seq
+                if reason:
+                    break
+            end = hub.end_message(subscription)
+            self.metrics.count_request('SUBSCRIBE', end)
+            send(encode_message(end, FRAME_END, stream_id, codec))
+        except OSError as e:
+            hub.unsubscribe(subscription, 'disconnected')
+            logging.info(f"No se pudieron enviar eventos de la suscripción {stream_id}: {e}")
+
+    def _serve_request(self, send, request, stream_id, address, codec, received_at,
+                       connection=None):
+        operation = request_operation(request)
+        try:
+            if operation == 'SELECT' and request.get('stream'):
+                end = self.admission.expired(received_at)
+                if end is not None:
+                    send(encode_message(end, FRAME_END, stream_id, codec))
+                else:
+                    end = self._send_stream(send, request, stream_id, codec,
+                                            self._reads_from_primary(connection))
+                self.metrics.count_request(operation, end)
+                self.metrics.observe(operation, 'total', time.perf_counter() - received_at)
+            else:
+                response = self._execute_shared(request, address, connection, received_at)
+                self._send_response(send, operation, received_at,
+                                    lambda: encode_frame(FRAME_MESSAGE,
+                                                         response.encoded(codec.name, codec.encode),
+                                                         stream_id))
+        except OSError as e:
+            logging.info(f"No se pudo enviar la respuesta a {address}: {e}")
+
+    def _send_response(self, send, operation, received_at, encode):
+        started = time.perf_counter()
+        data = encode()
+        encoded_at = time.perf_counter()
+        send(data)
+        sent_at = time.perf_counter()
+        self.metrics.observe(operation, 'encode', encoded_at - started)
+        self.metrics.observe(operation, 'send', sent_at - encoded_at)
+        self.metrics.observe(operation, 'total', sent_at - received_at)
+
+    def _handshake(self, frame_type, payload):
+        hello = json.loads(payload.decode('utf-8')) if frame_type == FRAME_HELLO else None
+        if not hello or hello.get('version') != PROTOCOL_VERSION:
+            return None, {'status': 'error', 'message': 'Handshake inválido o versión no soportada'}
+        # Codificación de los mensajes para el resto de la conexión
+        encoding = hello.get('encoding', 'json')
+        if encoding not in CODECS:
+            encoding = 'json'
+        return hello, {
+            'status': 'success',
+            'version': PROTOCOL_VERSION,
+            'max_frame_size': MAX_FRAME_SIZE,
+            'pipelining': bool(hello.get('pipelining')),
+            'max_pipeline': self.max_pipeline,
+            'encoding': encoding,
+            'read_your_writes': self.db_handler.read_your_writes if hello.get('read_your_writes', True) else 0
+        }
+
+    def _admit(self, connection, address, operation):
+        connection.touch()
+        rejection = self.admission.admit(address, self.stopping)
+        if rejection is not None:
+            logging.debug(f"Solicitud {operation} de {address} rechazada: {rejection['reason']}")
+            self.metrics.count_request(operation, rejection)
+        return rejection
+
+    def _reads_from_primary(self, connection):
+        return (self.db_handler.replicas is not None and connection is not None
+                and connection.reads_from_primary())
+
+    def _execute(self, request, address, connection=None, received_at=None):
+        operation = request_operation(request)
+        started = time.perf_counter()
+        # Una petición que esperó demasiado a un worker no llega a la base de datos
+        if received_at is not None:
+            response = self.admission.expired(received_at)
+            if response is not None:
+                self.metrics.count_request(operation, response)
+                return response
+        try:
+            response = self.metrics.run_profiled(operation, self.process_request, request,
+                                                 self._reads_from_primary(connection))
+
+            if not response:
+                response = {'status': 'error', 'message': 'Sin respuesta del servidor'}
+            elif (connection is not None and operation in WRITE_OPERATIONS
+                  and response.get('status') == 'success'):
+                connection.wrote()
+
+        except Exception as e:
+            logging.error(f"Error procesando solicitud de {address}: {e}")
+            response = {
+                'status': 'error',
+                'message': f'Error interno del servidor: {str(e)}'
+            }
+        self.metrics.observe(operation, 'execute', time.perf_counter() - started)
+        self.metrics.count_request(operation, response)
+        return response
+
+    def _execute_shared(self, request, address, connection=None, received_at=None):
+        # Devuelve un SharedResponse; las peticiones agrupadas reciben el de
+        # la que ejecutó la consulta y comparten su codificación. Las que
+        # deben leer del primario no se agrupan con las que van a réplicas.
+        key = None
+        if self.single_flight and not self._reads_from_primary(connection):
+            key = coalesce_key(request)
+        if key is None:
+            return SharedResponse(self._execute(request, address, connection, received_at))
+        shared, leader = self.single_flight.do(
+            key, lambda: SharedResponse(self._execute(request, address, connection, received_at)))
+        if not leader:
+            self.metrics.count_coalesced(request_operation(request), shared.response)
+        return shared
 
-    def process_request(self, request):
+    def _send_stream(self, send, request, stream_id, codec, primary=False):
+        # Envía el resultado como una serie de frames con bloques de filas
+        # seguidos de un frame final con el total o el error.
+        data = request.get('data', {})
+        chunk_size = int(request.get('chunk_size') or DEFAULT_CHUNK_SIZE)
+        row_count = 0
+        try:
+            for rows in self.db_handler.iter_employees(data, chunk_size, primary):
+                send(encode_message({'rows': rows}, FRAME_CHUNK, stream_id, codec))
+                row_count += len(rows)
+        except OSError:
+            raise
+        except Exception as e:
+            logging.error(f"Error en SELECT en streaming: {e}")
+            end = {'status': 'error', 'message': str(e), 'row_count': row_count}
+        else:
+            end = {'status': 'success', 'row_count': row_count}
+        send(encode_message(end, FRAME_END, stream_id, codec))
+        return end
+
+    def process_request(self, request, primary=False):
+        # primary: la sesión escribió hace poco y debe leer del primario
         try:
-            logging.debug(f"Procesando solicitud: {request}")
             operation = request.get('operation')
             data = request.get('data', {})
 
@@ -95,11 +602,48 @@ class Server:
             elif operation == 'UPDATE':
                 return self.db_handler.update_employee(data)
             elif operation == 'SELECT':
-                result = self.db_handler.select_employee(data)
-                logging.debug(f"Resultado SELECT: {result}")
-                return result
+                return self.db_handler.select_employee(data, primary)
             elif operation == 'DELETE':
                 return self.db_handler.delete_employee(data)
+            elif operation == 'BULK_INSERT':
+                return self.db_handler.bulk_insert_employees(data)
+            elif operation == 'BULK_UPDATE':
+                return self.db_handler.bulk_update_employees(data)
+            elif operation in ('CLOCK_IN', 'CLOCK_OUT'):
+                return self.db_handler.record_attendance([data], operation)
+            elif operation == 'CLOCK_EVENTS':
+                return self.db_handler.record_attendance(data.get('events') or [])
+            elif operation == 'SEARCH':
+                return self.db_handler.search_employees(data)
+            elif operation == 'LEAVE_REQUEST':
+                return self.db_handler.request_leave(data)
+            elif operation == 'LEAVE_CHECK':
+                return self.db_handler.check_leave(data)
+            elif operation == 'LEAVE_CANCEL':
+                return self.db_handler.cancel_leave(data)
+            elif operation == 'WHO_IS_OUT':
+                return self.db_handler.who_is_out(data)
+            elif operation in SUBSCRIPTION_OPERATIONS:
+                return {'status': 'error', 'message': f'{operation} requiere el protocolo con frames'}
+            elif operation == 'PAYROLL_REPORT':
+                return self.db_handler.payroll_report(data)
+            elif operation == 'WORKFORCE_TIMESERIES':
+                return self.db_handler.workforce_timeseries(data)
+            elif operation == 'LIST_DEPARTAMENTOS':
+                return self.db_handler.list_catalog('departamentos')
+            elif operation == 'LIST_CARGOS':
+                return self.db_handler.list_catalog(
+                    'cargo', {'departamento_id': data.get('departamento_id')})
+            elif operation == 'LIST_TIPOS_PERMISOS':
+                return self.db_handler.list_catalog('tipos_permisos', {'estado': data.get('estado')})
+            elif operation == 'CACHE_STATS':
+                return self.cache_stats()
+            elif operation == 'CACHE_FLUSH':
+                return self.cache_flush()
+            elif operation == 'STATS':
+                return self.stats(data)
+            elif operation == 'PING':
+                return {'status': 'success', 'message': 'pong'}
             else:
                 logging.warning(f"Operación no válida: {operation}")
                 return {'status': 'error', 'message': 'Operación no válida'}
@@ -109,7 +653,154 @@ class Server:
             logging.error(traceback.format_exc())
             return {'status': 'error', 'message': str(e)}
 
+    def cache_stats(self):
+        if not self.db_handler.cache:
+            return {'status': 'error', 'message': 'La caché está desactivada'}
+        return {'status': 'success', 'data': self.db_handler.cache.stats()}
+
+    def cache_flush(self):
+        if not self.db_handler.cache:
+            return {'status': 'error', 'message': 'La caché está desactivada'}
+        removed = self.db_handler.cache.clear()
+        logging.info(f"Caché vaciada ({removed} entradas)")
+        return {'status': 'success', 'message': 'Caché vaciada', 'removed': removed}
+
+
+    def stats(self, data):
+        pool = self.db_handler.pool.stats()
+        if data.get('format') == 'prometheus':
+            return {'status': 'success', 'data': self.metrics.prometheus(pool)}
+        cache = self.db_handler.cache.stats() if self.db_handler.cache else None
+        snapshot = self.metrics.snapshot(pool, cache)
+        if self.db_handler.group_commit:
+            snapshot['group_commit'] = self.db_handler.group_commit.stats()
+        if self.db_handler.catalog:
+            snapshot['catalog'] = self.db_handler.catalog.stats()
+        if self.db_handler.attendance:
+            snapshot['attendance'] = self.db_handler.attendance.stats()
+        if self.db_handler.search:
+            snapshot['search'] = self.db_handler.search.stats()
+        if self.db_handler.leaves:
+            snapshot['leave'] = self.db_handler.leaves.stats()
+        if self.db_handler.payroll:
+            snapshot['payroll'] = self.db_handler.payroll.stats()
+        if self.db_handler.workforce:
+            snapshot['workforce'] = self.db_handler.workforce.stats()
+        if self.db_handler.subscriptions:
+            snapshot['subscriptions'] = self.db_handler.subscriptions.stats()
+        if self.db_handler.replicas:
+            snapshot['replicas'] = self.db_handler.replicas.stats()
+        snapshot['admission'] = self.admission.stats()
+        return {'status': 'success', 'data': snapshot}
+
+
+def request_operation(request):
+    operation = request.get('operation') if isinstance(request, dict) else None
+    return operation if isinstance(operation, str) and operation in OPERATIONS else UNKNOWN_OPERATION
+
+
+def encode_legacy(response):
+    return json.dumps(response, cls=CustomJSONEncoder).encode('utf-8')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Servidor del sistema de recursos humanos')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=33056)
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded',
+                        help='threaded: un hilo por cliente; async: servidor asyncio')
+    parser.add_argument('--backlog', type=int, default=None,
+                        help='Tamaño de la cola de conexiones pendientes de listen()')
+    parser.add_argument('--max-connections', type=int, default=1000,
+                        help='Máximo de conexiones simultáneas (modo async)')
+    parser.add_argument('--db-workers', type=int, default=None,
+                        help='Hilos que ejecutan las peticiones contra la base de datos '
+                             '(por defecto el tamaño máximo del pool)')
+    parser.add_argument('--max-pipeline', type=int, default=DEFAULT_MAX_PIPELINE,
+                        help='Máximo de peticiones en curso por conexión con pipelining')
+    parser.add_argument('--config', default=None,
+                        help='Archivo de configuración (por defecto config/database.ini)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Publica /metrics en formato Prometheus en este puerto')
+    parser.add_argument('--profile-slow', type=float, default=None,
+                        help='Perfila con cProfile las peticiones que tarden más de estos ms')
+    parser.add_argument('--profile-sample-rate', type=float, default=0.01,
+                        help='Fracción de peticiones que se perfilan (con --profile-slow)')
+    parser.add_argument('--profile-dir', default=None,
+                        help='Directorio donde guardar los perfiles (.prof) de peticiones lentas')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Procesos worker que comparten el puerto (1: sin supervisor)')
+    parser.add_argument('--no-reuse-port', action='store_true',
+                        help='Los workers heredan el socket de escucha en lugar de usar SO_REUSEPORT')
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help='Segundos que se espera a las conexiones abiertas al detenerse')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Máximo de peticiones en curso en el servidor; las demás se "
+                             "rechazan con status 'busy'")
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Peticiones por segundo permitidas a cada cliente (por IP)')
+    parser.add_argument('--rate-burst', type=int, default=None,
+                        help='Ráfaga máxima de peticiones por cliente con --rate-limit')
+    parser.add_argument('--queue-timeout', type=float, default=None,
+                        help='Milisegundos que una petición puede esperar a un worker antes '
+                             "de rechazarse con 'busy'")
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='Segundos sin actividad tras los que se cierra una conexión '
+                             '(salvo las que tienen suscripciones abiertas)')
+    parser.add_argument('--no-coalesce', action='store_true',
+                        help='No agrupa los SELECT idénticos que están en curso a la vez')
+    parser.add_argument('--log-level', default='DEBUG',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Nivel de logging (las pruebas de carga usan WARNING)')
+    return parser.parse_args()
+
+
+def create_server(mode, host, port, backlog=None, max_connections=1000, db_workers=None, **options):
+    if mode == 'async':
+        from async_server import AsyncServer
+        return AsyncServer(host, port, backlog=backlog or 128, max_connections=max_connections,
+                           db_workers=db_workers, **options)
+    return Server(host, port, backlog=backlog or 5, workers=db_workers, **options)
+
 
 if __name__ == '__main__':
-    server = Server()
-    server.start()
\ No newline at end of file
+    args = parse_args()
+    logging.getLogger().setLevel(args.log_level)
+    options = {
+        'max_pipeline': args.max_pipeline,
+        'config_path': args.config,
+        'profile_slow': args.profile_slow / 1000 if args.profile_slow is not None else None,
+        'profile_sample_rate': args.profile_sample_rate,
+        'profile_dir': args.profile_dir,
+        'drain_timeout': args.drain_timeout,
+        'coalesce_reads': not args.no_coalesce,
+        'max_in_flight': args.max_in_flight,
+        'rate_limit': args.rate_limit,
+        'rate_burst': args.rate_burst,
+        'queue_timeout': args.queue_timeout / 1000 if args.queue_timeout is not None else None,
+        'idle_timeout': args.idle_timeout
+    }
+    server_args = {
+        'mode': args.mode,
+        'host': args.host,
+        'port': args.port,
+        'backlog': args.backlog,
+        'max_connections': args.max_connections,
+        'db_workers': args.db_workers
+    }
+    if args.processes > 1:
+        from supervisor import Supervisor
+        try:
+            server = Supervisor(args.processes, server_args, options,
+                                reuse_port=not args.no_reuse_port and hasattr(socket, 'SO_REUSEPORT'),
+                                metrics_port=args.metrics_port, drain_timeout=args.drain_timeout)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+    else:
+        server = create_server(**server_args, metrics_port=args.metrics_port, **options)
+        # Ctrl-C también detiene el servidor de forma ordenada: deja de aceptar
+        # conexiones y espera a las transacciones en curso
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: server.stop())
+    server.start()
@@ -0,0 +1,358 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+# Campos de empleado que viajan en los eventos (además de salario)
+EVENT_FIELDS = ('primer_nombre', 'segundo_nombre', 'primer_apellido', 'segundo_apellido',
+                'email', 'celular', 'fecha_contratacion', 'estado', 'departamento_id', 'cargo_id')
+SLOW_CONSUMER_POLICIES = ('coalesce', 'drop')
+# Motivos de cierre de una suscripción y mensaje del frame final
+CLOSE_REASONS = {
+    'unsubscribed': 'Suscripción cancelada por el cliente',
+    'slow_consumer': 'Suscripción cancelada: el cliente no consume los eventos a tiempo',
+    'disconnected': 'Cliente desconectado',
+    'shutdown': 'Servidor detenido'
+}
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _id_filter(value, name):
+    # Acepta un id o una lista de ids
+    if value is None:
+        return None
+    values = value if isinstance(value, (list, tuple)) else [value]
+    ids = {_as_int(item) for item in values}
+    if not ids or None in ids:
+        raise ValueError(f"{name} debe ser un id o una lista de ids")
+    return frozenset(ids)
+
+
+def _merge(older, newer):
+    # Un solo evento con el estado final de dos cambios del mismo empleado
+    if newer['type'] == 'delete' or older['type'] == 'delete':
+        event_type, data = newer['type'], newer['data']
+    else:
+        event_type = 'insert' if older['type'] == 'insert' else newer['type']
+        data = dict(older['data'], **newer['data'])
+    merged = dict(newer, type=event_type, data=data, coalesced=True)
+    merged.pop('departamento_anterior', None)
+    if older['type'] != 'insert':
+        previous = older.get('departamento_anterior', older['departamento_id'])
+        if previous != merged['departamento_id']:
+            merged['departamento_anterior'] = previous
+    return merged
+
+
+class Subscription:
+    # Estado de un suscriptor. Lo modifica SubscriptionHub con su lock; el hilo
+    # o la tarea que envía los eventos espera con wait() y los recoge con take().
+    def __init__(self, departments, employees, max_buffer, slow_consumer, start_seq,
+                 on_ready=None):
+        self.departments = departments
+        self.employees = employees
+        self.max_buffer = max_buffer
+        self.slow_consumer = slow_consumer
+        # Último seq enviado al cliente: con él puede reanudar la suscripción
+        self.delivered_seq = start_seq
+        self.buffer = deque()
+        self.closed = None
+        self.coalesced = 0
+        self._ready = threading.Event()
+        self._on_ready = on_ready
+
+    def matches(self, event):
+        if self.departments is None and self.employees is None:
+            return True
+        if self.employees is not None and event['id'] in self.employees:
+            return True
+        return self.departments is not None and (
+            event['departamento_id'] in self.departments
+            or event.get('departamento_anterior') in self.departments)
+
+    def offer(self, events):
+        # Devuelve False si el suscriptor se descarta por ir demasiado lento
+        self.buffer.extend(events)
+        if len(self.buffer) > self.max_buffer:
+            if self.slow_consumer == 'coalesce':
+                self._coalesce()
+            # Si ni agrupando queda por debajo de la mitad del buffer el
+            # cliente va demasiado atrasado: se le corta y debe reanudar.
+            if self.slow_consumer == 'drop' or len(self.buffer) > self.max_buffer // 2:
+                self.buffer.clear()
+                self.close('slow_consumer')
+                return False
+        self.notify()
+        return True
+
+    def _coalesce(self):
+        # Deja un evento por empleado, en el orden de su último cambio
+        merged = {}
+        for event in self.buffer:
+            previous = merged.pop(event['id'], None)
+            merged[event['id']] = _merge(previous, event) if previous else event
+        self.coalesced += len(self.buffer) - len(merged)
+        self.buffer = deque(merged.values())
+
+    def close(self, reason):
+        if self.closed is None:
+            self.closed = reason
+        self.notify()
+
+    def notify(self):
+        self._ready.set()
+        if self._on_ready is not None:
+            try:
+                self._on_ready()
+            except RuntimeError:
+                # El bucle asyncio del suscriptor ya se cerró
+                pass
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+
+class SubscriptionHub:
+    # Eventos de cambios de empleados para SUBSCRIBE. Cada cambio confirmado
+    # por este proceso recibe un número de secuencia y se guarda en un
+    # historial acotado; un cliente que se reconecta pide los eventos
+    # posteriores al último seq que recibió. Hasta la primera suscripción no
+    # se hace nada: al activarse se carga el departamento de cada empleado para
+    # poder filtrar las modificaciones que no lo incluyen.
+    def __init__(self, handler, history=10000, buffer_size=1000, slow_consumer='coalesce',
+                 max_subscribers=1000):
+        if slow_consumer not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"slow_consumer debe ser uno de: {', '.join(SLOW_CONSUMER_POLICIES)}")
+        self.handler = handler
+        self.buffer_size = buffer_size
+        self.slow_consumer = slow_consumer
+        self.max_subscribers = max_subscribers
+        # Identifica esta instancia: los seq de otra (tras reiniciar o en otro
+        # worker) no sirven para reanudar
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.history = deque(maxlen=history)
+        self.events = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._active = False
+        self._loading = False
+        self._pending = []
+        self._departments = {}
+        self._subscribers = set()
+        self._everything = set()
+        self._by_department = {}
+        self._by_employee = {}
+        self._lock = threading.Lock()
+        self._activate_lock = threading.Lock()
+
+    def _activate(self):
+        with self._activate_lock:
+            if self._active:
+                return
+            with self._lock:
+                self._loading = True
+                self._active = True
+            try:
+                started = time.perf_counter()
+                with self.handler._cursor(dictionary=False) as cursor:
+                    cursor.execute("SELECT id, departamento_id FROM empleados")
+                    departments = dict(cursor.fetchall())
+            except Exception:
+                with self._lock:
+                    self._active = self._loading = False
+                    self._pending = []
+                raise
+            with self._lock:
+                self._departments = departments
+                # Cambios confirmados mientras se cargaba
+                pending, self._pending = self._pending, []
+                self._publish(pending, {})
+                self._loading = False
+            logging.info(f"Suscripciones activadas: {len(departments)} empleados en "
+                         f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def on_commit(self, changes):
+        # Listener de commits de DatabaseHandler
+        if not self._active:
+            return
+        with self._lock:
+            if self._loading:
+                self._pending.extend(changes)
+                return
+            missing = {_as_int(change.get('id')) for change in changes if change['type'] != 'insert'}
+            missing = [employee_id for employee_id in missing
+                       if employee_id is not None and employee_id not in self._departments]
+        # Empleados creados por otro proceso: se consulta su departamento
+        known = self._lookup(missing) if missing else {}
+        with self._lock:
+            self._publish(changes, known)
+
+    def _lookup(self, ids):
+        try:
+            placeholders = ', '.join(['%s'] * len(ids))
+            with self.handler._cursor(dictionary=False) as cursor:
+                cursor.execute(f"SELECT id, departamento_id FROM empleados WHERE id IN ({placeholders})",
+                               ids)
+                return dict(cursor.fetchall())
+        except Exception as e:
+            logging.error(f"Error consultando departamentos para las suscripciones: {e}")
+            return {}
+
+    def _publish(self, changes, known):
+        deliveries = {}
+        for change in changes:
+            event = self._event(change, known)
+            if event is None:
+                continue
+            self.history.append(event)
+            self.events += 1
+            targets = set(self._everything)
+            targets.update(self._by_employee.get(event['id'], ()))
+            for department in (event['departamento_id'], event.get('departamento_anterior')):
+                targets.update(self._by_department.get(department, ()))
+            for subscription in targets:
+                deliveries.setdefault(subscription, []).append(event)
+        for subscription, events in deliveries.items():
+            coalesced = subscription.coalesced
+            if not subscription.offer(events):
+                self.dropped += 1
+                self._unregister(subscription)
+                logging.warning(f"Suscriptor descartado por lento (seq {subscription.delivered_seq})")
+            self.coalesced += subscription.coalesced - coalesced
+
+    def _event(self, change, known):
+        employee_id = _as_int(change.get('id'))
+        if employee_id is None:
+            return None
+        data = change.get('data') or {}
+        previous = self._departments.get(employee_id, known.get(employee_id))
+        if change['type'] == 'delete':
+            department = previous
+            fields = {'motivo': data['motivo']} if data.get('motivo') else {}
+        else:
+            department = _as_int(data['departamento_id']) if 'departamento_id' in data else previous
+            fields = {field: data[field] for field in EVENT_FIELDS if field in data}
+            if isinstance(data.get('salario'), dict):
+                fields['salario'] = data['salario']
+        self._departments[employee_id] = department
+        self.seq += 1
+        event = {'seq': self.seq, 'type': change['type'], 'id': employee_id,
+                 'departamento_id': department, 'ts': round(time.time(), 3), 'data': fields}
+        if change['type'] == 'update' and previous is not None and previous != department:
+            event['departamento_anterior'] = previous
+        return event
+
+    def subscribe(self, data, on_ready=None):
+        # data: departamento_id y/o empleado_id (id o lista; basta con que
+        # coincida uno de los dos) y, para reanudar, since y epoch
+        departments = _id_filter(data.get('departamento_id'), 'departamento_id')
+        employees = _id_filter(data.get('empleado_id'), 'empleado_id')
+        since = data.get('since')
+        if since is not None:
+            since = _as_int(since)
+            if since is None or since < 0:
+                raise ValueError("since debe ser un número de secuencia")
+        self._activate()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise ValueError("Se alcanzó el máximo de suscripciones")
+            backlog = []
+            if since is not None:
+                if data.get('epoch') not in (None, self.epoch) or since > self.seq:
+                    raise ValueError("La secuencia es de otra instancia del servidor: "
+                                     "recargue los datos y suscríbase sin since")
+                oldest = self.history[0]['seq'] if self.history else self.seq + 1
+                if since < oldest - 1:
+                    raise ValueError("Los eventos desde esa secuencia ya no se conservan: "
+                                     "recargue los datos y suscríbase sin since")
+                subscription = Subscription(departments, employees, self.buffer_size,
+                                            self.slow_consumer, since, on_ready)
+                backlog = [event for event in self.history
+                           if event['seq'] > since and subscription.matches(event)]
+            else:
+                subscription = Subscription(departments, employees, self.buffer_size,
+                                            self.slow_consumer, self.seq, on_ready)
+            # El historial pendiente se entrega entero aunque supere el buffer
+            subscription.buffer.extend(backlog)
+            self._register(subscription)
+            subscription.notify()
+        return subscription
+
+    def take(self, subscription):
+        # Eventos pendientes, seq hasta el que el suscriptor está al día y
+        # motivo de cierre (None si sigue activo)
+        with self._lock:
+            subscription._ready.clear()
+            events = list(subscription.buffer)
+            subscription.buffer.clear()
+            seq = None if subscription.closed == 'slow_consumer' else self.seq
+            return events, seq, subscription.closed
+
+    def end_message(self, subscription):
+        reason = subscription.closed
+        return {
+            'status': 'success' if reason == 'unsubscribed' else 'error',
+            'reason': reason,
+            'message': CLOSE_REASONS.get(reason, reason),
+            'epoch': self.epoch,
+            'seq': subscription.delivered_seq
+        }
+
+    def position(self):
+        with self._lock:
+            return {'epoch': self.epoch, 'seq': self.seq}
+
+    def unsubscribe(self, subscription, reason='unsubscribed'):
+        with self._lock:
+            self._unregister(subscription)
+            subscription.close(reason)
+
+    def _register(self, subscription):
+        self._subscribers.add(subscription)
+        if subscription.departments is None and subscription.employees is None:
+            self._everything.add(subscription)
+        for index, keys in ((self._by_department, subscription.departments),
+                            (self._by_employee, subscription.employees)):
+            for key in keys or ():
+                index.setdefault(key, set()).add(subscription)
+
+    def _unregister(self, subscription):
+        self._subscribers.discard(subscription)
+        self._everything.discard(subscription)
+        for index, keys in ((self._by_department, subscription.departments),
+                            (self._by_employee, subscription.employees)):
+            for key in keys or ():
+                members = index.get(key)
+                if members is not None:
+                    members.discard(subscription)
+                    if not members:
+                        del index[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'subscribers': len(self._subscribers),
+                'epoch': self.epoch,
+                'seq': self.seq,
+                'history': len(self.history),
+                'events': self.events,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'buffer_size': self.buffer_size,
+                'slow_consumer': self.slow_consumer
+            }
+
+    def close(self):
+        with self._lock:
+            for subscription in list(self._subscribers):
+                self._unregister(subscription)
+                subscription.close('shutdown')
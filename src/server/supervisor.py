@@ -0,0 +1,207 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from backends import create_backend
+from database_handler import read_config
+from metrics import Metrics, MetricsExporter
+
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# Un worker que vive menos que esto se considera un fallo al arrancar y el
+# siguiente reinicio espera el doble, para no entrar en un bucle de reinicios.
+STABLE_AFTER = 10.0
+STATS_TIMEOUT = 5.0
+
+
+def run_worker(index, server_args, options, control, listen_socket=None, reuse_port=False):
+    # Punto de entrada de cada proceso worker: su propio servidor, su propio
+    # pool de conexiones y un hilo que atiende las órdenes del supervisor.
+    from server import create_server
+
+    # Ctrl+C llega a todo el grupo de procesos: solo el supervisor lo atiende
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Sin caché de empleados: cada worker solo invalidaría la suya con sus
+    # propias escrituras y serviría filas obsoletas de las de los demás
+    server = create_server(**server_args, listen_socket=listen_socket, reuse_port=reuse_port,
+                           initialize_database=False, cache=False, **options)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+
+    def control_loop():
+        while True:
+            try:
+                command = control.recv()
+            except (EOFError, OSError):
+                return
+            name, sequence = command
+            if name == 'stats':
+                metrics, pool = server.collect_metrics()
+                control.send((sequence, metrics, pool))
+
+    threading.Thread(target=control_loop, name='worker-control', daemon=True).start()
+    logging.info(f"Worker {index} iniciado (pid {os.getpid()})")
+    server.start()
+
+
+class WorkerProcess:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.control = None
+        self.lock = threading.Lock()
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = None
+        self.sequence = 0
+
+
+def private_database(config):
+    # Una base SQLite en memoria es propia de cada proceso: cada worker
+    # tendría la suya, vacía, y no vería las escrituras de los demás
+    if config.get('database', 'backend', fallback='mysql').lower() != 'sqlite':
+        return False
+    return config.get('sqlite', 'path', fallback=':memory:') == ':memory:'
+
+
+class Supervisor:
+    # Lanza N procesos worker que atienden el mismo puerto, reinicia los que
+    # terminan inesperadamente, los detiene de forma ordenada con SIGTERM y
+    # combina sus métricas.
+    def __init__(self, processes, server_args, options, reuse_port=True, metrics_port=None,
+                 drain_timeout=30.0):
+        if processes > 1 and private_database(read_config(options.get('config_path'))):
+            raise ValueError("Con --processes mayor que 1 la base SQLite no puede estar en "
+                             "memoria: indique en [sqlite] path la ruta de un archivo")
+        self.processes = processes
+        self.server_args = server_args
+        self.options = options
+        self.reuse_port = reuse_port
+        self.drain_timeout = drain_timeout
+        self.context = multiprocessing.get_context('fork')
+        self.workers = [WorkerProcess(index) for index in range(processes)]
+        self.listen_socket = None
+        self.stopping = False
+        self.exporter = None
+        if metrics_port:
+            self.exporter = MetricsExporter(server_args['host'], metrics_port, self.collect_metrics)
+
+    def start(self):
+        host, port = self.server_args['host'], self.server_args['port']
+        if not self.reuse_port:
+            # Sin SO_REUSEPORT los workers heredan un único socket de escucha
+            # y el kernel reparte los accept entre ellos.
+            self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listen_socket.bind((host, port))
+            self.listen_socket.listen(self.server_args.get('backlog') or 128)
+
+        # La base de datos se prepara una sola vez (p. ej. el esquema SQLite)
+        # antes de lanzar los workers, que no comparten pool ni conexiones.
+        # Solo el backend: sin pool, índices ni hilos de refresco.
+        create_backend(read_config(self.options.get('config_path'))).close()
+
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        for worker in self.workers:
+            self._spawn(worker)
+        if self.exporter:
+            self.exporter.start()
+        logging.info(f"Supervisor iniciado en {host}:{port} con {self.processes} workers "
+                     f"({'SO_REUSEPORT' if self.reuse_port else 'socket compartido'})")
+
+        try:
+            while not self.stopping:
+                self._check_workers()
+                time.sleep(0.2)
+        finally:
+            self._shutdown()
+
+    def _handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def _spawn(self, worker):
+        parent, child = self.context.Pipe()
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker.index, self.server_args, self.options, child, self.listen_socket,
+                  self.reuse_port),
+            name=f'rh-worker-{worker.index}')
+        process.start()
+        child.close()
+        worker.process = process
+        worker.control = parent
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process.is_alive():
+                if now - worker.started_at > STABLE_AFTER:
+                    worker.restart_delay = RESTART_DELAY
+                continue
+            if worker.restart_at is None:
+                logging.error(f"Worker {worker.index} (pid {worker.process.pid}) terminó con "
+                              f"código {worker.process.exitcode}; se reinicia en "
+                              f"{worker.restart_delay:.0f} s")
+                with worker.lock:
+                    worker.control.close()
+                worker.restart_at = now + worker.restart_delay
+                if now - worker.started_at < STABLE_AFTER:
+                    worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+            elif now >= worker.restart_at:
+                worker.restarts += 1
+                with worker.lock:
+                    self._spawn(worker)
+
+    def _shutdown(self):
+        # SIGTERM a cada worker: dejan de aceptar y terminan sus conexiones
+        logging.info("Deteniendo workers...")
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + self.drain_timeout + 5
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logging.warning(f"Worker {worker.index} no terminó a tiempo, se fuerza el cierre")
+                worker.process.kill()
+                worker.process.join()
+        if self.exporter:
+            self.exporter.stop()
+        if self.listen_socket:
+            self.listen_socket.close()
+        logging.info("Supervisor detenido")
+
+    def collect_metrics(self):
+        # Suma las métricas y el estado de los pools de todos los workers vivos
+        combined = Metrics()
+        pool = {'size': 0, 'idle': 0, 'in_use': 0, 'waiting': 0, 'max_size': 0}
+        for worker in self.workers:
+            with worker.lock:
+                if worker.restart_at is not None or not worker.process.is_alive():
+                    continue
+                worker.sequence += 1
+                try:
+                    worker.control.send(('stats', worker.sequence))
+                    # Se descartan respuestas atrasadas de peticiones anteriores
+                    reply = None
+                    while worker.control.poll(STATS_TIMEOUT):
+                        reply = worker.control.recv()
+                        if reply[0] == worker.sequence:
+                            break
+                        reply = None
+                    if reply is None:
+                        continue
+                    _, metrics, worker_pool = reply
+                except (EOFError, OSError):
+                    continue
+            combined.merge(metrics)
+            for key in pool:
+                pool[key] += worker_pool.get(key, 0)
+        return combined, pool
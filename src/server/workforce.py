@@ -0,0 +1,436 @@
+import logging
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+from payroll import GROUP_COLUMNS
+
+# Una fila por empleado con su último retiro. Los inactivos sin fila en
+# historicos (dados de baja con UPDATE) se toman como retirados el día de su
+# última modificación.
+WORKFORCE_QUERY = """
+    SELECT e.id, e.departamento_id, e.cargo_id, e.fecha_contratacion, e.estado, e.updated_at,
+           (SELECT MAX(h.fecha_retiro) FROM historicos h WHERE h.empleado_id = e.id) AS fecha_retiro
+    FROM empleados e
+"""
+INTERVALS = ('day', 'week', 'month', 'quarter', 'year')
+MAX_BUCKETS = 1000
+# Margen de días al crear el rango de fechas del índice, para que las altas y
+# bajas de los próximos meses no obliguen a reconstruirlo
+DAY_MARGIN = 366
+NO_GROUP = -1
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value}")
+
+
+def _group_id(value):
+    return NO_GROUP if value is None else int(value)
+
+
+def _periods(start, end, interval):
+    # Periodos consecutivos [desde, hasta] que cubren [start, end]; el primero
+    # y el último se recortan al rango pedido
+    periods = []
+    current = start
+    while current <= end:
+        if interval == 'day':
+            following = current + timedelta(days=1)
+        elif interval == 'week':
+            following = current + timedelta(days=7 - current.weekday())
+        else:
+            months = {'month': 1, 'quarter': 3, 'year': 12}[interval]
+            month = current.month - 1
+            month = month - month % months + months
+            following = date(current.year + month // 12, month % 12 + 1, 1)
+        periods.append((current, min(following - timedelta(days=1), end)))
+        if len(periods) > MAX_BUCKETS:
+            raise ValueError(f"El rango tiene más de {MAX_BUCKETS} periodos: use un intervalo mayor")
+        current = following
+    return periods
+
+
+class FenwickTree:
+    # Árbol de Fenwick (binary indexed tree) de enteros: suma un valor en una
+    # posición y devuelve la suma de un prefijo en O(log n)
+    def __init__(self, size):
+        self.size = size
+        self.tree = array('i', bytes(4 * (size + 1)))
+
+    @classmethod
+    def from_counts(cls, counts):
+        # Construcción en O(n): cada nodo pasa su suma acumulada a su padre
+        fenwick = cls(len(counts))
+        tree = fenwick.tree
+        for index, value in enumerate(counts, 1):
+            tree[index] += value
+            parent = index + (index & -index)
+            if parent <= fenwick.size:
+                tree[parent] += tree[index]
+        return fenwick
+
+    def add(self, index, delta):
+        index += 1
+        tree = self.tree
+        while index <= self.size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        # Suma de las posiciones 0..index (0 si index es negativo)
+        index = min(index, self.size - 1) + 1
+        tree = self.tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+
+class EventSeries:
+    # Altas y bajas por día de un grupo de empleados
+    __slots__ = ('hires', 'exits')
+
+    def __init__(self, hires, exits):
+        self.hires = hires
+        self.exits = exits
+
+    def headcount(self, day):
+        # Empleados contratados hasta ese día que no se han retirado
+        return self.hires.prefix(day) - self.exits.prefix(day)
+
+
+class WorkforceTimeline:
+    # Altas y bajas de todos los empleados indexadas por día (desde origin)
+    # en tres niveles: total, por departamento y por departamento y cargo.
+    # Sin lock propio.
+    def __init__(self, origin, size):
+        self.origin = origin
+        self.size = size
+        self.employees = {}
+        self.groups = {}
+
+    @classmethod
+    def build(cls, employees, today=None):
+        days = [day for record in employees.values() for day in record[2:] if day is not None]
+        today = (today or date.today()).toordinal()
+        origin = min(days + [today]) - DAY_MARGIN
+        size = max(days + [today]) + DAY_MARGIN - origin + 1
+        timeline = cls(origin, size)
+        timeline.employees = dict(employees)
+        timeline._index()
+        return timeline
+
+    def _index(self):
+        counts = {}
+        for department, cargo, hired, retired in self.employees.values():
+            for key in ((), (department,), (department, cargo)):
+                hires, exits = counts.setdefault(key, ([0] * self.size, [0] * self.size))
+                if hired is not None:
+                    hires[hired - self.origin] += 1
+                if retired is not None:
+                    exits[retired - self.origin] += 1
+        self.groups = {key: EventSeries(FenwickTree.from_counts(hires), FenwickTree.from_counts(exits))
+                       for key, (hires, exits) in counts.items()}
+
+    def _series(self, key):
+        series = self.groups.get(key)
+        if series is None:
+            series = self.groups[key] = EventSeries(FenwickTree(self.size), FenwickTree(self.size))
+        return series
+
+    def _count(self, record, delta):
+        department, cargo, hired, retired = record
+        for key in ((), (department,), (department, cargo)):
+            series = self._series(key)
+            if hired is not None:
+                series.hires.add(hired - self.origin, delta)
+            if retired is not None:
+                series.exits.add(retired - self.origin, delta)
+
+    def set_employee(self, employee_id, department, cargo, hired, retired):
+        record = (department, cargo, hired, retired)
+        if self.employees.get(employee_id) == record:
+            return
+        days = [day for day in (hired, retired) if day is not None]
+        if days and (min(days) < self.origin or max(days) >= self.origin + self.size):
+            # Fecha fuera del rango del índice: se reconstruye con uno mayor
+            self.employees[employee_id] = record
+            rebuilt = WorkforceTimeline.build(self.employees)
+            self.origin, self.size, self.groups = rebuilt.origin, rebuilt.size, rebuilt.groups
+            return
+        previous = self.employees.get(employee_id)
+        if previous is not None:
+            self._count(previous, -1)
+        self.employees[employee_id] = record
+        self._count(record, 1)
+
+    def update_employee(self, employee_id, fields, today):
+        # Cambios parciales de un UPDATE; los empleados que no están en el
+        # índice (dados de alta por otro proceso) llegan con el refresco
+        record = self.employees.get(employee_id)
+        if record is None:
+            return
+        department, cargo, hired, retired = record
+        if 'departamento_id' in fields:
+            department = _group_id(fields['departamento_id'])
+        if 'cargo_id' in fields:
+            cargo = _group_id(fields['cargo_id'])
+        if fields.get('fecha_contratacion') is not None:
+            hired = as_date(fields['fecha_contratacion']).toordinal()
+        if 'estado' in fields:
+            if fields['estado'] in (None, 0, False, '0'):
+                retired = retired or today
+            else:
+                retired = None
+        self.set_employee(employee_id, department, cargo, hired, retired)
+
+    def retire_employee(self, employee_id, today):
+        record = self.employees.get(employee_id)
+        if record is not None:
+            self.set_employee(employee_id, record[0], record[1], record[2], today)
+
+    def select(self, group_by, departamento_id=None, cargo_id=None):
+        # Series de cada combinación de group_by, desde el nivel más agregado
+        # que permite responder: {clave: [series]}
+        if 'cargo' in group_by or cargo_id is not None:
+            level = 2
+        elif 'departamento' in group_by or departamento_id is not None:
+            level = 1
+        else:
+            level = 0
+        selected = {}
+        for key, series in self.groups.items():
+            if len(key) != level:
+                continue
+            values = {'departamento': key[0] if level else None,
+                      'cargo': key[1] if level == 2 else None}
+            if departamento_id is not None and values['departamento'] != departamento_id:
+                continue
+            if cargo_id is not None and values['cargo'] != cargo_id:
+                continue
+            selected.setdefault(tuple(values[group] for group in group_by), []).append(series)
+        return selected
+
+    def day(self, value):
+        return value.toordinal() - self.origin
+
+
+class WorkforceIndex:
+    # WORKFORCE_TIMESERIES: plantilla, altas, bajas y rotación por periodo
+    # calculadas con sumas de prefijo sobre árboles de Fenwick de altas
+    # (fecha_contratacion) y bajas (último fecha_retiro de historicos) por
+    # día. Una consulta cuesta O(grupos * periodos * log días) y no toca la
+    # base de datos. Las altas, bajas y cambios de departamento o cargo de
+    # este proceso se aplican al confirmarse; los de otros procesos se
+    # recogen recargando todo cada refresh_interval segundos.
+    def __init__(self, handler, refresh_interval=300.0):
+        self.handler = handler
+        self.refresh_interval = refresh_interval
+        self.ready = False
+        self.reloads = 0
+        self.updates = 0
+        self.queries = 0
+        self._timeline = WorkforceTimeline.build({})
+        self._lock = threading.Lock()
+        self._pending = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.reload()
+        if self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='workforce-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.reload()
+
+    def reload(self):
+        # Igual que en LeaveIndex: los cambios locales que llegan durante la
+        # carga se anotan y se repiten sobre el índice nuevo
+        with self._lock:
+            self._pending = []
+        try:
+            with self.handler._cursor() as cursor:
+                cursor.execute(WORKFORCE_QUERY)
+                rows = cursor.fetchall()
+        except self.handler.backend.Error as err:
+            logging.error(f"Error cargando altas y bajas de empleados: {err}")
+            with self._lock:
+                self._pending = None
+            return False
+
+        employees = {}
+        for row in rows:
+            hired = as_date(row['fecha_contratacion']).toordinal()
+            retired = None
+            if not row['estado']:
+                retired = row['fecha_retiro'] or row['updated_at'] or row['fecha_contratacion']
+                retired = as_date(retired).toordinal()
+            employees[int(row['id'])] = (_group_id(row['departamento_id']),
+                                         _group_id(row['cargo_id']), hired, retired)
+        timeline = WorkforceTimeline.build(employees)
+        with self._lock:
+            for apply, argument in self._pending:
+                apply(timeline, *argument)
+            self._pending = None
+            self._timeline = timeline
+            self.reloads += 1
+            self.ready = True
+        return True
+
+    def _apply(self, apply, *argument):
+        # Con el lock tomado
+        apply(self._timeline, *argument)
+        if self._pending is not None:
+            self._pending.append((apply, argument))
+
+    def on_commit(self, changes):
+        # Listener de commits de DatabaseHandler
+        today = date.today().toordinal()
+        with self._lock:
+            for change in changes:
+                data = change.get('data') or {}
+                try:
+                    employee_id = int(change['id'])
+                    if change['type'] == 'insert':
+                        retired = today if data.get('estado') in (0, False, '0') else None
+                        self._apply(WorkforceTimeline.set_employee, employee_id,
+                                    _group_id(data.get('departamento_id')),
+                                    _group_id(data.get('cargo_id')),
+                                    as_date(data['fecha_contratacion']).toordinal(), retired)
+                    elif change['type'] == 'update':
+                        self._apply(WorkforceTimeline.update_employee, employee_id, data, today)
+                    elif change['type'] == 'delete':
+                        self._apply(WorkforceTimeline.retire_employee, employee_id, today)
+                except (KeyError, TypeError, ValueError) as e:
+                    logging.warning(f"Cambio no aplicado al índice de plantilla: {e}")
+                    continue
+                self.updates += 1
+
+    def timeseries(self, data):
+        group_by = data.get('group_by') or []
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        unknown = [group for group in group_by if group not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Agrupación no válida: {', '.join(map(str, unknown))} "
+                             f"(use {', '.join(GROUP_COLUMNS)})")
+        departamento_id = data.get('departamento_id')
+        departamento_id = None if departamento_id is None else int(departamento_id)
+        cargo_id = data.get('cargo_id')
+        cargo_id = None if cargo_id is None else int(cargo_id)
+
+        if data.get('fecha') is not None:
+            # Consulta puntual: plantilla al final de ese día
+            periods = None
+            day = as_date(data['fecha'])
+        else:
+            if data.get('fecha_inicio') is None or data.get('fecha_fin') is None:
+                raise ValueError('Indique fecha, o fecha_inicio y fecha_fin')
+            start, end = as_date(data['fecha_inicio']), as_date(data['fecha_fin'])
+            if end < start:
+                raise ValueError('La fecha_fin es anterior a la fecha_inicio')
+            interval = data.get('interval', 'month')
+            if interval not in INTERVALS:
+                raise ValueError(f"interval debe ser uno de: {', '.join(INTERVALS)}")
+            periods = _periods(start, end, interval)
+
+        with self._lock:
+            self.queries += 1
+            timeline = self._timeline
+            groups = timeline.select(group_by, departamento_id, cargo_id)
+            totals = timeline.select([], departamento_id, cargo_id).get((), [])
+            if periods is None:
+                rows = [(key, {'headcount': sum(s.headcount(timeline.day(day)) for s in series)})
+                        for key, series in groups.items()]
+                totals = {'headcount': sum(s.headcount(timeline.day(day)) for s in totals)}
+            else:
+                bounds = [timeline.day(periods[0][0]) - 1] + [timeline.day(end) for _, end in periods]
+                rows = [(key, {'series': self._series(series, bounds, periods)})
+                        for key, series in groups.items()]
+                totals = self._series(totals, bounds, periods)
+
+        if periods is None:
+            rows = [(key, row) for key, row in rows if row['headcount']]
+        else:
+            rows = [(key, row) for key, row in rows
+                    if any(point['headcount'] or point['exits'] for point in row['series'])]
+        response = {
+            'status': 'success',
+            'data': self._label(sorted(rows, key=lambda item: item[0]), group_by),
+            'totals': totals,
+            'group_by': group_by
+        }
+        if periods is None:
+            response['fecha'] = day.isoformat()
+        else:
+            response.update(fecha_inicio=periods[0][0].isoformat(),
+                            fecha_fin=periods[-1][1].isoformat(), interval=interval)
+        return response
+
+    @staticmethod
+    def _series(series, bounds, periods):
+        # Un prefijo por límite de periodo y árbol: las altas y bajas de cada
+        # periodo son la diferencia entre los prefijos de sus extremos
+        hires = [sum(s.hires.prefix(bound) for s in series) for bound in bounds]
+        exits = [sum(s.exits.prefix(bound) for s in series) for bound in bounds]
+        points = []
+        for index, (start, end) in enumerate(periods):
+            opening = hires[index] - exits[index]
+            headcount = hires[index + 1] - exits[index + 1]
+            left = exits[index + 1] - exits[index]
+            average = (opening + headcount) / 2
+            points.append({
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'opening_headcount': opening,
+                'headcount': headcount,
+                'hires': hires[index + 1] - hires[index],
+                'exits': left,
+                # Bajas del periodo sobre la plantilla media
+                'turnover': round(left / average, 4) if average else None
+            })
+        return points
+
+    def _label(self, rows, group_by):
+        catalog = self.handler.catalog
+        snapshot = catalog.snapshot if catalog and catalog.ready else None
+        labeled = []
+        for key, row in rows:
+            label = {}
+            for group, value in zip(group_by, key):
+                column, table, name_column = GROUP_COLUMNS[group]
+                label[column] = None if value == NO_GROUP else value
+                entry = snapshot.get(table, value) if snapshot else None
+                label[group] = entry[name_column] if entry else None
+            labeled.append(dict(label, **row))
+        return labeled
+
+    def stats(self):
+        with self._lock:
+            timeline = self._timeline
+            return {
+                'employees': len(timeline.employees),
+                'groups': len(timeline.groups),
+                'days': timeline.size,
+                'since': date.fromordinal(timeline.origin).isoformat(),
+                'reloads': self.reloads,
+                'updates': self.updates,
+                'queries': self.queries,
+                'refresh_interval': self.refresh_interval
+            }
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
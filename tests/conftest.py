@@ -0,0 +1,91 @@
+import configparser
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'server'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'client'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'common'))
+
+# Funciones opcionales de DatabaseHandler: cada prueba activa solo las que usa
+FEATURES = ('cache', 'catalog', 'attendance', 'search', 'leave', 'payroll', 'workforce',
+            'subscriptions')
+
+
+@pytest.fixture
+def write_config(tmp_path):
+    # Escribe una configuración sobre un SQLite temporal. Los refrescos
+    # periódicos quedan desactivados para que las pruebas sean deterministas.
+    written = []
+
+    def write(*features, pool_size=2, pool_timeout=3, **sections):
+        config = configparser.ConfigParser()
+        config['database'] = {'backend': 'sqlite'}
+        config['sqlite'] = {'path': str(tmp_path / 'rh.db')}
+        config['pool'] = {'min_size': '1', 'max_size': str(pool_size), 'timeout': str(pool_timeout)}
+        for feature in FEATURES:
+            config[feature] = {'enabled': str(feature in features).lower(), 'refresh_interval': '0'}
+        for section, values in sections.items():
+            if not config.has_section(section):
+                config[section] = {}
+            config[section].update({key: str(value) for key, value in values.items()})
+        path = tmp_path / f'rh{len(written)}.ini'
+        with open(path, 'w') as config_file:
+            config.write(config_file)
+        written.append(path)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def make_handler(write_config):
+    from database_handler import DatabaseHandler
+    handlers = []
+
+    def make(*features, pool_size=2, pool_timeout=3, **sections):
+        handler = DatabaseHandler(write_config(*features, pool_size=pool_size,
+                                               pool_timeout=pool_timeout, **sections))
+        handlers.append(handler)
+        return handler
+
+    yield make
+    for handler in handlers:
+        handler.close()
+
+
+@pytest.fixture
+def make_server(write_config):
+    # Arranca un Server en un hilo sobre un puerto libre; server.port es el
+    # puerto y server.thread el hilo que termina tras el cierre ordenado
+    from server import Server
+    servers = []
+
+    def make(*features, pool_size=4, sections=None, **options):
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind(('localhost', 0))
+        listen_socket.listen(16)
+        config_path = write_config(*features, pool_size=pool_size, **(sections or {}))
+        server = Server('localhost', listen_socket.getsockname()[1], config_path=config_path,
+                        listen_socket=listen_socket, **options)
+        thread = server.thread = threading.Thread(target=server.start, name='test-server',
+                                                  daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        return server
+
+    yield make
+    for server, thread in servers:
+        server.stop()
+        thread.join(10)
+
+
+def employee(number, **fields):
+    return dict({'primer_nombre': 'Ana', 'primer_apellido': 'Ruiz', 'email': f'e{number}@rh.com',
+                 'celular': f'600{number:06d}', 'fecha_contratacion': '2024-01-01',
+                 'departamento_id': 1, 'cargo_id': 1}, **fields)
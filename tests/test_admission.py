@@ -0,0 +1,97 @@
+import socket
+import time
+
+from admission import AdmissionControl
+from conftest import employee
+from client import Cliente
+
+
+def connect(server):
+    client = Cliente('localhost', server.port)
+    client.connect()
+    return client
+
+
+def slow_selects(server, delay):
+    select = server.db_handler.select_employee
+
+    def slow_select(*args, **kwargs):
+        time.sleep(delay)
+        return select(*args, **kwargs)
+
+    server.db_handler.select_employee = slow_select
+
+
+def test_admission_limits():
+    admission = AdmissionControl(max_in_flight=2)
+    assert admission.admit(('10.0.0.1', 1)) is None
+    assert admission.admit(('10.0.0.2', 1)) is None
+    busy = admission.admit(('10.0.0.3', 1))
+    assert busy['status'] == 'busy' and busy['reason'] == 'overloaded' and busy['retry_after'] > 0
+    admission.release()
+    assert admission.admit(('10.0.0.3', 1)) is None
+    assert admission.admit(('10.0.0.4', 1), stopping=True)['reason'] == 'stopping'
+
+    # Por IP: dos conexiones del mismo cliente comparten el bucket
+    limited = AdmissionControl(rate=10, burst=2)
+    assert limited.admit(('10.0.0.1', 1)) is None
+    assert limited.admit(('10.0.0.1', 2)) is None
+    busy = limited.admit(('10.0.0.1', 3))
+    assert busy['reason'] == 'rate_limited' and 0 < busy['retry_after'] <= 0.1
+    assert limited.admit(('10.0.0.2', 1)) is None
+
+    queued = AdmissionControl(queue_timeout=0.05)
+    assert queued.expired(time.perf_counter()) is None
+    assert queued.expired(time.perf_counter() - 1)['reason'] == 'queue_timeout'
+
+
+def test_server_sheds_requests_above_its_limit(make_server):
+    server = make_server(pool_size=4, max_in_flight=1)
+    ids = [server.db_handler.insert_employee(employee(number))['id'] for number in range(3)]
+    client = connect(server)
+    slow_selects(server, 0.3)
+
+    responses = [future.result(timeout=5)
+                 for future in [client.submit('SELECT', {'id': employee_id}) for employee_id in ids]]
+    statuses = sorted(response['status'] for response in responses)
+    assert statuses == ['busy', 'busy', 'success']
+    assert all(response['retry_after'] > 0 for response in responses if response['status'] == 'busy')
+    # Sin carga se vuelve a atender (el hueco se libera tras enviar la respuesta)
+    deadline = time.monotonic() + 2
+    while server.admission.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.submit('PING', {}).result(timeout=5)['status'] == 'success'
+    assert server.admission.stats()['rejected']['overloaded'] == 2
+    client.close()
+
+
+def test_idle_connections_are_closed(make_server):
+    server = make_server(idle_timeout=0.2)
+    idle = socket.create_connection(('localhost', server.port))
+    idle.settimeout(5)
+    # El servidor corta la conexión: recv devuelve fin de datos
+    assert idle.recv(1) == b''
+    idle.close()
+    # El contador se actualiza justo después de cortar la conexión
+    deadline = time.monotonic() + 2
+    while server.admission.stats()['idle_closed'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.admission.stats()['idle_closed'] == 1
+
+
+def test_drain_waits_for_in_flight_requests(make_server):
+    server = make_server()
+    busy, idle = connect(server), connect(server)
+    employee_id = busy.send_request('INSERT', employee(1))['id']
+    slow_selects(server, 0.5)
+
+    future = busy.submit('SELECT', {'id': employee_id})
+    time.sleep(0.1)
+    server.stop()
+    assert future.result(timeout=5)['status'] == 'success'
+    server.thread.join(5)
+    assert not server.thread.is_alive()
+    assert server.metrics.active_connections == 0
+    # La conexión inactiva también se cerró: su hilo lector vio el fin de datos
+    idle.reader_thread.join(5)
+    assert idle.socket is None
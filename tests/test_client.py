@@ -0,0 +1,58 @@
+import threading
+import time
+
+from conftest import employee
+from client import Cliente
+
+
+def connect(server, **options):
+    client = Cliente('localhost', server.port, **options)
+    client.connect()
+    return client
+
+
+def test_closing_a_stalled_subscription_keeps_the_connection(make_server):
+    server = make_server('subscriptions')
+    subscriber, writer = connect(server), connect(server)
+    employee_id = writer.send_request('INSERT', employee(1))['id']
+
+    events = subscriber.subscribe()
+    threading.Timer(0.3, writer.send_request,
+                    ('UPDATE', {'id': employee_id, 'primer_nombre': 'Eva'})).start()
+    assert next(events)['id'] == employee_id
+    # El consumidor deja de leer mientras llegan más bloques de eventos que
+    # los que caben en la cola del stream
+    for number in range(40):
+        writer.send_request('UPDATE', {'id': employee_id, 'primer_nombre': f'Eva{number}'})
+    time.sleep(0.5)
+    events.close()
+
+    assert subscriber.submit('PING', {}).result(timeout=5)['status'] == 'success'
+    subscriber.close()
+    writer.close()
+
+
+def test_slow_stream_does_not_block_other_requests(make_server):
+    server = make_server()
+    client = connect(server)
+    for number in range(40):
+        assert client.send_request('INSERT', employee(number))['status'] == 'success'
+
+    # Bloques de una fila: muchos más de los que el consumidor ha leído
+    rows = client.stream_select({}, chunk_size=1)
+    next(rows)
+    time.sleep(0.5)
+    started = time.monotonic()
+    assert client.submit('PING', {}).result(timeout=5)['status'] == 'success'
+    assert time.monotonic() - started < 1
+    assert len(list(rows)) == 39
+    client.close()
+
+
+def test_cancelled_future_does_not_stop_the_reader(make_server):
+    server = make_server()
+    client = connect(server)
+    cancelled = client.submit('PING', {})
+    cancelled.cancel()
+    assert client.submit('PING', {}).result(timeout=5)['status'] == 'success'
+    client.close()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from coalesce import SingleFlight, coalesce_key
+from conftest import employee
+
+
+def start(target, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(target(*args)))
+    thread.start()
+    return thread, results
+
+
+def test_coalesce_key_ignores_streams_writes_and_bad_requests():
+    key = coalesce_key({'operation': 'SELECT', 'data': {'id': 1, 'estado': 1}})
+    assert key == coalesce_key({'operation': 'SELECT', 'data': {'estado': 1, 'id': 1}})
+    assert coalesce_key({'operation': 'SELECT', 'data': {}, 'stream': True}) is None
+    assert coalesce_key({'operation': 'UPDATE', 'data': {'id': 1}}) is None
+    assert coalesce_key(['SELECT']) is None
+
+
+def test_identical_requests_in_flight_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(1)
+        release.wait(5)
+        return 'filas'
+
+    workers = [start(flight.do, 'SELECT{}', query) for _ in range(8)]
+    time.sleep(0.2)
+    release.set()
+    for thread, _ in workers:
+        thread.join()
+
+    assert len(calls) == 1
+    outcomes = [results[0] for _, results in workers]
+    assert all(result == 'filas' for result, _ in outcomes)
+    assert sum(leader for _, leader in outcomes) == 1
+
+
+def test_followers_receive_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def query():
+        release.wait(5)
+        raise RuntimeError('fallo')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('SELECT{}', query)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+
+
+def test_request_after_a_write_is_not_served_stale(make_handler):
+    handler = make_handler()
+    flight = SingleFlight()
+    handler.add_commit_listener(flight.invalidate)
+    employee_id = handler.insert_employee(employee(1, primer_nombre='Ana'))['id']
+    request = {'operation': 'SELECT', 'data': {'id': employee_id}}
+    key = coalesce_key(request)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_select():
+        # El líder lee antes de la escritura y tarda en terminar
+        response = handler.select_employee(request['data'])
+        started.set()
+        release.wait(5)
+        return response
+
+    leader, leader_results = start(flight.do, key, slow_select)
+    assert started.wait(5)
+    assert handler.update_employee({'id': employee_id, 'primer_nombre': 'Eva'})['status'] == 'success'
+    follower, follower_results = start(flight.do, key,
+                                       lambda: handler.select_employee(request['data']))
+    follower.join(5)
+    release.set()
+    leader.join()
+
+    assert leader_results[0][0]['data'][0]['primer_nombre'] == 'Ana'
+    response, ran_query = follower_results[0]
+    assert ran_query and response['data'][0]['primer_nombre'] == 'Eva'
+
+
+def test_server_coalesces_identical_selects(make_server):
+    from client import Cliente
+    # Tantos workers como peticiones: todas llegan mientras la primera sigue en curso
+    server = make_server(pool_size=6)
+    client = Cliente('localhost', server.port)
+    client.connect()
+    employee_id = client.send_request('INSERT', employee(1))['id']
+
+    # La consulta tarda lo bastante para que las demás lleguen mientras tanto
+    select = server.db_handler.select_employee
+    calls = []
+
+    def slow_select(data, *args, **kwargs):
+        calls.append(1)
+        time.sleep(0.3)
+        return select(data, *args, **kwargs)
+
+    server.db_handler.select_employee = slow_select
+    futures = [client.submit('SELECT', {'id': employee_id}) for _ in range(6)]
+    responses = [future.result(timeout=5) for future in futures]
+    assert all(response['data'][0]['id'] == employee_id for response in responses)
+    assert len(calls) == 1
+    client.close()
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from conftest import employee
+
+
+def run_together(calls):
+    # Lanza las llamadas a la vez y devuelve sus resultados (o excepciones) en orden
+    results = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def run(index, call):
+        barrier.wait()
+        try:
+            results[index] = call()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=item) for item in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def handler(make_handler):
+    return make_handler(pool_size=4, group_commit={'enabled': 'true', 'window_ms': 100,
+                                                   'max_batch': 64})
+
+
+def emails(handler):
+    with handler._cursor() as cursor:
+        cursor.execute("SELECT id, email FROM empleados")
+        return {row['id']: row['email'] for row in cursor.fetchall()}
+
+
+def test_each_writer_gets_its_own_result(handler):
+    calls = [lambda number=number: handler.insert_employee(employee(number)) for number in range(10)]
+    responses = run_together(calls)
+
+    assert all(response['status'] == 'success' for response in responses)
+    stored = emails(handler)
+    for number, response in enumerate(responses):
+        assert stored[response['id']] == f'e{number}@rh.com'
+    stats = handler.group_commit.stats()
+    assert stats['requests'] == 10 and stats['batches'] < 10
+
+
+def test_failing_member_does_not_affect_the_batch(handler):
+    handler.insert_employee(employee(0))
+    calls = [lambda number=number: handler.insert_employee(employee(number)) for number in range(1, 6)]
+    # Email repetido: falla la restricción UNIQUE dentro del grupo
+    calls.insert(2, lambda: handler.insert_employee(employee(99, email='e0@rh.com')))
+    responses = run_together(calls)
+
+    assert responses[2]['status'] == 'error'
+    assert [response['status'] for index, response in enumerate(responses) if index != 2] == \
+        ['success'] * 5
+    assert sorted(emails(handler).values()) == sorted(f'e{number}@rh.com' for number in range(6))
+    # Se resolvió con el SAVEPOINT, sin repetir el grupo una a una
+    stats = handler.group_commit.stats()
+    assert stats['fallbacks'] == 0 and stats['batches'] < stats['requests']
+
+
+def test_exception_reaches_only_its_caller(handler):
+    def broken(cursor, data):
+        cursor.execute("INSERT INTO departamentos (nombre) VALUES (%s)", ('Fantasma',))
+        raise ValueError('escritura rota')
+
+    calls = [lambda number=number: handler.insert_employee(employee(number)) for number in range(4)]
+    calls.append(lambda: handler.group_commit.submit(broken, {}))
+    responses = run_together(calls)
+
+    assert isinstance(responses[-1], ValueError)
+    assert all(response['status'] == 'success' for response in responses[:-1])
+    with handler._cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS total FROM departamentos WHERE nombre = 'Fantasma'")
+        assert cursor.fetchone()['total'] == 0
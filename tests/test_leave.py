@@ -0,0 +1,120 @@
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+from conftest import employee
+from leave import IntervalTree, LeaveTrees, parse_range
+
+
+def brute_force(intervals, start, end):
+    return sorted(key for key, (first, last) in intervals.items() if first <= end and last >= start)
+
+
+def test_interval_tree_matches_brute_force():
+    rng = random.Random(7)
+    tree = IntervalTree()
+    intervals = {}
+    for key in range(500):
+        first = rng.randint(0, 1000)
+        intervals[key] = (first, first + rng.randint(0, 50))
+        tree.insert(*intervals[key], key, key)
+    for key in rng.sample(sorted(intervals), 200):
+        assert tree.remove(intervals.pop(key)[0], key)
+    assert len(tree) == 300
+
+    for _ in range(200):
+        start = rng.randint(-10, 1060)
+        end = start + rng.randint(0, 80)
+        assert sorted(tree.overlapping(start, end)) == brute_force(intervals, start, end)
+
+
+def test_interval_tree_build_equals_inserts():
+    items = sorted((start, start + length, key, key)
+                   for key, (start, length) in enumerate([(5, 0), (1, 3), (5, 10), (9, 1), (0, 0)]))
+    built = IntervalTree.build(items)
+    inserted = IntervalTree()
+    for item in items:
+        inserted.insert(*item)
+    for start, end in ((0, 0), (3, 5), (6, 8), (10, 10), (16, 20)):
+        assert sorted(built.overlapping(start, end)) == sorted(inserted.overlapping(start, end))
+
+
+def test_interval_tree_bounds_are_inclusive_and_remove_missing():
+    tree = IntervalTree()
+    tree.insert(10, 20, 1, 'a')
+    assert tree.overlapping(20, 30) == ['a']
+    assert tree.overlapping(0, 10) == ['a']
+    assert tree.overlapping(21, 30) == []
+    assert not tree.remove(10, 2)
+    assert tree.remove(10, 1)
+    assert len(tree) == 0 and tree.overlapping(0, 100) == []
+
+
+def leave(leave_id, empleado_id, departamento_id, first, last):
+    return {'id': leave_id, 'empleado_id': empleado_id, 'departamento_id': departamento_id,
+            'tipo_permiso_id': 1, 'fecha_inicio': datetime(2026, 1, first),
+            'fecha_fin': datetime(2026, 1, last)}
+
+
+def test_leave_trees_filters_and_moves():
+    trees = LeaveTrees.build([leave(1, 10, 1, 1, 5), leave(2, 11, 1, 3, 8), leave(3, 12, 2, 4, 4)])
+    start, end = datetime(2026, 1, 4), datetime(2026, 1, 4)
+    assert {found['id'] for found in trees.overlapping(start, end)} == {1, 2, 3}
+    assert {found['id'] for found in trees.overlapping(start, end, departamento_id=1)} == {1, 2}
+    assert [found['id'] for found in trees.overlapping(start, end, empleado_id=12)] == [3]
+
+    trees.move_employee(11, 2)
+    assert {found['id'] for found in trees.overlapping(start, end, departamento_id=2)} == {2, 3}
+    assert [found['id'] for found in trees.overlapping(start, end, departamento_id=1)] == [1]
+
+    trees.remove(3)
+    assert 12 not in trees.by_employee
+    assert [found['id'] for found in trees.overlapping(start, end, departamento_id=2)] == [2]
+
+
+def test_parse_range_includes_whole_last_day():
+    start, end = parse_range({'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-01-01'})
+    assert start == datetime(2026, 1, 1)
+    assert end == datetime(2026, 1, 1, 23, 59, 59)
+
+
+def test_request_before_horizon_uses_transaction_cursor(make_handler):
+    # Con una sola conexión en el pool la consulta a la base no puede pedir otra
+    handler = make_handler('leave', pool_size=1, pool_timeout=1, leave={'history_days': 30})
+    employee_id = handler.insert_employee(employee(1))['id']
+    day = (date.today() - timedelta(days=200)).isoformat()
+    request = {'empleado_id': employee_id, 'tipo_permiso_id': 1, 'fecha_inicio': day, 'fecha_fin': day}
+
+    assert handler.request_leave(request)['status'] == 'success'
+    response = handler.request_leave(request)
+    assert response['status'] == 'error' and response['conflicts']
+
+
+def test_max_department_out_under_concurrency(make_handler):
+    handler = make_handler('leave', pool_size=8)
+    ids = [handler.insert_employee(employee(number))['id'] for number in range(12)]
+    day = (date.today() + timedelta(days=10)).isoformat()
+    statuses = []
+
+    def request(employee_id):
+        statuses.append(handler.request_leave({
+            'empleado_id': employee_id, 'tipo_permiso_id': 1, 'fecha_inicio': day,
+            'fecha_fin': day, 'max_department_out': 3})['status'])
+
+    threads = [threading.Thread(target=request, args=(employee_id,)) for employee_id in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses.count('success') == 3
+
+
+def test_invalid_max_department_out_is_rejected(make_handler):
+    handler = make_handler('leave')
+    employee_id = handler.insert_employee(employee(1))['id']
+    day = (date.today() + timedelta(days=10)).isoformat()
+    response = handler.request_leave({'empleado_id': employee_id, 'tipo_permiso_id': 1,
+                                      'fecha_inicio': day, 'fecha_fin': day,
+                                      'max_department_out': 'tres'})
+    assert response['status'] == 'error'
+    assert handler.leaves.overlapping(datetime.fromisoformat(day), datetime.fromisoformat(day)) == []
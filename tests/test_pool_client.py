@@ -0,0 +1,15 @@
+import pytest
+
+from conftest import employee
+from pool_client import PoolClient, ServerError
+
+
+def test_gather_returns_error_responses_without_raising(make_server):
+    server = make_server()
+    with PoolClient('localhost', server.port, size=2) as client:
+        client.insert(employee(1))
+        calls = [('INSERT', employee(2)), ('INSERT', employee(3, email='e1@rh.com'))]
+        first, second = client.gather(calls, raise_errors=False)
+        assert first['status'] == 'success' and second['status'] == 'error'
+        with pytest.raises(ServerError):
+            client.gather([('INSERT', employee(4, email='e1@rh.com'))])
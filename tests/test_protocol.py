@@ -0,0 +1,122 @@
+import json
+import socket
+import struct
+from datetime import date, datetime, time
+from decimal import Decimal
+
+import pytest
+
+from protocol import (CODECS, FRAME_CHUNK, FRAME_MESSAGE, HEADER, JSON_CODEC, MAGIC,
+                      MAX_FRAME_SIZE, MODE_FRAMED, MODE_LEGACY, ProtocolError, SocketReader,
+                      encode_message)
+
+ROWS = [
+    {'id': 1, 'nombre': 'Ángela', 'fecha': date(2026, 1, 31), 'alta': datetime(2026, 1, 31, 8, 30),
+     'hora': time(17, 45, 10), 'salario': Decimal('1234.50'), 'activo': True, 'nota': None},
+    {'id': 2, 'nombre': 'Luis', 'fecha': date(2025, 12, 1), 'alta': datetime(2025, 12, 1, 9, 0),
+     'hora': time(8, 0), 'salario': Decimal('0.01'), 'activo': False, 'nota': 'x'}
+]
+
+
+class ChunkedSocket:
+    # Entrega los datos en los trozos indicados, como los haría llegar TCP
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+def reader_for(data, chunk=None):
+    chunks = [data] if chunk is None else [data[i:i + chunk] for i in range(0, len(data), chunk)]
+    return SocketReader(ChunkedSocket(chunks))
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_rows_round_trip_with_types(codec):
+    codec = CODECS[codec]
+    message = {'status': 'success', 'data': [dict(row) for row in ROWS]}
+    assert codec.decode(codec.encode(message)) == {'status': 'success', 'data': ROWS}
+
+
+def test_json_codec_sends_type_descriptor_only_for_non_json_columns():
+    encoded = json.loads(JSON_CODEC.encode({'data': [dict(row) for row in ROWS]}))
+    assert encoded['types'] == {'fecha': 'date', 'alta': 'datetime', 'hora': 'time',
+                                'salario': 'decimal'}
+
+
+def test_binary_codec_handles_big_integers_and_mixed_lists():
+    codec = CODECS['binary']
+    value = {'big': 1 << 80, 'items': [1, 'a', None, 2.5, [{'a': 1}, {'b': 2}]], 'raw': b'\x00\x01'}
+    assert codec.decode(codec.encode(value)) == value
+
+
+@pytest.mark.parametrize('payload', [
+    b'd' + struct.pack('!I', 0),                     # fecha con ordinal 0
+    b'I' + struct.pack('!I', 3) + b'abc',            # entero no numérico
+    b'D' + struct.pack('!I', 3) + b'abc',            # decimal no numérico
+    b'z' + struct.pack('!q', 1 << 62),               # fecha fuera de rango
+    b'm\x00\x00\x00\x01l\x00\x00\x00\x00N',         # clave no hashable
+    b'l\x00\x00\x00\x01' * 5000 + b'N',              # anidamiento excesivo
+], ids=['ordinal', 'int', 'decimal', 'datetime', 'unhashable', 'nesting'])
+def test_malformed_binary_payload_raises_protocol_error(payload):
+    with pytest.raises(ProtocolError):
+        CODECS['binary'].decode(payload)
+
+
+def test_frame_read_byte_by_byte():
+    frame = encode_message({'operation': 'PING'}, FRAME_MESSAGE, 7)
+    reader = reader_for(frame, chunk=1)
+    frame_type, stream_id, payload = reader.read_frame()
+    assert (frame_type, stream_id, JSON_CODEC.decode(payload)) == (FRAME_MESSAGE, 7, {'operation': 'PING'})
+    assert reader.read_frame() is None
+
+
+def test_merged_frames_are_split():
+    data = b''.join(encode_message({'n': number}, FRAME_CHUNK, number) for number in range(1, 4))
+    reader = reader_for(data + encode_message({}, FRAME_MESSAGE, 9)[:5], chunk=13)
+    for number in range(1, 4):
+        frame_type, stream_id, payload = reader.read_frame()
+        assert (frame_type, stream_id, JSON_CODEC.decode(payload)) == (FRAME_CHUNK, number, {'n': number})
+    # El último frame se corta a mitad de la cabecera
+    with pytest.raises(ProtocolError):
+        reader.read_frame()
+
+
+def test_oversized_and_truncated_frames_are_rejected():
+    with pytest.raises(ProtocolError):
+        reader_for(HEADER.pack(FRAME_MESSAGE, 1, MAX_FRAME_SIZE + 1)).read_frame()
+    with pytest.raises(ProtocolError):
+        reader_for(encode_message({'operation': 'PING'})[:-2]).read_frame()
+
+
+def test_detect_mode_with_split_magic_and_legacy_json():
+    reader = reader_for(MAGIC + encode_message({'version': 1}), chunk=2)
+    assert reader.detect_mode() == MODE_FRAMED
+    assert JSON_CODEC.decode(reader.read_frame()[2]) == {'version': 1}
+
+    legacy = b'{"operation": "PING", "data": {"texto": "a}\\"b"}}{"operation": "STATS"}'
+    reader = reader_for(legacy, chunk=5)
+    assert reader.detect_mode() == MODE_LEGACY
+    assert reader.read_json() == {'operation': 'PING', 'data': {'texto': 'a}"b'}}
+    assert reader.read_json() == {'operation': 'STATS'}
+    assert reader.read_json() is None
+
+
+@pytest.mark.parametrize('framed,encoding', [(True, 'json'), (True, 'binary'), (False, 'json')])
+def test_handshake_and_legacy_fallback_against_server(make_server, framed, encoding):
+    from client import Cliente
+    server = make_server()
+    client = Cliente('localhost', server.port, framed=framed, encoding=encoding)
+    client.connect()
+    response = client.send_request('SELECT', {'id': 1})
+    assert response['status'] == 'success'
+    client.close()
+
+
+def test_legacy_client_sending_raw_json(make_server):
+    server = make_server()
+    with socket.create_connection(('localhost', server.port)) as sock:
+        sock.sendall(b'{"operation": "PING", "data": {}}')
+        response = SocketReader(sock).read_json()
+    assert response['status'] == 'success'
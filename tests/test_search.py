@@ -0,0 +1,88 @@
+from conftest import employee
+from search import MAX_CANDIDATES, SearchIndex, query_terms
+
+
+def make_row(employee_id, nombre, apellido, departamento_id=1, **fields):
+    row = {'id': employee_id, 'primer_nombre': nombre, 'segundo_nombre': None,
+           'primer_apellido': apellido, 'segundo_apellido': None,
+           'email': f'empleado{employee_id}@rh.com', 'celular': f'600{employee_id:06d}',
+           'departamento_id': departamento_id, 'cargo_id': 1}
+    row.update(fields)
+    return row
+
+
+def make_index(rows):
+    index = SearchIndex(None, refresh_interval=0)
+    for row in rows:
+        index._add(row)
+    return index
+
+
+def ids(results):
+    return [result['id'] for result in results]
+
+
+def test_query_terms_normalizes_and_keeps_emails():
+    assert query_terms('Ángela  Muñoz-2') == ['angela', 'munoz', '2']
+    assert query_terms('Ana.Ruiz@RH.com') == ['ana.ruiz@rh.com']
+
+
+def test_exact_word_ranks_above_prefix_and_weaker_field():
+    index = make_index([
+        make_row(1, 'Juanita', 'Ruiz'),
+        make_row(2, 'Juan', 'Ruiz'),
+        make_row(3, 'Pedro', 'Ruiz', email='juan@rh.com')
+    ])
+    assert ids(index.search('juan')) == [2, 1, 3]
+
+
+def test_every_term_must_match():
+    index = make_index([make_row(1, 'Juan', 'Perez'), make_row(2, 'Juan', 'Gomez')])
+    assert ids(index.search('juan gom')) == [2]
+    assert index.search('juan lopez') == []
+
+
+def test_accents_and_typos():
+    index = make_index([make_row(1, 'Ángela', 'González'), make_row(2, 'Pedro', 'Ruiz')])
+    assert ids(index.search('angela')) == [1]
+    assert ids(index.search('gonzalez')) == [1]
+    assert ids(index.search('gonzales')) == [1]
+
+
+def test_department_filter_applies_before_truncating():
+    rows = [make_row(number, 'Juan', 'Perez', departamento_id=1) for number in range(1, 291)]
+    rows += [make_row(number, 'Juan', 'Perez', departamento_id=2) for number in range(291, 301)]
+    index = make_index(rows)
+    assert len(rows) > MAX_CANDIDATES
+    assert sorted(ids(index.search('juan', 10, departamento_id=2))) == list(range(291, 301))
+    assert sorted(ids(index.search('juan perez', 10, departamento_id=2))) == list(range(291, 301))
+    assert index.search('juan', 10, departamento_id=3) == []
+
+
+def test_best_matches_survive_candidate_limit():
+    # La intersección supera MAX_CANDIDATES: las coincidencias exactas no
+    # pueden perderse al recortar
+    rows = [make_row(number, 'Juanito', 'Perez') for number in range(1, 201)]
+    rows += [make_row(number, 'Juan', 'Perez') for number in range(201, 204)]
+    index = make_index(rows)
+    assert sorted(ids(index.search('juan perez', 3))) == [201, 202, 203]
+    assert sorted(ids(index.search('juan', 3))) == [201, 202, 203]
+
+
+def test_removed_employee_is_not_found():
+    index = make_index([make_row(1, 'Juan', 'Perez'), make_row(2, 'Juana', 'Perez')])
+    index._remove(1)
+    assert ids(index.search('juan')) == [2]
+    index._remove(2)
+    assert index.search('juan') == [] and index._words == []
+
+
+def test_handler_search_sees_own_writes(make_handler):
+    handler = make_handler('search')
+    first = handler.insert_employee(employee(1, primer_nombre='Lucía'))['id']
+    second = handler.insert_employee(employee(2, primer_nombre='Luis'))['id']
+    response = handler.search_employees({'query': 'luc'})
+    assert response['status'] == 'success' and ids(response['data']) == [first]
+
+    handler.update_employee({'id': second, 'primer_nombre': 'Lucas'})
+    assert sorted(ids(handler.search_employees({'query': 'luc'})['data'])) == [first, second]
@@ -0,0 +1,16 @@
+import pytest
+
+from supervisor import Supervisor
+
+
+def test_processes_reject_an_in_memory_database(write_config):
+    config_path = write_config(sqlite={'path': ':memory:'})
+    with pytest.raises(ValueError):
+        Supervisor(2, ('localhost', 0), {'config_path': config_path})
+    # Con un solo proceso no hay bases separadas
+    Supervisor(1, ('localhost', 0), {'config_path': config_path})
+
+
+def test_processes_accept_a_database_file(write_config):
+    supervisor = Supervisor(2, ('localhost', 0), {'config_path': write_config()})
+    assert supervisor.processes == 2
@@ -0,0 +1,104 @@
+import random
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import employee
+from workforce import FenwickTree, WorkforceIndex, WorkforceTimeline, _periods
+
+TODAY = date(2026, 6, 15)
+
+
+def ordinal(year, month, day):
+    return date(year, month, day).toordinal()
+
+
+def make_index(employees):
+    # Índice sin base de datos ni catálogo: las etiquetas quedan a None
+    index = WorkforceIndex(SimpleNamespace(catalog=None), refresh_interval=0)
+    index._timeline = WorkforceTimeline.build(employees, TODAY)
+    return index
+
+
+def test_fenwick_prefix_matches_running_sum():
+    rng = random.Random(3)
+    counts = [rng.randint(0, 5) for _ in range(300)]
+    built = FenwickTree.from_counts(counts)
+    added = FenwickTree(len(counts))
+    for position, value in enumerate(counts):
+        added.add(position, value)
+    for position in range(len(counts)):
+        assert built.prefix(position) == added.prefix(position) == sum(counts[:position + 1])
+    assert built.prefix(-1) == 0
+    assert built.prefix(len(counts) + 10) == sum(counts)
+
+
+def test_periods_split_on_calendar_boundaries():
+    assert _periods(date(2026, 1, 15), date(2026, 3, 10), 'month') == [
+        (date(2026, 1, 15), date(2026, 1, 31)),
+        (date(2026, 2, 1), date(2026, 2, 28)),
+        (date(2026, 3, 1), date(2026, 3, 10))]
+    # 2026-01-01 es jueves: la primera semana termina el domingo 4
+    assert _periods(date(2026, 1, 1), date(2026, 1, 12), 'week')[:2] == [
+        (date(2026, 1, 1), date(2026, 1, 4)), (date(2026, 1, 5), date(2026, 1, 11))]
+    assert _periods(date(2026, 11, 20), date(2027, 2, 1), 'quarter') == [
+        (date(2026, 11, 20), date(2026, 12, 31)), (date(2027, 1, 1), date(2027, 2, 1))]
+    with pytest.raises(ValueError):
+        _periods(date(2020, 1, 1), date(2026, 1, 1), 'day')
+
+
+def test_headcount_counts_hire_day_but_not_exit_day():
+    index = make_index({1: (1, 1, ordinal(2026, 1, 31), ordinal(2026, 2, 28))})
+    headcount = [index.timeseries({'fecha': day})['totals']['headcount']
+                 for day in ('2026-01-30', '2026-01-31', '2026-02-27', '2026-02-28')]
+    assert headcount == [0, 1, 1, 0]
+
+
+def test_series_at_month_boundaries():
+    index = make_index({
+        1: (1, 1, ordinal(2026, 1, 31), ordinal(2026, 2, 28)),
+        2: (1, 2, ordinal(2026, 2, 1), None),
+        3: (2, 3, ordinal(2025, 12, 31), ordinal(2026, 3, 1))
+    })
+    response = index.timeseries({'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-03-31',
+                                 'interval': 'month'})
+    points = [(point['opening_headcount'], point['hires'], point['exits'], point['headcount'])
+              for point in response['totals']]
+    assert points == [(1, 1, 0, 2), (2, 1, 1, 2), (2, 0, 1, 1)]
+
+    by_department = index.timeseries({'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-03-31',
+                                      'interval': 'month', 'group_by': ['departamento']})
+    series = {row['departamento_id']: [point['headcount'] for point in row['series']]
+              for row in by_department['data']}
+    assert series == {1: [1, 1, 1], 2: [1, 1, 0]}
+
+
+def test_changes_move_counts_and_grow_the_range():
+    timeline = WorkforceTimeline.build({1: (1, 1, ordinal(2026, 1, 1), None)}, TODAY)
+    timeline.update_employee(1, {'departamento_id': 2}, TODAY.toordinal())
+    day = timeline.day(date(2026, 3, 1))
+    assert [s.headcount(day) for s in timeline.select(['departamento'])[(2,)]] == [1]
+    assert sum(s.headcount(day) for s in timeline.select(['departamento']).get((1,), [])) == 0
+
+    # Una fecha de contratación muy antigua queda fuera del rango y lo amplía
+    timeline.set_employee(2, 1, 1, ordinal(1990, 5, 1), None)
+    assert timeline.origin <= ordinal(1990, 5, 1)
+    day = timeline.day(date(2026, 3, 1))
+    assert sum(s.headcount(day) for s in timeline.select([])[()]) == 2
+
+    timeline.retire_employee(1, ordinal(2026, 4, 1))
+    assert sum(s.headcount(timeline.day(date(2026, 4, 1))) for s in timeline.select([])[()]) == 1
+
+
+def test_handler_applies_own_hires_and_exits(make_handler):
+    handler = make_handler('workforce')
+    first = handler.insert_employee(employee(1, fecha_contratacion='2025-03-01'))['id']
+    handler.insert_employee(employee(2, fecha_contratacion='2025-06-01'))
+    query = {'fecha': date.today().isoformat()}
+    assert handler.workforce_timeseries(query)['totals']['headcount'] == 2
+
+    handler.delete_employee({'id': first, 'motivo': 'Baja voluntaria'})
+    assert handler.workforce_timeseries(query)['totals']['headcount'] == 1
+    response = handler.workforce_timeseries({'fecha': '2025-05-01'})
+    assert response['totals']['headcount'] == 1